@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+"""agenda.py
+
+Udacity conference server-side Python App Engine personal agenda; orders
+sessions in time and finds the overlapping ones with a sort-and-sweep.
+Compare the sweep with checking every pair on generated sessions with:
+
+    python agenda.py [SESSIONS]
+
+"""
+
+import datetime
+import heapq
+import random
+import sys
+import time
+
+MEMCACHE_AGENDA_KEY = "AGENDA:%s"
+# seconds an agenda is cached; wishlist and registration changes drop it
+# at once, session changes in attended conferences only when it expires
+AGENDA_TTL = 10 * 60
+
+
+def interval(session):
+    """Return the (start, end) datetimes of a session, or None if it has
+    no date. Sessions without a start time start at midnight; durations are
+    in minutes."""
+    if not session.date:
+        return None
+    hour, minute = 0, 0
+    if session.startTime:
+        hour = session.startTime.hour or 0
+        minute = session.startTime.minute or 0
+    start = datetime.datetime.combine(session.date, datetime.time(hour, minute))
+    return start, start + datetime.timedelta(minutes=session.duration or 0)
+
+
+def findConflicts(intervals):
+    """Return (a, b) id pairs of the overlapping intervals, each pair once.
+
+    intervals is a list of (start, end, id). The intervals are swept in
+    start order while a heap holds the ones still running, so each interval
+    is only compared with those it actually overlaps: O(n log n + k) for k
+    conflicts, rather than comparing every pair.
+    """
+    conflicts = []
+    running = []
+    for start, end, ident in sorted(intervals):
+        while running and running[0][0] <= start:
+            heapq.heappop(running)
+        for _, other in running:
+            conflicts.append((other, ident))
+        heapq.heappush(running, (end, ident))
+    return conflicts
+
+
+# - - - Benchmark - - - - - - - - - - - - - - - - - - - - - -
+
+def _pairwise(intervals):
+    """findConflicts by comparing every pair; the baseline of benchmark()."""
+    conflicts = []
+    intervals = sorted(intervals)
+    for i, (start, end, ident) in enumerate(intervals):
+        for other_start, other_end, other in intervals[i + 1:]:
+            if other_start < end and start < other_end:
+                conflicts.append((ident, other))
+    return conflicts
+
+
+def benchmark(sizes=(100, 1000, 2000, 5000), days=30, seed=0):
+    """Time findConflicts and _pairwise on sessions of 30 to 180 minutes
+    spread over `days` days of 8am to 6pm starts. Returns
+    [(sessions, conflicts, sweep seconds, pairwise seconds)]."""
+    rng = random.Random(seed)
+    first = datetime.datetime(2026, 1, 1)
+    results = []
+    for size in sizes:
+        intervals = []
+        for ident in xrange(size):
+            start = first + datetime.timedelta(
+                days=rng.randrange(days), hours=rng.randrange(8, 18),
+                minutes=rng.randrange(0, 60, 15))
+            end = start + datetime.timedelta(minutes=rng.randrange(30, 181, 30))
+            intervals.append((start, end, ident))
+        started = time.time()
+        conflicts = findConflicts(intervals)
+        sweep = time.time() - started
+        started = time.time()
+        expected = _pairwise(intervals)
+        pairwise = time.time() - started
+        assert (set(frozenset(c) for c in conflicts) ==
+                set(frozenset(c) for c in expected))
+        results.append((size, len(conflicts), sweep, pairwise))
+    return results
+
+
+def main(argv):
+    sizes = (int(argv[1]),) if len(argv) > 1 else (100, 1000, 2000, 5000)
+    print '%8s %10s %10s %10s' % ('sessions', 'conflicts', 'sweep', 'pairwise')
+    for size, conflicts, sweep, pairwise in benchmark(sizes):
+        print '%8d %10d %9.3fs %9.3fs' % (size, conflicts, sweep, pairwise)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -1,4 +1,8 @@
 def webapp_add_wsgi_middleware(app):
     from google.appengine.ext.appstats import recording
+    import capture
+    import sideeffects
+    app = sideeffects.middleware(app)
+    app = capture.middleware(app)
     app = recording.appstats_wsgi_middleware(app)
     return app
\ No newline at end of file
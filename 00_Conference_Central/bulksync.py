@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+
+"""bulksync.py
+
+Udacity conference server-side Python App Engine bulk sync for machine
+clients; serves the conferences or sessions changed within a time window
+as gzip-compressed, protocol buffer encoded SyncBatchForm batches, paged
+with query cursors.
+
+A client syncs a kind by fetching batches, passing back cursor, since and
+until, while more is set. The until of the last batch is the since of its
+next sync. Without since, everything up to until is synced.
+
+Run it locally with the App Engine SDK on the path to compare payload size
+and encode time with the JSON encoding of the Endpoints API:
+
+    python bulksync.py
+
+"""
+
+import datetime
+import gzip
+import StringIO
+import sys
+import time
+
+from google.appengine.datastore.datastore_query import Cursor
+from google.appengine.ext import ndb
+from protorpc import protobuf
+from protorpc import protojson
+
+from conference import ConferenceApi
+from models import Conference
+from models import ConferenceForm
+from models import ConferenceForms
+from models import Session
+from models import SessionForm
+from models import SessionForms
+from models import SyncBatchForm
+from settings import SYNC_TOKENS
+
+KINDS = {
+    'conferences': Conference,
+    'sessions': Session,
+}
+
+BATCH_SIZE = 500
+MAX_BATCH_SIZE = 1000
+
+# windows end this many seconds in the past, so writes still committing or
+# not yet visible to the lastModified query fall into the next window.
+SETTLE_SECONDS = 60
+
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+# App Engine replaces a Content-Encoding header set by the application, so
+# the gzip stream itself is the response body.
+CONTENT_TYPE = 'application/x-gzip'
+
+
+def authorized(header):
+    """Return True if an Authorization header carries one of the bearer
+    tokens configured in settings.SYNC_TOKENS."""
+    if not header or not header.startswith('Bearer '):
+        return False
+    token = header[len('Bearer '):].strip()
+    return any(_equal(token, known) for known in SYNC_TOKENS)
+
+
+def _equal(a, b):
+    # compares in constant time, so tokens cannot be guessed by timing
+    if len(a) != len(b):
+        return False
+    diff = 0
+    for x, y in zip(a, b):
+        diff |= ord(x) ^ ord(y)
+    return diff == 0
+
+
+def _parseTime(value):
+    if not value:
+        return None
+    try:
+        return datetime.datetime.strptime(value, TIME_FORMAT)
+    except ValueError:
+        raise ValueError('Times must be formatted as %s' % TIME_FORMAT)
+
+
+def fetchBatch(kind, since=None, until=None, cursor=None,
+               batch_size=BATCH_SIZE):
+    """Return the SyncBatchForm of the next batch of entities of kind
+    ('conferences' or 'sessions') modified after since and up to until."""
+    if kind not in KINDS:
+        raise ValueError('Unknown kind: %s' % kind)
+    model = KINDS[kind]
+    batch_size = max(1, min(batch_size, MAX_BATCH_SIZE))
+    since_time = _parseTime(since)
+    until_time = _parseTime(until) or (
+        datetime.datetime.utcnow() -
+        datetime.timedelta(seconds=SETTLE_SECONDS))
+
+    q = model.query(model.lastModified <= until_time)
+    if since_time:
+        q = q.filter(model.lastModified > since_time)
+    q = q.order(model.lastModified)
+    entities, next_cursor, more = q.fetch_page(
+        batch_size, start_cursor=Cursor(urlsafe=cursor) if cursor else None)
+
+    batch = SyncBatchForm(
+        more=bool(more and next_cursor),
+        since=since_time.strftime(TIME_FORMAT) if since_time else None,
+        until=until_time.strftime(TIME_FORMAT))
+    if batch.more:
+        batch.cursor = next_cursor.urlsafe()
+
+    api = ConferenceApi()
+    if model is Conference:
+        details = ndb.get_multi([conf.detailKey() for conf in entities])
+        batch.conferences = [
+            api._copyConferenceToForm(conf, detail or False)
+            for conf, detail in zip(entities, details)]
+    else:
+        batch.sessions = [api._copySessionToForm(sess) for sess in entities]
+    return batch
+
+
+def encode(message):
+    """Return the message protocol buffer encoded and gzip-compressed."""
+    out = StringIO.StringIO()
+    f = gzip.GzipFile(fileobj=out, mode='wb')
+    f.write(protobuf.encode_message(message))
+    f.close()
+    return out.getvalue()
+
+
+# - - - Benchmark - - - - - - - - - - - - - - - - - - - - - -
+
+def _gzip(data):
+    out = StringIO.StringIO()
+    f = gzip.GzipFile(fileobj=out, mode='wb')
+    f.write(data)
+    f.close()
+    return out.getvalue()
+
+
+def benchmark(count=1000, repeat=3):
+    """Return (encoding, bytes, seconds) of count sample conferences and
+    sessions for the JSON Endpoints encoding and the bulk sync encoding."""
+    conferences = [ConferenceForm(
+        name='Conference %d' % i, description='About conference %d. ' % i * 8,
+        organizerUserId='organizer%d@example.com' % (i % 50),
+        topics=['Programming Languages', 'Web Technologies'],
+        city='London', startDate='2016-06-01', month=6,
+        endDate='2016-06-03', maxAttendees=500, seatsAvailable=120,
+        websafeKey='ag1zfndpbmR5LW94aWRlchgLEgpDb25mZXJlbmNlGICAgIDv%06d' % i)
+        for i in xrange(count)]
+    sessions = [SessionForm(
+        name='Session %d' % i, date='2016-06-01', startTime='09:30:00',
+        highlights=['intro', 'python'], speaker='Ada Lovelace', duration=60,
+        typeOfSession=['Talk'],
+        websafeSessionKey='ag1zfndpbmR5LW94aWRlcjULEgdTZXNzaW9uGICA%06d' % i)
+        for i in xrange(count)]
+
+    encodings = [
+        ('json', lambda: protojson.encode_message(
+            ConferenceForms(items=conferences)) +
+            protojson.encode_message(SessionForms(items=sessions))),
+        ('json+gzip', lambda: _gzip(protojson.encode_message(
+            ConferenceForms(items=conferences)) +
+            protojson.encode_message(SessionForms(items=sessions)))),
+        ('protobuf+gzip', lambda: encode(SyncBatchForm(
+            conferences=conferences)) + encode(SyncBatchForm(
+                sessions=sessions))),
+    ]
+    results = []
+    for name, fn in encodings:
+        best = None
+        for _ in xrange(repeat):
+            started = time.time()
+            data = fn()
+            elapsed = time.time() - started
+            best = elapsed if best is None else min(best, elapsed)
+        results.append((name, len(data), best))
+    return results
+
+
+def main(argv):
+    count = int(argv[1]) if len(argv) > 1 else 1000
+    print '%-14s %10s %10s' % ('encoding', 'bytes', 'encode')
+    for name, size, secs in benchmark(count):
+        print '%-14s %10d %8.1fms' % (name, size, secs * 1000)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+
+"""capture.py
+
+Udacity conference server-side Python App Engine traffic capture; records
+a sample of requests as sanitized envelopes (path, payload shape, user
+bucket, timing) in compressed CaptureChunk batches, for replay.py to
+drive against a development server.
+
+Payloads keep their field names, numbers, booleans, enum values, dates and
+times. Other strings are reduced to their length, and websafe keys to
+their kind and a bucket, so requests for the same entity stay requests for
+the same entity. Users are reduced to a bucket the same way.
+
+Capture is off unless settings.CAPTURE_RATE is above 0.
+
+"""
+
+import json
+import logging
+import os
+import random
+import re
+import StringIO
+import threading
+import time
+import zlib
+
+from google.appengine.ext import ndb
+
+from models import CaptureChunk
+from settings import CAPTURE_RATE
+
+# envelopes per CaptureChunk; a partial chunk is written after FLUSH_SECONDS
+FLUSH_SIZE = 200
+FLUSH_SECONDS = 60
+
+USER_BUCKETS = 1000
+KEY_BUCKETS = 1000
+
+# bodies larger than this are recorded without their shape
+MAX_BODY = 64 * 1024
+
+# strings kept as they are: enum values, dates and times
+_KEPT = re.compile(
+    r'^([A-Z][A-Z_]{0,30}|\d{4}-\d{2}-\d{2}|\d{2}:\d{2}(:\d{2})?)$')
+
+# development server only: requests carrying this header are made as the
+# given user, and are not captured.
+REPLAY_USER_HEADER = 'HTTP_X_REPLAY_USER'
+
+_lock = threading.Lock()
+_buffer = []
+_oldest = [None]
+
+
+def _bucket(value, buckets):
+    return (zlib.crc32(value.encode('utf-8') if isinstance(value, unicode)
+                       else value) & 0xffffffff) % buckets
+
+
+def _keyShape(value):
+    try:
+        kind = ndb.Key(urlsafe=value).kind()
+    except Exception:
+        kind = '?'
+    return '$key:%s:%d' % (kind, _bucket(value, KEY_BUCKETS))
+
+
+def shape(value, field=''):
+    """Return value with its personal data replaced by placeholders."""
+    if isinstance(value, dict):
+        return dict((k, shape(v, k)) for k, v in value.iteritems())
+    if isinstance(value, list):
+        return [shape(v, field) for v in value]
+    if isinstance(value, basestring):
+        if field.startswith('websafe') and value:
+            return _keyShape(value)
+        if _KEPT.match(value):
+            return value
+        return '$str:%d' % len(value)
+    return value
+
+
+def _userBucket(environ):
+    user = os.environ.get('ENDPOINTS_AUTH_EMAIL') or \
+        environ.get('HTTP_AUTHORIZATION')
+    if not user:
+        return None
+    return _bucket(user, USER_BUCKETS)
+
+
+def _readBody(environ):
+    """Return the request body, leaving it in place for the app."""
+    try:
+        length = int(environ.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        length = 0
+    body = environ['wsgi.input'].read(length) if length else ''
+    environ['wsgi.input'] = StringIO.StringIO(body)
+    return body
+
+
+def _bodyShape(environ, body):
+    if not body or len(body) > MAX_BODY or \
+            not environ.get('CONTENT_TYPE', '').startswith('application/json'):
+        return None
+    try:
+        return shape(json.loads(body))
+    except ValueError:
+        return None
+
+
+def record(envelope):
+    """Buffer an envelope, writing the buffer when it is full or old."""
+    now = time.time()
+    with _lock:
+        _buffer.append(json.dumps(envelope, separators=(',', ':')))
+        if _oldest[0] is None:
+            _oldest[0] = now
+        if len(_buffer) < FLUSH_SIZE and now - _oldest[0] < FLUSH_SECONDS:
+            return
+        lines = list(_buffer)
+        del _buffer[:]
+        _oldest[0] = None
+    try:
+        CaptureChunk(data='\n'.join(lines)).put()
+    except Exception:
+        logging.exception('writing %d captured requests failed', len(lines))
+
+
+def download(write):
+    """Write all captured envelopes, oldest first, one JSON object per
+    line."""
+    for chunk in CaptureChunk.query().order(CaptureChunk.created):
+        write(chunk.data + '\n')
+
+
+def _development():
+    return os.environ.get('SERVER_SOFTWARE', '').startswith('Development')
+
+
+def middleware(app):
+    """Wrap a WSGI app so the settings.CAPTURE_RATE fraction of its
+    requests is recorded."""
+    def capturing_app(environ, start_response):
+        replay_user = environ.get(REPLAY_USER_HEADER)
+        if replay_user and _development():
+            os.environ['ENDPOINTS_AUTH_EMAIL'] = replay_user
+            os.environ['ENDPOINTS_AUTH_DOMAIN'] = os.environ.get(
+                'AUTH_DOMAIN', 'gmail.com')
+            return app(environ, start_response)
+        if CAPTURE_RATE <= 0 or random.random() >= CAPTURE_RATE:
+            return app(environ, start_response)
+
+        body = _readBody(environ)
+        status = ['500']
+
+        def capturing_start_response(status_line, headers, exc_info=None):
+            status[0] = status_line.split(' ', 1)[0]
+            return start_response(status_line, headers, exc_info)
+
+        started = time.time()
+        try:
+            return app(environ, capturing_start_response)
+        finally:
+            record({
+                't': round(started, 3),
+                'p': environ.get('PATH_INFO', ''),
+                'm': environ.get('REQUEST_METHOD', ''),
+                'b': _bodyShape(environ, body),
+                'u': _userBucket(environ),
+                'ms': int((time.time() - started) * 1000),
+                's': int(status[0]),
+            })
+    return capturing_app
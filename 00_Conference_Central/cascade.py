@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+"""cascade.py
+
+Udacity conference server-side Python App Engine cascading deletes; walks
+the descendants of a deleted entity in keys-only batches through chained
+tasks and removes the references profiles hold to them.
+
+"""
+
+import logging
+
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+
+from agenda import MEMCACHE_AGENDA_KEY
+from models import Profile
+from models import Registration
+from models import SessionRecommendations
+from models import WishlistEntry
+import multiquery
+import popularity
+import sideeffects
+
+CASCADE_TASK_URL = '/tasks/cascade_delete'
+BATCH_SIZE = 500
+
+# keys looked up concurrently when finding the profiles referencing them.
+IN_CHUNK = 30
+
+
+def start(root_key):
+    """Delete root_key and everything beneath it in the background."""
+    sideeffects.enqueue(CASCADE_TASK_URL, params={'key': root_key.urlsafe()})
+
+
+@ndb.transactional
+def _dropReferences(prof_key, keys, keyset):
+    """Remove keys from one of a profile's key sets ('wishlist' or
+    'registrations')."""
+    prof = prof_key.get()
+    if not prof:
+        return
+    members = getattr(prof, keyset)()
+    removed = [key for key in keys if members.remove(key)]
+    if removed:
+        members.put()
+        memcache.delete(MEMCACHE_AGENDA_KEY % prof_key.id())
+
+
+def _unreference(keys, prop, child_model, child_ref, keyset):
+    """Drop keys from every profile holding them inline in `prop` or in an
+    overflow `child_model` entity."""
+    for i in xrange(0, len(keys), IN_CHUNK):
+        chunk = keys[i:i + IN_CHUNK]
+        holders = {}
+        for prof_key in multiquery.mergeKeys(
+                multiquery.splitIn(Profile.query(), prop, chunk)):
+            holders[prof_key] = chunk
+        for entry_key in multiquery.mergeKeys(multiquery.splitIn(
+                child_model.query(), getattr(child_model, child_ref), chunk)):
+            holders[entry_key.parent()] = chunk
+        for prof_key, held in holders.iteritems():
+            _dropReferences(prof_key, held, keyset)
+
+
+def removeReferences(keys):
+    """Remove deleted conference and session keys from all profiles, and
+    drop the data derived from the sessions."""
+    sessions = [key for key in keys if key.kind() == 'Session']
+    conferences = [key for key in keys if key.kind() == 'Conference']
+    if sessions:
+        _unreference(sessions, Profile.wishList,
+                     WishlistEntry, 'session', 'wishlist')
+        ndb.delete_multi([ndb.Key(SessionRecommendations, key.urlsafe())
+                          for key in sessions])
+        popularity.forget(sessions)
+    if conferences:
+        _unreference(conferences, Profile.conferenceKeysToAttend,
+                     Registration, 'conference', 'registrations')
+        for conf_key in conferences:
+            popularity.forget([], conf_key)
+
+
+def run(wsk):
+    """Delete the next batch of descendants of the root, root included,
+    and chain the next task while any remain."""
+    root = ndb.Key(urlsafe=wsk)
+    keys, _, more = ndb.Query(ancestor=root).fetch_page(
+        BATCH_SIZE, keys_only=True)
+    if keys:
+        removeReferences(keys)
+        ndb.delete_multi(keys)
+        logging.info('cascade %s: deleted %d entities', wsk, len(keys))
+    # deleted keys drop out of the strongly consistent ancestor query, so
+    # every task starts again from the beginning
+    if more:
+        start(root)
+    else:
+        # the root may have been deleted before the cascade started
+        removeReferences([root])
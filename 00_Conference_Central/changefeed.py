@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+"""changefeed.py
+
+Udacity conference server-side Python App Engine change feed; numbers the
+changes of seat availability, the announcement and featured speakers with
+a memcache version counter, so polling clients only read the counter until
+something they have not seen changes.
+
+"""
+
+import time
+
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+
+SEATS = 'seats'
+ANNOUNCEMENT = 'announcement'
+FEATURED_SPEAKER = 'featuredSpeaker'
+
+MEMCACHE_VERSION_KEY = 'CHANGEFEED:VERSION'
+MEMCACHE_CHANGE_KEY = 'CHANGEFEED:%d'
+
+# changes kept; clients further behind are told to reload everything.
+MAX_CHANGES = 500
+CHANGE_TTL = 600
+
+# newest versions whose change may still be being written by its publisher
+IN_FLIGHT = 10
+
+# seconds a poll waits for a change, and between reads of the counter
+MAX_WAIT = 10
+POLL_INTERVAL = 0.5
+
+
+def publish(kind, ident, value):
+    """Record that `ident` (a conference key, or '' for the announcement)
+    now has `value`, once the current transaction, if any, commits."""
+    def record():
+        version = memcache.incr(MEMCACHE_VERSION_KEY, initial_value=0)
+        if version is not None:
+            memcache.set(MEMCACHE_CHANGE_KEY % version, (kind, ident, value),
+                         time=CHANGE_TTL)
+    ndb.get_context().call_on_commit(record)
+
+
+def version():
+    """Return the current version."""
+    return memcache.get(MEMCACHE_VERSION_KEY) or 0
+
+
+def _read(since, current):
+    if current == since:
+        return current, [], False
+    if current < since or current - since > MAX_CHANGES:
+        # the counter was evicted and restarted, or the client is too old
+        return current, [], True
+
+    versions = range(since + 1, current + 1)
+    found = memcache.get_multi([MEMCACHE_CHANGE_KEY % v for v in versions])
+    changes = []
+    for v in versions:
+        change = found.get(MEMCACHE_CHANGE_KEY % v)
+        if change is None:
+            if current - v < IN_FLIGHT:
+                # not written yet; the next poll picks it up
+                return v - 1, changes, False
+            return current, [], True
+        changes.append(change)
+    return current, changes, False
+
+
+def changesSince(since, wait=MAX_WAIT):
+    """Return (version, [(kind, ident, value)], reset) of the changes after
+    version `since`, oldest first, waiting up to `wait` seconds for one.
+    reset is True when changes were lost and the client must reload."""
+    deadline = time.time() + min(wait, MAX_WAIT)
+    current = version()
+    while current == since and time.time() < deadline:
+        time.sleep(POLL_INTERVAL)
+        current = version()
+    return _read(since, current)
@@ -14,12 +14,14 @@ __author__ = 'wesc+api@google.com (Wesley Chun)'
 
 
 from datetime import datetime
+from datetime import timedelta
 import time
 
 import logging
 import endpoints
 from protorpc import messages
 from protorpc import message_types
+from protorpc import protojson
 from protorpc import remote
 
 from google.appengine.ext import ndb
@@ -39,10 +41,14 @@ from models import Session
 from models import CreateSessionForm
 from models import SessionForm
 from models import SessionForms
+from models import AgendaForm
+from models import AgendaConflictForm
 from models import SessionsOfConferenceByType
 from models import QuerySessionsByDurationForm
 from models import StartTime
 from models import FeaturedSpeakerForm
+from models import FeaturedSpeakerForms
+from models import WebsafeKeysForm
 from models import SpeakerForm
 from models import HighlightsForm
 from models import Speaker
@@ -51,14 +57,40 @@ from models import SpeakerForms
 from models import NewSpeakerForm
 
 from utils import getUserId
+import agenda
+import cascade
+import changefeed
+import dashboard
+import datesearch
+import fanout
+from agenda import MEMCACHE_AGENDA_KEY
+import multiquery
+import popularity
+import ratelimit
+import recommend
+import sideeffects
+import swrcache
 
 from models import Conference
 from models import ConferenceForm
+from models import ConferenceDetailForm
+from models import ConferenceDetail
+from models import ConferencePageForm
+from models import DateRangeQueryForm
+from models import isoWeeks
 
+from settings import ADMIN_EMAILS
 from settings import WEB_CLIENT_ID
 
 from models import BooleanMessage
 from models import ConflictException
+from models import RegistrationTicket
+from models import RegistrationStatus
+from models import RegistrationStatusForm
+from models import ChangeFeedForm
+from models import ConferenceChangeForm
+from models import ConferenceStatsForm
+from models import ConferenceStatsForms
 
 
 CONF_GET_REQUEST = endpoints.ResourceContainer(
@@ -76,10 +108,21 @@ SPEAKER_GET_REQUEST = endpoints.ResourceContainer(
     websafeSpeakerKey=messages.StringField(1),
 )
 
+CHANGES_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    since=messages.IntegerField(1),
+)
+
 EMAIL_SCOPE = endpoints.EMAIL_SCOPE
 API_EXPLORER_CLIENT_ID = endpoints.API_EXPLORER_CLIENT_ID
 MEMCACHE_ANNOUNCEMENTS_KEY = "RECENT_ANNOUNCEMENTS"
 MEMCACHE_FEATURED_SPEAKER_KEY = "FEATURED_SPEAKER"
+ANNOUNCEMENT_SOFT_TTL = 60 * 60
+FEATURED_SPEAKER_SOFT_TTL = 60 * 60
+REGISTRATION_QUEUE = 'registrations'
+ALLOCATION_BATCH_SIZE = 500
+ALLOCATION_LEASE_SECONDS = 60
+MAX_BATCH_KEYS = 100
 
 DEFAULTS = {
     "city": "Default City",
@@ -111,6 +154,11 @@ FIELDS =    {
             'MAX_ATTENDEES': 'maxAttendees',
             }
 
+DATE_SEARCH_DEFAULT_WEEKS = 4
+DATE_SEARCH_MAX_WEEKS = 53
+DATE_SEARCH_PAGE_SIZE = 20
+DATE_SEARCH_MAX_PAGE_SIZE = 100
+
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
 @endpoints.api( name='conference',
@@ -132,6 +180,9 @@ class ConferenceApi(remote.Service):
                 if field.name == 'teeShirtSize':
                     setattr(pf, field.name,
                         getattr(TeeShirtSize, getattr(prof, field.name)))
+                elif field.name == 'wishList':
+                    setattr(pf, field.name,
+                        [key.urlsafe() for key in prof.wishlist().keys()])
                 else:
                     setattr(pf, field.name, getattr(prof, field.name))
         pf.check_initialized()
@@ -166,6 +217,8 @@ class ConferenceApi(remote.Service):
             # TODO 2
             # save the profile to datastore
             profile.put()
+        elif profile.upgradeLegacyKeys():
+            profile.put()
 
         return profile      # return Profile
 
@@ -177,6 +230,7 @@ class ConferenceApi(remote.Service):
 
         # if saveProfile(), process user-modifyable fields
         if save_request:
+            display_name = prof.displayName
             for field in ('displayName', 'teeShirtSize'):
                 if hasattr(save_request, field):
                     val = getattr(save_request, field)
@@ -185,6 +239,9 @@ class ConferenceApi(remote.Service):
             # TODO 4
             # put the modified profile to datastore
             prof.put()
+            # conferences keep a copy of their organizer's display name
+            if prof.displayName != display_name:
+                fanout.start(prof.key)
 
         # return ProfileForm
         return self._copyProfileToForm(prof)
@@ -192,8 +249,10 @@ class ConferenceApi(remote.Service):
 
 # - - - Conference objects - - - - - - - - - - - - - - - - -
 
-    def _copyConferenceToForm(self, conf, displayName):
-        """Copy relevant fields from Conference to ConferenceForm."""
+    def _copyConferenceToForm(self, conf, detail=None):
+        """Copy relevant fields from Conference to ConferenceForm. Topics
+        and description are only copied for the detail view, i.e. when the
+        ConferenceDetail (or False if it is missing) is given."""
 
         # If no input provided return none.
         if not conf:
@@ -201,6 +260,8 @@ class ConferenceApi(remote.Service):
 
         cf = ConferenceForm()
         for field in cf.all_fields():
+            if field.name == 'topics' and detail is None:
+                continue
             if hasattr(conf, field.name):
                 # convert Date to date string; just copy others
                 if field.name.endswith('Date'):
@@ -209,8 +270,9 @@ class ConferenceApi(remote.Service):
                     setattr(cf, field.name, getattr(conf, field.name))
             elif field.name == "websafeKey":
                 setattr(cf, field.name, conf.key.urlsafe())
-        if displayName:
-            setattr(cf, 'organizerDisplayName', displayName)
+        if detail is not None:
+            cf.description = (detail.description if detail
+                              else conf.legacyDescription)
         cf.check_initialized()
         return cf
 
@@ -232,7 +294,7 @@ class ConferenceApi(remote.Service):
         data = {field.name: getattr(request, field.name)
             for field in request.all_fields()}
         del data['websafeKey']
-        del data['organizerDisplayName']
+        description = data.pop('description')
 
         # add default values for those missing (both data model and outbound
         # Message.
@@ -268,17 +330,30 @@ class ConferenceApi(remote.Service):
         data['key'] = c_key
         data['organizerUserId'] = request.organizerUserId = user_id
 
-        # create Conference and return (modified) ConferenceForm
-        Conference(**data).put()
-        taskqueue.add(params={'email': user.email(),
-            'conferenceInfo': request},
-            url='/tasks/send_confirmation_email')
+        # create Conference and return (modified) ConferenceForm; the
+        # confirmation e-mail is only sent if the conference is stored
+        conf = Conference(**data)
+
+        @ndb.transactional
+        def store():
+            # read in the organizer's entity group, so a concurrent rename
+            # either retries this or fans out to the new conference
+            prof = p_key.get()
+            conf.organizerDisplayName = request.organizerDisplayName = (
+                prof.displayName if prof else user.nickname())
+            ndb.put_multi([conf, ConferenceDetail(key=conf.detailKey(),
+                                                  description=description),
+                           dashboard.initialStats(conf)])
+            sideeffects.enqueue('/tasks/send_confirmation_email',
+                params={'email': user.email(), 'conferenceInfo': request})
+        store()
 
         return request
 
 
     @endpoints.method(ConferenceForm, ConferenceForm, path='conference',
             http_method='POST', name='createConference')
+    @ratelimit.limited('createConference')
     def createConference(self, request):
         """Create new conference."""
         return self._createConferenceObject(request)
@@ -308,10 +383,63 @@ class ConferenceApi(remote.Service):
 
          # return individual ConferenceForm object per Conference
         return ConferenceForms(
-            items=[self._copyConferenceToForm(conf, "") \
+            items=[self._copyConferenceToForm(conf) \
             for conf in conferences])
 
 
+    @endpoints.method(CONF_GET_REQUEST, ConferenceDetailForm,
+            path='conference/{websafeConferenceKey}',
+            http_method='GET', name='getConference')
+    def getConference(self, request):
+        """Return requested conference (by websafeConferenceKey), with the
+        featured speaker and, for signed in users, their registration and
+        wishlist status."""
+        wsck = request.websafeConferenceKey
+        conf_key = ndb.Key(urlsafe=wsck)
+        if conf_key.kind() != 'Conference':
+            raise endpoints.BadRequestException(
+                'websafeKey must point to Conference entity.')
+
+        # issue the conference, its detail, the featured speaker and the
+        # profile reads together
+        conf_future = conf_key.get_async()
+        detail_future = ConferenceDetail.keyFor(conf_key).get_async()
+        featured_future = ndb.get_context().memcache_get(
+            swrcache.key(MEMCACHE_FEATURED_SPEAKER_KEY, wsck))
+        user = endpoints.get_current_user()
+        prof_future = None
+        if user:
+            prof_future = ndb.Key(Profile, getUserId(user)).get_async()
+
+        conf = conf_future.get_result()
+        if not conf:
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s' % wsck)
+
+        detail = ConferenceDetailForm(
+            conference=self._copyConferenceToForm(
+                conf, detail_future.get_result() or False),
+            seatsAvailable=conf.seatsAvailable,
+            registered=False)
+
+        featured = swrcache.resolve(MEMCACHE_FEATURED_SPEAKER_KEY, wsck,
+                                    featured_future.get_result(),
+                                    compute_on_miss=False)
+        if featured:
+            detail.featuredSpeaker = FeaturedSpeakerForm(
+                speaker=featured['speaker'],
+                websafeSessionKeys=featured['websafeSessionKeys'])
+
+        prof = prof_future.get_result() if prof_future else None
+        if prof:
+            prof.upgradeLegacyKeys()
+            detail.registered = conf_key in prof.registrations()
+            detail.wishlistSessionKeys = [
+                key.urlsafe() for key in prof.wishlist().keys()
+                if key.parent() == conf_key]
+        return detail
+
+
     @endpoints.method(message_types.VoidMessage, ConferenceForms,
             path='getConferencesCreated',
             http_method='POST',
@@ -325,11 +453,31 @@ class ConferenceApi(remote.Service):
         user_id =  getUserId(user)
         # create ancestor query for all key matches for this user
         confs = Conference.query(ancestor=ndb.Key(Profile, user_id))
-        prof = ndb.Key(Profile, user_id).get()
         # return set of ConferenceForm objects per Conference
         return ConferenceForms(
-            items=[self._copyConferenceToForm(
-                conf, getattr(prof, 'displayName')) for conf in confs])
+            items=[self._copyConferenceToForm(conf) for conf in confs])
+
+
+    @endpoints.method(message_types.VoidMessage, ConferenceStatsForms,
+            path='dashboard',
+            http_method='GET', name='getOrganizerDashboard')
+    def getOrganizerDashboard(self, request):
+        """Return the registrations, seats, sessions, speakers and wishlist
+        interest of every conference created by the user."""
+        user = endpoints.get_current_user()
+        if not user:
+            raise endpoints.UnauthorizedException('Authorization required')
+        # stats are children of the conferences, which are children of the
+        # organizer's profile
+        stats = dashboard.organizerStats(ndb.Key(Profile, getUserId(user)))
+        return ConferenceStatsForms(items=[ConferenceStatsForm(
+            websafeConferenceKey=s.key.parent().urlsafe(),
+            name=s.name,
+            registrations=s.registrations,
+            seatsAvailable=s.seatsAvailable,
+            sessions=s.sessions,
+            speakers=s.speakers,
+            wishlistInterest=s.wishlistInterest) for s in stats])
 
 
     def _getQuery(self, request):
@@ -385,6 +533,43 @@ class ConferenceApi(remote.Service):
         return (inequality_field, formatted_filters)
 
 
+    @endpoints.method(DateRangeQueryForm, ConferencePageForm,
+            path='conferences/bydate',
+            http_method='POST',
+            name='searchConferencesByDate')
+    def searchConferencesByDate(self, request):
+        """Return conferences running on any day from startDate (default
+        today) to endDate (default four weeks later), a page at a time."""
+        try:
+            start = (datetime.strptime(request.startDate[:10], "%Y-%m-%d")
+                     .date() if request.startDate else datetime.now().date())
+            end = (datetime.strptime(request.endDate[:10], "%Y-%m-%d").date()
+                   if request.endDate else
+                   start + timedelta(weeks=DATE_SEARCH_DEFAULT_WEEKS))
+        except ValueError:
+            raise endpoints.BadRequestException(
+                'Dates must be formatted as YYYY-MM-DD.')
+        if end < start:
+            raise endpoints.BadRequestException(
+                'endDate must not be before startDate.')
+        weeks = isoWeeks(start, end)
+        if len(weeks) > DATE_SEARCH_MAX_WEEKS:
+            raise endpoints.BadRequestException(
+                'The date range may span at most %d weeks.'
+                % DATE_SEARCH_MAX_WEEKS)
+        page_size = min(request.pageSize or DATE_SEARCH_PAGE_SIZE,
+                        DATE_SEARCH_MAX_PAGE_SIZE)
+
+        try:
+            confs, next_token = datesearch.search(start, end, page_size,
+                                                  request.pageToken)
+        except ValueError:
+            raise endpoints.BadRequestException('Invalid pageToken.')
+        return ConferencePageForm(
+            items=[self._copyConferenceToForm(conf) for conf in confs],
+            nextPageToken=next_token)
+
+
     @endpoints.method(message_types.VoidMessage, ConferenceForms,
             path='filterPlayground',
             http_method='POST',
@@ -398,7 +583,7 @@ class ConferenceApi(remote.Service):
         q = q.order(Conference.name)
         q = q.filter(Conference.maxAttendees > 10)
         return ConferenceForms(
-            items=[self._copyConferenceToForm(conf, "")
+            items=[self._copyConferenceToForm(conf)
             for conf in q])
 
 
@@ -411,16 +596,44 @@ class ConferenceApi(remote.Service):
         # step 1: get user profile
         prof = self._getProfileFromUser()
         # step 2: get conferenceKeysToAttend from profile.
-        conf_keys = [ndb.Key(urlsafe=wsck)\
-         for wsck in prof.conferenceKeysToAttend]
-        # to make a ndb key from websafe key you can use:
+        conf_keys = prof.registrations().keys()
         # step 3: fetch conferences from datastore.
         conferences = ndb.get_multi(conf_keys)
 
         # return set of ConferenceForm objects per Conference
-        return ConferenceForms(items=[self._copyConferenceToForm(conf, "")\
+        return ConferenceForms(items=[self._copyConferenceToForm(conf)\
          for conf in conferences])
 
+    @endpoints.method(CONF_GET_REQUEST, BooleanMessage,
+            path='conference/{websafeConferenceKey}/delete',
+            http_method='POST', name='deleteConference')
+    def deleteConference(self, request):
+        """Delete a conference; open only to its organizer. Its sessions
+        and the registrations and wishlists referencing them are removed in
+        the background."""
+        user = endpoints.get_current_user()
+        if not user:
+            raise endpoints.UnauthorizedException('Authorization required')
+        conf_key = ndb.Key(urlsafe=request.websafeConferenceKey)
+        if conf_key.kind() != 'Conference':
+            raise endpoints.BadRequestException(
+                'websafeKey must point to Conference entity.')
+        conf = conf_key.get()
+        if not conf:
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s'
+                % request.websafeConferenceKey)
+        if getUserId(user) != conf.organizerUserId:
+            raise endpoints.ForbiddenException(
+                'Only the organizer may delete the conference.')
+
+        conf_key.delete()
+        swrcache.delete(MEMCACHE_FEATURED_SPEAKER_KEY,
+                        request.websafeConferenceKey)
+        cascade.start(conf_key)
+        return BooleanMessage(data=True)
+
+
 # - - - Sessions - - - - - - - - - - - - - - - - - - - -
 
     @staticmethod
@@ -444,7 +657,8 @@ class ConferenceApi(remote.Service):
 
         # check if the speaker is doing more sessions than any other at the
         # conference.
-        cached_speaker = memcache.get(url_conf_key)
+        cached_speaker = swrcache.peek(MEMCACHE_FEATURED_SPEAKER_KEY,
+                                       url_conf_key)
         if cached_speaker:
             most_sessions = len(cached_speaker['websafeSessionKeys'])
             if session_num <= most_sessions:
@@ -453,7 +667,38 @@ class ConferenceApi(remote.Service):
         # set the speaker as featured if they are doing the most sessions.
         featured_speaker = {'speaker': speaker.key.urlsafe(),
                             'websafeSessionKeys': [session.key.urlsafe() for session in sessions],}
-        memcache.set(url_conf_key, featured_speaker)
+        swrcache.put(MEMCACHE_FEATURED_SPEAKER_KEY, url_conf_key,
+                     featured_speaker)
+        changefeed.publish(changefeed.FEATURED_SPEAKER, url_conf_key,
+                           featured_speaker)
+
+
+    @staticmethod
+    def _computeFeaturedSpeaker(url_conf_key):
+        """Return the featured speaker of a conference, i.e. the speaker
+        giving the most (and at least two) of its sessions, or None."""
+        sessions = Session.query(ancestor=ndb.Key(urlsafe=url_conf_key))
+        by_speaker = {}
+        for session in sessions:
+            if session.speaker:
+                speaker_id = (session.speaker.speaker,
+                              session.speaker.organization)
+                by_speaker.setdefault(speaker_id, []).append(session.key)
+        if not by_speaker:
+            return None
+
+        (name, organization), session_keys = max(
+            by_speaker.iteritems(), key=lambda item: len(item[1]))
+        if len(session_keys) <= 1:
+            return None
+
+        # sessions embed a copy of the speaker; look up the speaker's key.
+        speaker_key = Speaker.query(Speaker.speaker == name,
+            Speaker.organization == organization).get(keys_only=True)
+        if not speaker_key:
+            return None
+        return {'speaker': speaker_key.urlsafe(),
+                'websafeSessionKeys': [k.urlsafe() for k in session_keys]}
 
 
     @endpoints.method(CONF_GET_REQUEST, FeaturedSpeakerForm,
@@ -462,7 +707,8 @@ class ConferenceApi(remote.Service):
     def getFeaturedSpeaker(self, request):
         """Takes the websafeKey of a conference and returns a featured
         speaker form object."""
-        featured_speaker = memcache.get(request.websafeConferenceKey)
+        featured_speaker = swrcache.get(MEMCACHE_FEATURED_SPEAKER_KEY,
+                                        request.websafeConferenceKey)
 
         if not featured_speaker:
             raise endpoints.NotFoundException("""No featured speaker found in
@@ -537,18 +783,25 @@ class ConferenceApi(remote.Service):
         data['speaker'] = speaker_obj
 
         new_session = Session(**data)
-        new_session.put()
+
+        @ndb.transactional
+        def store():
+            new_speaker = not Session.query(
+                Session.speaker == speaker_obj,
+                ancestor=conf_key).get(keys_only=True)
+            new_session.put()
+            dashboard.recordSession(new_session, new_speaker)
+            # Check to see if the added speaker has the most sessions at
+            # the given conference, once the session is stored.
+            sideeffects.enqueue('/tasks/add_featured_speaker',
+                params={'speaker': request.websafeSpeakerKey,
+                        'conf_key': conf_key.urlsafe()})
+        store()
 
         # Update the featured speaker if there is one.
         self._addFeaturedSpeaker(
             request.websafeConferenceKey, request.websafeSpeakerKey)
 
-        # Check to see if the added speaker has the most sessions at the
-        # given conference.
-        taskqueue.add(params={'speaker': request.websafeSpeakerKey,
-                              'conf_key': conf_key.urlsafe()},
-                      url='/tasks/add_featured_speaker')
-
         # return a SessionForm object with the newly created sessions data.
 
         return self._copySessionToForm(new_session)
@@ -556,6 +809,7 @@ class ConferenceApi(remote.Service):
 
     @endpoints.method(CreateSessionForm, SessionForm,
                       path='session', http_method='POST', name='createSession')
+    @ratelimit.limited('createSession')
     def createSession(self, request):
         """Open only to the organizer of the conference."""
         return self._createSessionObject(request)
@@ -600,6 +854,35 @@ class ConferenceApi(remote.Service):
             items=[self._copySessionToForm(session) for session in sessions])
 
 
+    @endpoints.method(SESS_GET_REQUEST, BooleanMessage,
+            path='session/delete',
+            http_method='POST', name='deleteSession')
+    def deleteSession(self, request):
+        """Delete a session; open only to the organizer of its conference.
+        Wishlist references to it are removed in the background."""
+        user = endpoints.get_current_user()
+        if not user:
+            raise endpoints.UnauthorizedException('Authorization required')
+        s_key = ndb.Key(urlsafe=request.websafeSessionKey)
+        if s_key.kind() != 'Session':
+            raise endpoints.BadRequestException(
+                'websafeKey must point to a Session entity.')
+        session, conf = ndb.get_multi([s_key, s_key.parent()])
+        if not session:
+            raise endpoints.NotFoundException('Session not found.')
+        if not conf or getUserId(user) != conf.organizerUserId:
+            raise endpoints.ForbiddenException(
+                'Only the conference organizer may delete its sessions.')
+
+        s_key.delete()
+        # recomputed without the session on its next read
+        swrcache.delete(MEMCACHE_FEATURED_SPEAKER_KEY,
+                        s_key.parent().urlsafe())
+        cascade.start(s_key)
+        dashboard.scheduleReconcile(s_key.parent().urlsafe())
+        return BooleanMessage(data=True)
+
+
     @endpoints.method(SPEAKER_GET_REQUEST, SessionForms,
             path='sessions/byspeaker',
             http_method='GET',
@@ -648,12 +931,14 @@ class ConferenceApi(remote.Service):
             http_method='GET', name='beforeSevenNonWorkshopSession')
     def beforeSevenNonWorkshopSession(self, request):
         """Returns all sessions before 7PM that are not workshops."""
-        q = Session.query()
-        q = q.filter(Session.startTime.hour.IN([h for h in range(19)]))
-        q = q.filter(Session.typeOfSession != 'Workshop')
+        # one keys-only sub-query per hour; the != filter would double
+        # them, so workshops are dropped once the sessions are loaded
+        sessions = multiquery.fetchUnion(multiquery.splitIn(
+            Session.query(), Session.startTime.hour, range(19)))
 
         return SessionForms(
-            items=[self._copySessionToForm(session) for session in q])
+            items=[self._copySessionToForm(session) for session in sessions
+                   if any(t != 'Workshop' for t in session.typeOfSession)])
 
 
     @endpoints.method(HighlightsForm, SessionForms,
@@ -661,11 +946,11 @@ class ConferenceApi(remote.Service):
             http_method='GET', name='getSessionsByHighlights')
     def getSessionsByHighlights(self, request):
         """Returns all sessions with any of the highlights provided"""
-        q = Session.query()
-        q = q.filter(Session.highlights.IN(request.highlights))
+        sessions = multiquery.fetchUnion(multiquery.splitIn(
+            Session.query(), Session.highlights, request.highlights))
 
         return SessionForms(
-            items=[self._copySessionToForm(session) for session in q])
+            items=[self._copySessionToForm(session) for session in sessions])
 
 
     @endpoints.method(QuerySessionsByDurationForm, SessionForms,
@@ -681,11 +966,45 @@ class ConferenceApi(remote.Service):
             items=[self._copySessionToForm(session) for session in q])
 
 
+    @endpoints.method(CONF_GET_REQUEST, SessionForms,
+            path='sessions/trending',
+            http_method='GET', name='getTrendingSessions')
+    def getTrendingSessions(self, request):
+        """Given a conference, return its most wishlisted sessions, most
+        wishlisted first."""
+        conf_key = ndb.Key(urlsafe=request.websafeConferenceKey)
+
+        # verify websafekey points to Conference entity.
+        if conf_key.kind() != 'Conference':
+            raise endpoints.BadRequestException(
+                'websafeKey must point to Conference entity.')
+        session_keys = [key for key, _ in popularity.trending(conf_key)]
+        sessions = ndb.get_multi(session_keys)
+        return SessionForms(
+            items=[self._copySessionToForm(sess) for sess in sessions if sess])
+
+
+    @endpoints.method(SESS_GET_REQUEST, SessionForms,
+            path='sessions/recommended',
+            http_method='GET', name='getSessionRecommendations')
+    def getSessionRecommendations(self, request):
+        """Given a session, return the sessions most often wishlisted along
+        with it, as computed by the nightly recommendations job."""
+        s_key = ndb.Key(urlsafe=request.websafeSessionKey)
+        if s_key.kind() != 'Session':
+            raise endpoints.BadRequestException(
+                'websafeKey must point to a Session entity.')
+        sessions = recommend.recommendations(s_key)
+        return SessionForms(
+            items=[self._copySessionToForm(sess) for sess in sessions])
+
+
 # - - - Speaker - - - - - - - - - - - - - - - - - - - -
 
     @endpoints.method(NewSpeakerForm, SpeakerForm,
             path='speaker/create',
             http_method='POST', name='createSpeaker')
+    @ratelimit.limited('createSpeaker')
     def createSpeaker(self, request):
         """Create a new spaeker form with provided speaker name and
         organization"""
@@ -728,6 +1047,33 @@ class ConferenceApi(remote.Service):
         return speaker_form
 
 
+    @endpoints.method(SPEAKER_GET_REQUEST, BooleanMessage,
+            http_method='POST',
+            path='speaker/delete', name='deleteSpeaker')
+    def deleteSpeaker(self, request):
+        """Delete a speaker that is not speaking at any session; open only
+        to the admins in settings.ADMIN_EMAILS, as speakers are shared by
+        all organizers."""
+        user = endpoints.get_current_user()
+        if not user:
+            raise endpoints.UnauthorizedException('Authorization required')
+        if user.email() not in ADMIN_EMAILS:
+            raise endpoints.ForbiddenException(
+                'Only admins may delete speakers.')
+        speaker_key = ndb.Key(urlsafe=request.websafeSpeakerKey)
+        if speaker_key.kind() != 'Speaker':
+            raise endpoints.BadRequestException(
+                'websafeKey must point to a Speaker entity.')
+        speaker = speaker_key.get()
+        if not speaker:
+            raise endpoints.NotFoundException('Speaker not found.')
+        if Session.query(Session.speaker == speaker).get(keys_only=True):
+            raise ConflictException(
+                'The speaker still has sessions; delete those first.')
+        speaker_key.delete()
+        return BooleanMessage(data=True)
+
+
     @endpoints.method(SPEAKER_GET_REQUEST, SpeakerForm,
             http_method='GET',
             path='speaker/getbywsk', name='getSpeakerByWsk')
@@ -754,11 +1100,77 @@ class ConferenceApi(remote.Service):
 
 
 
+# - - - Batch gets - - - - - - - - - - - - - - - - - - - - -
+
+    def _getBatch(self, request, kind):
+        """Return the entities of the given kind for a WebsafeKeysForm in
+        request order, with one get_multi; missing entities are None."""
+        if len(request.websafeKeys) > MAX_BATCH_KEYS:
+            raise endpoints.BadRequestException(
+                'At most %d websafeKeys may be requested.' % MAX_BATCH_KEYS)
+        keys = [ndb.Key(urlsafe=wsk) for wsk in request.websafeKeys]
+        for key in keys:
+            if key.kind() != kind:
+                raise endpoints.BadRequestException(
+                    'websafeKeys must point to %s entities.' % kind)
+        return ndb.get_multi(keys)
+
+
+    @endpoints.method(WebsafeKeysForm, ConferenceForms,
+            path='batch/conferences',
+            http_method='POST', name='getConferencesBatch')
+    def getConferencesBatch(self, request):
+        """Return the conferences of the given websafe keys."""
+        return ConferenceForms(items=[self._copyConferenceToForm(conf)
+            for conf in self._getBatch(request, 'Conference') if conf])
+
+
+    @endpoints.method(WebsafeKeysForm, SessionForms,
+            path='batch/sessions',
+            http_method='POST', name='getSessionsBatch')
+    def getSessionsBatch(self, request):
+        """Return the sessions of the given websafe keys."""
+        return SessionForms(items=[self._copySessionToForm(sess)
+            for sess in self._getBatch(request, 'Session') if sess])
+
+
+    @endpoints.method(WebsafeKeysForm, SpeakerForms,
+            path='batch/speakers',
+            http_method='POST', name='getSpeakersBatch')
+    def getSpeakersBatch(self, request):
+        """Return the speakers of the given websafe keys."""
+        return SpeakerForms(items=[self._copySpeakerToForm(speaker)
+            for speaker in self._getBatch(request, 'Speaker') if speaker])
+
+
+    @endpoints.method(WebsafeKeysForm, FeaturedSpeakerForms,
+            path='batch/featuredspeakers',
+            http_method='POST', name='getFeaturedSpeakersBatch')
+    def getFeaturedSpeakersBatch(self, request):
+        """Return the featured speakers of the conferences of the given
+        websafe keys, in request order, with one memcache round trip."""
+        if len(request.websafeKeys) > MAX_BATCH_KEYS:
+            raise endpoints.BadRequestException(
+                'At most %d websafeKeys may be requested.' % MAX_BATCH_KEYS)
+        cached = swrcache.get_multi(MEMCACHE_FEATURED_SPEAKER_KEY,
+                                    request.websafeKeys)
+        items = []
+        for wsck in request.websafeKeys:
+            featured = cached.get(wsck)
+            if featured:
+                items.append(FeaturedSpeakerForm(speaker=featured['speaker'],
+                    websafeSessionKeys=featured['websafeSessionKeys']))
+            else:
+                items.append(FeaturedSpeakerForm())
+        return FeaturedSpeakerForms(items=items)
+
+
 # - - - Wishlist - - - - - - - - - - - - - - - - - - - -
 
     @endpoints.method(SESS_GET_REQUEST, ProfileForm,
             http_method='POST',
             path='wisthlist/add', name='addSessionToWishlist')
+    @ratelimit.limited('addSessionToWishlist')
     def addSessionToWishlist(self, request):
         """Adds the session to the user's list of sessions they are
         interested in attending"""
@@ -773,20 +1185,17 @@ class ConferenceApi(remote.Service):
         if not session:
             raise endpoints.NotFoundException('Session not found.')
 
-        user = endpoints.get_current_user()
-
-        if not user:
-            raise endpoints.UnauthorizedException('Authorization required.')
-        user_id = getUserId(user)
-
-        prof = ndb.Key(Profile, user_id).get()
+        prof = self._getProfileFromUser()
 
         # Check is session is already on the wishlist.
-        if request.websafeSessionKey in prof.wishList:
+        wishlist = prof.wishlist()
+        if not wishlist.add(s_key):
             raise ConflictException(
                 'The session is already on your wishlist.')
-        prof.wishList.append(request.websafeSessionKey)
-        prof.put()
+        wishlist.put()
+        popularity.record(s_key, 1)
+        dashboard.recordInterest(s_key.parent(), 1)
+        memcache.delete(MEMCACHE_AGENDA_KEY % prof.key.id())
 
         return self._copyProfileToForm(prof)
 
@@ -802,13 +1211,8 @@ class ConferenceApi(remote.Service):
             raise endpoints.UnauthorizedException(
                 'You must be logged in to use this method.')
 
-        user_id = getUserId(user)
-        prof = ndb.Key(Profile, user_id).get()
-        if not prof:
-            raise endpoints.NotFoundException('Profile not found.')
-        wishlist = prof.wishList
-        wishlist_keys = [ndb.Key(urlsafe=wish) for wish in wishlist]
-        wishlist_sessions = ndb.get_multi(wishlist_keys)
+        prof = self._getProfileFromUser()
+        wishlist_sessions = ndb.get_multi(prof.wishlist().keys())
         return SessionForms(
             items=[self._copySessionToForm(wish) for wish in wishlist_sessions])
 
@@ -816,27 +1220,80 @@ class ConferenceApi(remote.Service):
     @endpoints.method(SESS_GET_REQUEST, ProfileForm,
             path='wishlist/delete',
             http_method='POST', name='deleteSessionInWishlist')
+    @ratelimit.limited('deleteSessionInWishlist')
     def deleteSessionInWishlist(self, request):
         """Removes the session from the user's list of sessions they are
         interested in attending."""
-        user = endpoints.get_current_user()
-        if not user:
-            raise endpoints.UnauthorizedException(
-                'You must be logged in to use this method.')
-
-        user_id = getUserId(user)
+        prof = self._getProfileFromUser()
 
-        prof = ndb.Key(Profile, user_id).get()
         # verify that the session is in the user's wishlist.
-        if request.websafeSessionKey not in prof.wishList:
+        s_key = ndb.Key(urlsafe=request.websafeSessionKey)
+        wishlist = prof.wishlist()
+        if not wishlist.remove(s_key):
             raise endpoints.NotFoundException('Session not on wishlist.')
-
-        prof.wishList.remove(request.websafeSessionKey)
-        prof.put()
+        wishlist.put()
+        popularity.record(s_key, -1)
+        dashboard.recordInterest(s_key.parent(), -1)
+        memcache.delete(MEMCACHE_AGENDA_KEY % prof.key.id())
 
         return self._copyProfileToForm(prof)
 
 
+    @endpoints.method(message_types.VoidMessage, AgendaForm,
+            path='wishlist/agenda',
+            http_method='GET', name='getAgenda')
+    def getAgenda(self, request):
+        """Return the user's wishlisted sessions and the sessions of the
+        conferences the user attends in time order, with the pairs of them
+        that overlap."""
+        prof = self._getProfileFromUser()
+        cache_key = MEMCACHE_AGENDA_KEY % prof.key.id()
+        cached = memcache.get(cache_key)
+        if cached:
+            return protojson.decode_message(AgendaForm, cached)
+
+        # one ancestor query per attended conference, run alongside the
+        # wishlist get
+        registered = prof.registrations().keys()
+        queries = [Session.query(ancestor=key).fetch_async()
+                   for key in registered]
+        wishlist = [sess for sess in ndb.get_multi(prof.wishlist().keys())
+                    if sess]
+        sessions = list(wishlist)
+        seen = set(sess.key for sess in wishlist)
+        for query in queries:
+            for sess in query.get_result():
+                if sess.key not in seen:
+                    seen.add(sess.key)
+                    sessions.append(sess)
+
+        intervals = []
+        for sess in sessions:
+            span = agenda.interval(sess)
+            if span:
+                intervals.append((span[0], span[1], sess.key.urlsafe()))
+
+        # timed sessions in time order, then those without a date
+        order = dict((wssk, i) for i, (_, _, wssk) in
+                     enumerate(sorted(intervals)))
+        sessions.sort(key=lambda sess: order.get(sess.key.urlsafe(),
+                                                 len(order)))
+
+        conf_keys = set(sess.key.parent() for sess in sessions)
+        form = AgendaForm(
+            items=[self._copySessionToForm(sess) for sess in sessions],
+            conflicts=[AgendaConflictForm(websafeSessionKey=a,
+                                          conflictingSessionKey=b)
+                       for a, b in agenda.findConflicts(intervals)],
+            registeredConferenceKeys=[key.urlsafe() for key in registered
+                                      if key in conf_keys],
+            wishlistSessionKeys=[sess.key.urlsafe() for sess in wishlist])
+        # sessions added to attended conferences show up once it expires
+        memcache.set(cache_key, protojson.encode_message(form),
+                     time=agenda.AGENDA_TTL)
+        return form
+
+
     @endpoints.method(message_types.VoidMessage, ConferenceForms,
             http_method='GET',
             path='wishlist/unregistered', name='getNotRegisteredWishlist')
@@ -844,27 +1301,17 @@ class ConferenceApi(remote.Service):
         """Returns all sesssions on a users wishlist where the user is not
         registered for the conference."""
         prof = self._getProfileFromUser()
-        wishlist = prof.wishList
-        wishlist_keys = [ndb.Key(urlsafe=wish) for wish in wishlist]
 
-        # Get conferences attending.
-        attending_wsk = prof.conferenceKeysToAttend
-        attending_keys = [ndb.Key(urlsafe=wsk) for wsk in attending_wsk]
-
-        # Get the parent conferenes of all sessions in the query.
-        conf_keys = [session_key.parent() for session_key in wishlist_keys]
-
-        # Query confreences with wishlist session as child.
-        q = Conference.query()
-        q = q.filter(Conference.key.IN([key for key in conf_keys]))
-
-        # Query conferences that do not include those being attended.
-        for key in attending_keys:
-            q = q.filter(Conference.key != key)
+        # The parent conferences of the wishlisted sessions, less those
+        # being attended; the keys are known, so no query is needed.
+        conf_keys = set(session_key.parent()
+                        for session_key in prof.wishlist().keys())
+        conf_keys.difference_update(prof.registrations().keys())
 
+        confs = ndb.get_multi(sorted(conf_keys))
         return ConferenceForms(
-            items=[self._copyConferenceToForm(conference, "")
-                for conference in q])
+            items=[self._copyConferenceToForm(conference)
+                for conference in confs if conference])
 
 # - - - Registration - - - - - - - - - - - - - - - - - - - -
 
@@ -881,11 +1328,20 @@ class ConferenceApi(remote.Service):
         if not conf:
             raise endpoints.NotFoundException(
                 'No conference found with key: %s' % wsck)
+        registrations = prof.registrations()
 
         # register
         if reg:
             # check if user already registered otherwise add
-            if wsck in prof.conferenceKeysToAttend:
+            if conf.key in registrations:
+                raise ConflictException(
+                    "You have already registered for this conference")
+
+            # a granted queued registration already holds a seat; one still
+            # queued is cancelled, so it cannot take a second seat
+            ticket = ndb.Key(RegistrationTicket, prof.key.id(),
+                             parent=conf.key).get()
+            if ticket and ticket.status == 'GRANTED':
                 raise ConflictException(
                     "You have already registered for this conference")
 
@@ -895,43 +1351,222 @@ class ConferenceApi(remote.Service):
                     "There are no seats available.")
 
             # register user, take away one seat
-            prof.conferenceKeysToAttend.append(wsck)
+            registrations.add(conf.key)
             conf.seatsAvailable -= 1
             retval = True
+            if ticket and ticket.status in ('PENDING', 'WAITLISTED'):
+                ticket.status = 'CANCELLED'
+                ticket.put()
 
         # unregister
         else:
-            # check if user already registered
-            if wsck in prof.conferenceKeysToAttend:
+            # a granted queued registration holds a seat from the moment it
+            # is granted, before _grantRegistration adds it to the profile
+            ticket = ndb.Key(RegistrationTicket, prof.key.id(),
+                             parent=conf.key).get()
+            granted = bool(ticket and ticket.status == 'GRANTED')
 
+            # check if user already registered
+            if registrations.remove(conf.key) or granted:
                 # unregister user, add back one seat
-                prof.conferenceKeysToAttend.remove(wsck)
                 conf.seatsAvailable += 1
                 retval = True
             else:
                 retval = False
 
+            # cancel a queued registration so it can be requested again
+            if ticket and ticket.status != 'CANCELLED':
+                ticket.status = 'CANCELLED'
+                ticket.put()
+
         # write things back to the datastore and return
-        prof.put()
+        registrations.put()
         conf.put()
+        memcache.delete(MEMCACHE_AGENDA_KEY % prof.key.id())
+        if retval:
+            dashboard.recordRegistrations(conf, 1 if reg else -1)
+            changefeed.publish(changefeed.SEATS, wsck, conf.seatsAvailable)
         return BooleanMessage(data=retval)
 
 
     @endpoints.method(CONF_GET_REQUEST, BooleanMessage,
             path='conference/{websafeConferenceKey}',
             http_method='POST', name='registerForConference')
+    @ratelimit.limited('registerForConference')
     def registerForConference(self, request):
         """Register user for selected conference."""
         return self._conferenceRegistration(request)
 
 
+    @endpoints.method(CONF_GET_REQUEST, BooleanMessage,
+            path='conference/{websafeConferenceKey}',
+            http_method='DELETE', name='unregisterFromConference')
+    @ratelimit.limited('unregisterFromConference')
+    def unregisterFromConference(self, request):
+        """Unregister user for selected conference, offering the freed
+        seat to the waitlist."""
+        retval = self._conferenceRegistration(request, reg=False)
+        if retval.data:
+            self._scheduleAllocation(request.websafeConferenceKey)
+        return retval
+
+
+# - - - Registration queue - - - - - - - - - - - - - - - - - -
+
+    @staticmethod
+    def _scheduleAllocation(wsck):
+        """Enqueue a seat allocation run for the conference; requests
+        queued within the same second share one run."""
+        sideeffects.enqueue('/tasks/allocate_seats', params={'conf_key': wsck},
+                            name='allocate-%s-%d' % (wsck, int(time.time())),
+                            countdown=1)
+
+
+    @staticmethod
+    @ndb.transactional
+    def _allocateSeats(conf_key, user_ids):
+        """Grant seats to waitlisted users, oldest first, then to the given
+        users in order, waitlisting those left without a seat. Returns the
+        ids of all users holding a granted ticket."""
+        conf = conf_key.get()
+        if not conf:
+            return []
+        tickets = []
+        if conf.seatsAvailable > 0:
+            tickets = RegistrationTicket.query(
+                RegistrationTicket.status == 'WAITLISTED',
+                ancestor=conf_key).order(RegistrationTicket.queued).fetch(
+                    conf.seatsAvailable)
+        waitlisted = set(t.key for t in tickets)
+        tickets.extend(t for t in ndb.get_multi(
+            [ndb.Key(RegistrationTicket, uid, parent=conf_key)
+             for uid in user_ids]) if t and t.key not in waitlisted)
+
+        seats = conf.seatsAvailable
+        granted = []
+        for ticket in tickets:
+            if ticket.status in ('PENDING', 'WAITLISTED'):
+                if conf.seatsAvailable > 0:
+                    ticket.status = 'GRANTED'
+                    conf.seatsAvailable -= 1
+                else:
+                    ticket.status = 'WAITLISTED'
+            if ticket.status == 'GRANTED':
+                granted.append(ticket.key.id())
+        ndb.put_multi(tickets + [conf])
+        if conf.seatsAvailable != seats:
+            dashboard.recordRegistrations(conf, seats - conf.seatsAvailable)
+            changefeed.publish(changefeed.SEATS, conf_key.urlsafe(),
+                               conf.seatsAvailable)
+        return granted
+
+
+    @staticmethod
+    @ndb.transactional(xg=True)
+    def _grantRegistration(user_id, conf_key):
+        """Add the conference to the user's registrations, unless the
+        granted ticket was cancelled since."""
+        ticket = ndb.Key(RegistrationTicket, user_id, parent=conf_key).get()
+        prof = ndb.Key(Profile, user_id).get()
+        if not prof or not ticket or ticket.status != 'GRANTED':
+            return
+        prof.upgradeLegacyKeys()
+        registrations = prof.registrations()
+        if registrations.add(conf_key):
+            registrations.put()
+            memcache.delete(MEMCACHE_AGENDA_KEY % user_id)
+
+
+    @staticmethod
+    def _processRegistrationQueue(wsck):
+        """Lease a batch of queued registrations of the conference, grant
+        seats for the whole batch in one transaction and record the granted
+        registrations on the profiles."""
+        conf_key = ndb.Key(urlsafe=wsck)
+        queue = taskqueue.Queue(REGISTRATION_QUEUE)
+        tasks = queue.lease_tasks_by_tag(
+            ALLOCATION_LEASE_SECONDS, ALLOCATION_BATCH_SIZE, tag=wsck)
+
+        user_ids = []
+        for task in tasks:
+            if task.payload not in user_ids:
+                user_ids.append(task.payload)
+        for user_id in ConferenceApi._allocateSeats(conf_key, user_ids):
+            ConferenceApi._grantRegistration(user_id, conf_key)
+
+        # the tasks are only deleted once every profile is updated, so a
+        # failed run is retried when the leases expire
+        if tasks:
+            queue.delete_tasks(tasks)
+        if len(tasks) == ALLOCATION_BATCH_SIZE:
+            ConferenceApi._scheduleAllocation(wsck)
+
+
+    @endpoints.method(CONF_GET_REQUEST, RegistrationStatusForm,
+            path='conference/{websafeConferenceKey}/queue',
+            http_method='POST', name='requestRegistration')
+    @ratelimit.limited('registerForConference')
+    def requestRegistration(self, request):
+        """Queue a registration for the selected conference; seats are
+        granted in batches, and the outcome is reported by
+        getRegistrationStatus."""
+        prof = self._getProfileFromUser()
+        wsck = request.websafeConferenceKey
+        conf_key = ndb.Key(urlsafe=wsck)
+        if conf_key.kind() != 'Conference':
+            raise endpoints.BadRequestException(
+                'websafeKey must point to Conference entity.')
+        if conf_key in prof.registrations():
+            raise ConflictException(
+                "You have already registered for this conference")
+
+        ticket_key = ndb.Key(RegistrationTicket, prof.key.id(),
+                             parent=conf_key)
+
+        @ndb.transactional
+        def queue():
+            # the ticket and its pull task are written together, so a
+            # ticket is never left PENDING without a task to grant it
+            ticket = ticket_key.get()
+            if not ticket or ticket.status == 'CANCELLED':
+                ticket = RegistrationTicket(key=ticket_key)
+                ticket.put()
+                taskqueue.Queue(REGISTRATION_QUEUE).add(taskqueue.Task(
+                    payload=prof.key.id(), method='PULL', tag=wsck),
+                    transactional=True)
+            return ticket
+        ticket = queue()
+
+        # the allocation run is a named task, which cannot be added
+        # transactionally; it is scheduled again for every pending request
+        if ticket.status == 'PENDING':
+            self._scheduleAllocation(wsck)
+
+        return RegistrationStatusForm(websafeConferenceKey=wsck,
+            status=getattr(RegistrationStatus, ticket.status))
+
+
+    @endpoints.method(CONF_GET_REQUEST, RegistrationStatusForm,
+            path='conference/{websafeConferenceKey}/queue',
+            http_method='GET', name='getRegistrationStatus')
+    def getRegistrationStatus(self, request):
+        """Return the status of the user's queued registration."""
+        user = endpoints.get_current_user()
+        if not user:
+            raise endpoints.UnauthorizedException('Authorization required')
+        wsck = request.websafeConferenceKey
+        ticket = ndb.Key(RegistrationTicket, getUserId(user),
+                         parent=ndb.Key(urlsafe=wsck)).get()
+        status = ticket.status if ticket else 'NOT_REQUESTED'
+        return RegistrationStatusForm(websafeConferenceKey=wsck,
+            status=getattr(RegistrationStatus, status))
+
+
 # - - - Announcements - - - - - - - - - - - - - - - - - - - -
 
     @staticmethod
-    def _cacheAnnouncement():
-        """Create Announcement and assign to memcache; used by
-        memcache cron job and putAnnouncement().
-        """
+    def _computeAnnouncement(arg=''):
+        """Create Announcement from the nearly sold out conferences."""
         confs = Conference.query(ndb.AND(
             Conference.seatsAvailable <= 5,
             Conference.seatsAvailable > 0)
@@ -939,18 +1574,24 @@ class ConferenceApi(remote.Service):
 
         if confs:
             # If there are almost sold out conferences,
-            # format announcement and set it in memcache
-            announcement = '%s %s' % (
+            # format announcement
+            return '%s %s' % (
                 'Last chance to attend! The following conferences '
                 'are nearly sold out:',
                 ', '.join(conf.name for conf in confs))
-            memcache.set(MEMCACHE_ANNOUNCEMENTS_KEY, announcement)
-        else:
-            # If there are no sold out conferences,
-            # delete the memcache announcements entry
-            announcement = ""
-            memcache.delete(MEMCACHE_ANNOUNCEMENTS_KEY)
+        # If there are no sold out conferences, the announcement is empty
+        return ""
+
 
+    @staticmethod
+    def _cacheAnnouncement():
+        """Create Announcement and assign to memcache; used by
+        memcache cron job and putAnnouncement().
+        """
+        announcement = ConferenceApi._computeAnnouncement()
+        if announcement != swrcache.peek(MEMCACHE_ANNOUNCEMENTS_KEY):
+            changefeed.publish(changefeed.ANNOUNCEMENT, '', announcement)
+        swrcache.put(MEMCACHE_ANNOUNCEMENTS_KEY, '', announcement)
         return announcement
 
 
@@ -961,11 +1602,51 @@ class ConferenceApi(remote.Service):
         """Return Announcement from memcache."""
         # TODO 1
         # return an existing announcement from Memcache or an empty string
-        announcement = memcache.get(MEMCACHE_ANNOUNCEMENTS_KEY)
+        announcement = swrcache.get(MEMCACHE_ANNOUNCEMENTS_KEY)
         if not announcement:
             announcement = ""
         return StringMessage(data=announcement)
 
 
+# - - - Change feed - - - - - - - - - - - - - - - - - - - -
+
+    @endpoints.method(CHANGES_GET_REQUEST, ChangeFeedForm,
+            path='changes', http_method='GET', name='getChanges')
+    def getChanges(self, request):
+        """Return the seat, announcement and featured speaker changes made
+        since the version the client last saw, waiting briefly if there are
+        none yet. Without a version only the current version is returned."""
+        if request.since is None:
+            return ChangeFeedForm(version=changefeed.version(), reset=False)
+
+        version, changes, reset = changefeed.changesSince(request.since)
+        form = ChangeFeedForm(version=version, reset=reset)
+        conferences = {}
+        # later changes of the same value replace earlier ones
+        for kind, ident, value in changes:
+            if kind == changefeed.ANNOUNCEMENT:
+                form.announcement = value
+                continue
+            change = conferences.get(ident)
+            if not change:
+                change = conferences[ident] = ConferenceChangeForm(
+                    websafeConferenceKey=ident)
+            if kind == changefeed.SEATS:
+                change.seatsAvailable = value
+            elif kind == changefeed.FEATURED_SPEAKER:
+                change.featuredSpeaker = FeaturedSpeakerForm(
+                    speaker=value['speaker'],
+                    websafeSessionKeys=value['websafeSessionKeys'])
+        form.conferences = conferences.values()
+        return form
+
+
+# recomputation of the memcache values served through swrcache
+swrcache.register(MEMCACHE_ANNOUNCEMENTS_KEY,
+                  ConferenceApi._computeAnnouncement, ANNOUNCEMENT_SOFT_TTL)
+swrcache.register(MEMCACHE_FEATURED_SPEAKER_KEY,
+                  ConferenceApi._computeFeaturedSpeaker,
+                  FEATURED_SPEAKER_SOFT_TTL)
+
 # registers API
 api = endpoints.api_server([ConferenceApi])
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+
+"""dashboard.py
+
+Udacity conference server-side Python App Engine organizer dashboard;
+per-conference ConferenceStats aggregates, updated with every registration
+and new session, fed wishlist interest through coalesced tasks, and
+recomputed from the source entities by a reconciliation task.
+
+"""
+
+import datetime
+import time
+
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+
+from models import Conference
+from models import ConferenceStats
+from models import Profile
+from models import Registration
+from models import Session
+import popularity
+import sideeffects
+
+RECONCILE_TASK_URL = '/tasks/reconcile_stats'
+FOLD_TASK_URL = '/tasks/fold_interest'
+
+# wishlist interest changes are collected in memcache and written to the
+# conference's stats at most once per FOLD_DELAY seconds, keeping wishlist
+# writes out of the conference's entity group.
+FOLD_DELAY = 30
+MEMCACHE_INTEREST_KEY = 'INTEREST:%s'
+# memcache counters cannot go below zero; pending deltas are kept offset
+INTEREST_OFFSET = 2 ** 32
+
+
+def statsKey(conf_key):
+    return ndb.Key(ConferenceStats, 1, parent=conf_key)
+
+
+def initialStats(conf):
+    """Return the stats of a new conference."""
+    return ConferenceStats(key=statsKey(conf.key), name=conf.name,
+                           seatsAvailable=conf.seatsAvailable or 0)
+
+
+def _update(conf_key, fn):
+    """Apply fn to the conference's stats and store them; called in a
+    transaction on the conference. Conferences without stats yet get them
+    from a reconciliation instead."""
+    stats = statsKey(conf_key).get()
+    if not stats:
+        scheduleReconcile(conf_key.urlsafe())
+        return
+    fn(stats)
+    stats.put()
+
+
+def recordRegistrations(conf, delta):
+    """Count delta registrations for the conference, whose seats have been
+    updated accordingly."""
+    def apply(stats):
+        stats.registrations += delta
+        stats.seatsAvailable = conf.seatsAvailable
+    _update(conf.key, apply)
+
+
+def recordSession(session, new_speaker):
+    """Count a new session, and its speaker if not already speaking at the
+    conference."""
+    def apply(stats):
+        stats.sessions += 1
+        if new_speaker:
+            stats.speakers += 1
+    _update(session.key.parent(), apply)
+
+
+def recordInterest(conf_key, delta):
+    """Count delta wishlist entries for sessions of the conference."""
+    cache_key = MEMCACHE_INTEREST_KEY % conf_key.urlsafe()
+    if delta >= 0:
+        memcache.incr(cache_key, delta, initial_value=INTEREST_OFFSET)
+    else:
+        memcache.decr(cache_key, -delta, initial_value=INTEREST_OFFSET)
+    # one task per conference per FOLD_DELAY window
+    window = int(time.time() / FOLD_DELAY)
+    sideeffects.enqueue(FOLD_TASK_URL, countdown=FOLD_DELAY,
+                        name='interest-%s-%d' % (conf_key.urlsafe(), window),
+                        params={'conf_key': conf_key.urlsafe()})
+
+
+def _takeInterest(cache_key):
+    """Return the pending interest delta, resetting it to zero."""
+    client = memcache.Client()
+    for _ in xrange(5):
+        pending = client.gets(cache_key)
+        if pending is None:
+            return 0
+        delta = int(pending) - INTEREST_OFFSET
+        if not delta:
+            return 0
+        if client.cas(cache_key, INTEREST_OFFSET):
+            return delta
+    return 0
+
+
+def foldInterest(wsck):
+    """Write the conference's pending wishlist interest to its stats."""
+    conf_key = ndb.Key(urlsafe=wsck)
+    cache_key = MEMCACHE_INTEREST_KEY % wsck
+    delta = _takeInterest(cache_key)
+    if not delta:
+        return
+
+    @ndb.transactional
+    def apply():
+        def add(stats):
+            stats.wishlistInterest += delta
+        _update(conf_key, add)
+    try:
+        apply()
+    except Exception:
+        # give the delta back to be folded by a later task
+        if delta > 0:
+            memcache.incr(cache_key, delta, initial_value=INTEREST_OFFSET)
+        else:
+            memcache.decr(cache_key, -delta, initial_value=INTEREST_OFFSET)
+        raise
+
+
+# - - - Reconciliation - - - - - - - - - - - - - - - - - - - -
+
+def scheduleReconcile(wsck):
+    sideeffects.enqueue(RECONCILE_TASK_URL, params={'conf_key': wsck})
+
+
+def reconcileAll():
+    """Schedule the reconciliation of every conference's stats."""
+    for conf_key in Conference.query().iter(keys_only=True):
+        scheduleReconcile(conf_key.urlsafe())
+
+
+def reconcile(wsck):
+    """Recompute a conference's stats from its sessions, the profiles
+    registered for it and the wishlist counters of its sessions."""
+    conf_key = ndb.Key(urlsafe=wsck)
+    # pending interest is already in the wishlist counters counted below
+    memcache.delete(MEMCACHE_INTEREST_KEY % wsck)
+
+    sessions = Session.query(ancestor=conf_key).fetch()
+    speakers = set((s.speaker.speaker, s.speaker.organization)
+                   for s in sessions if s.speaker)
+    registrations = (
+        Profile.query(Profile.conferenceKeysToAttend == conf_key).count() +
+        Registration.query(Registration.conference == conf_key).count())
+    interest = sum(popularity.count(s.key) for s in sessions)
+
+    @ndb.transactional
+    def store():
+        conf = conf_key.get()
+        if not conf:
+            return
+        ConferenceStats(key=statsKey(conf_key), name=conf.name,
+                        registrations=registrations,
+                        seatsAvailable=conf.seatsAvailable or 0,
+                        sessions=len(sessions), speakers=len(speakers),
+                        wishlistInterest=interest,
+                        reconciled=datetime.datetime.utcnow()).put()
+    store()
+
+
+def organizerStats(prof_key):
+    """Return the stats of all conferences organized by the profile."""
+    return ConferenceStats.query(ancestor=prof_key).fetch()
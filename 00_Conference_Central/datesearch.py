@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+
+"""datesearch.py
+
+Udacity conference server-side Python App Engine date-range conference
+search; every conference stores the ISO weeks it runs in, so the
+conferences running during a date window are found with one equality
+lookup per week of the window instead of range filters on startDate and
+endDate, which the single-inequality rule does not allow together.
+
+Run it locally with the App Engine SDK on the path to compare the search
+with scanning every conference, over growing years of synthetic
+conferences:
+
+    python datesearch.py [CONFERENCES_PER_YEAR]
+
+The stub scans every entity of a kind to answer any query, so its query
+times grow with the stored conferences either way; the entities read show
+what the datastore would do.
+
+"""
+
+import datetime
+import random
+import sys
+import time
+
+from google.appengine.datastore.datastore_query import Cursor
+from google.appengine.ext import ndb
+
+from models import Conference
+from models import isoWeeks
+
+
+def search(start, end, page_size, page_token=None):
+    """Return ([conferences], next page token or None) of the conferences
+    running on any day from start to end.
+
+    Raises ValueError for a malformed page token.
+    """
+    weeks = isoWeeks(start, end)
+
+    # the page token is "<index of week>:<cursor within that week>"
+    week_index, cursor = 0, None
+    if page_token:
+        index, _, wsc = page_token.partition(':')
+        try:
+            week_index = int(index)
+            cursor = Cursor(urlsafe=wsc) if wsc else None
+        except Exception:
+            raise ValueError('Invalid page token: %s' % page_token)
+
+    # each week is one equality lookup; a conference spanning several
+    # weeks is only returned from the first of them inside the range
+    confs = []
+    while week_index < len(weeks) and len(confs) < page_size:
+        week = weeks[week_index]
+        page, cursor, more = Conference.query(
+            Conference.weeks == week).order(Conference.key).fetch_page(
+                page_size - len(confs), start_cursor=cursor)
+        confs.extend(conf for conf in page
+            if max(conf.weeks[0], weeks[0]) == week
+            and conf.startDate <= end
+            and (conf.endDate or conf.startDate) >= start)
+        if not (more and cursor):
+            week_index, cursor = week_index + 1, None
+
+    next_token = None
+    if week_index < len(weeks):
+        next_token = '%d:%s' % (
+            week_index, cursor.urlsafe() if cursor else '')
+    return confs, next_token
+
+
+# - - - Benchmark - - - - - - - - - - - - - - - - - - - - - -
+
+def _scan(start, end):
+    """search() without the week index: every conference is read."""
+    return [conf for conf in Conference.query()
+            if conf.startDate and conf.startDate <= end
+            and (conf.endDate or conf.startDate) >= start]
+
+
+def benchmark(years=(1, 5, 10, 20), per_year=500, window=10, page_size=20,
+              seed=0):
+    """Store per_year conferences of 1 to 5 days for each year, back from
+    2030, then search a `window` day range in the last year, page by page,
+    and scan for it. Returns [(years, conferences, matches, search reads,
+    search seconds, scan reads, scan seconds)]."""
+    rng = random.Random(seed)
+    last = datetime.date(2030, 1, 1)
+    start = datetime.date(2030, 6, 10)
+    end = start + datetime.timedelta(days=window - 1)
+    results = []
+    stored = 0
+    for count in years:
+        confs = []
+        for year in xrange(stored, count):
+            first = last.replace(year=last.year - year)
+            for i in xrange(per_year):
+                begin = first + datetime.timedelta(days=rng.randrange(365))
+                confs.append(Conference(
+                    name='Conference %d-%d' % (year, i), startDate=begin,
+                    endDate=begin + datetime.timedelta(
+                        days=rng.randrange(5)), month=begin.month))
+        ndb.put_multi(confs)
+        stored = count
+
+        ndb.get_context().clear_cache()
+        started = time.time()
+        found, token = search(start, end, page_size)
+        while token:
+            page, token = search(start, end, page_size, token)
+            found.extend(page)
+        search_secs = time.time() - started
+        search_reads = sum(Conference.query(Conference.weeks == week).count()
+                           for week in isoWeeks(start, end))
+
+        ndb.get_context().clear_cache()
+        started = time.time()
+        scanned = _scan(start, end)
+        scan_secs = time.time() - started
+
+        assert (sorted(c.key for c in found) ==
+                sorted(c.key for c in scanned))
+        results.append((count, count * per_year, len(found), search_reads,
+                        search_secs, count * per_year, scan_secs))
+    return results
+
+
+def main(argv):
+    from google.appengine.datastore import datastore_stub_util
+    from google.appengine.ext import testbed
+    per_year = int(argv[1]) if len(argv) > 1 else 500
+    bed = testbed.Testbed()
+    bed.activate()
+    bed.init_datastore_v3_stub(
+        consistency_policy=datastore_stub_util.PseudoRandomHRConsistencyPolicy(
+            probability=1))
+    bed.init_memcache_stub()
+    ndb.get_context().set_cache_policy(False)
+    ndb.get_context().set_memcache_policy(False)
+    try:
+        results = benchmark(per_year=per_year)
+    finally:
+        bed.deactivate()
+    print '%5s %12s %8s %13s %9s %11s %9s' % (
+        'years', 'conferences', 'matches', 'search reads', 'search',
+        'scan reads', 'scan')
+    for years, count, matches, reads, secs, scanned, scan_secs in results:
+        print '%5d %12d %8d %13d %8.3fs %11d %8.3fs' % (
+            years, count, matches, reads, secs, scanned, scan_secs)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,311 @@
+#!/usr/bin/env python
+
+"""export.py
+
+Udacity conference server-side Python App Engine bulk export; streams
+Conference, Session, Speaker and Profile entities as NDJSON or CSV in
+bounded memory, checkpointing a cursor between chained tasks.
+
+Measure the encode and write throughput on generated entities, and the
+end-to-end throughput of a job on the SDK datastore stub, with the App
+Engine SDK on the path, with:
+
+    python export.py [ENTITIES [STORED_ENTITIES]]
+
+"""
+
+import csv
+import datetime
+import json
+import logging
+import os
+import StringIO
+import sys
+import time
+import uuid
+
+from google.appengine.api import taskqueue
+from google.appengine.datastore.datastore_query import Cursor
+from google.appengine.ext import ndb
+
+from models import Conference
+from models import ConferenceDetail
+from models import ExportChunk
+from models import ExportJob
+from models import Profile
+from models import Session
+from models import Speaker
+
+EXPORT_KINDS = {
+    'Conference': Conference,
+    'ConferenceDetail': ConferenceDetail,
+    'Session': Session,
+    'Speaker': Speaker,
+    'Profile': Profile,
+}
+
+FORMATS = ('ndjson', 'csv')
+
+# entities fetched per get_multi, and batches handled per task before the
+# cursor is checkpointed and the next task is chained.
+BATCH_SIZE = 200
+BATCHES_PER_TASK = 25
+
+EXPORT_TASK_URL = '/tasks/export'
+
+
+# - - - Sinks - - - - - - - - - - - - - - - - - - - - - - - -
+
+class DatastoreSink(object):
+    """Stores every batch as an ExportChunk child of the export job."""
+
+    def __init__(self, job):
+        self.job = job
+
+    def write(self, kind, data):
+        ExportChunk(parent=self.job.key, id=self.job.sequence,
+                    kind=kind, data=data).put()
+
+
+class FileSink(object):
+    """Appends every batch to a file on the local filesystem; only usable
+    outside the production sandbox (tests, local tools)."""
+
+    def __init__(self, job):
+        self.path = job.target
+
+    def write(self, kind, data):
+        with open(self.path, 'ab') as f:
+            f.write(data)
+
+
+SINKS = {
+    'datastore': DatastoreSink,
+    'file': FileSink,
+}
+
+
+def register_sink(name, factory):
+    """Make a sink available to export jobs; factory is called with the
+    ExportJob and must return an object with a write(kind, data) method."""
+    SINKS[name] = factory
+
+
+# - - - Serialization - - - - - - - - - - - - - - - - - - - -
+
+def _plain(value):
+    """Convert datastore values into JSON serializable values."""
+    if isinstance(value, ndb.Key):
+        return value.urlsafe()
+    if isinstance(value, (datetime.date, datetime.datetime, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, dict):
+        return dict((k, _plain(v)) for k, v in value.iteritems())
+    if isinstance(value, list):
+        return [_plain(v) for v in value]
+    return value
+
+
+def _entityToDict(entity):
+    """Return a flat dict of the entity's properties plus its key."""
+    data = _plain(entity.to_dict())
+    data['websafeKey'] = entity.key.urlsafe()
+    return data
+
+
+def _columns(model):
+    return ['websafeKey'] + sorted(
+        prop._code_name for prop in model._properties.itervalues())
+
+
+def _encodeNdjson(model, entities, header):
+    return ''.join(json.dumps(_entityToDict(e), sort_keys=True) + '\n'
+                   for e in entities)
+
+
+def _encodeCsv(model, entities, header):
+    columns = _columns(model)
+    out = StringIO.StringIO()
+    writer = csv.writer(out)
+    if header:
+        writer.writerow(columns)
+    for entity in entities:
+        data = _entityToDict(entity)
+        row = []
+        for column in columns:
+            value = data.get(column)
+            if isinstance(value, list):
+                value = '|'.join(json.dumps(v) if isinstance(v, dict)
+                                 else unicode(v) for v in value)
+            elif isinstance(value, dict):
+                value = json.dumps(value, sort_keys=True)
+            elif value is None:
+                value = ''
+            row.append(unicode(value).encode('utf-8'))
+        writer.writerow(row)
+    return out.getvalue()
+
+
+ENCODERS = {
+    'ndjson': _encodeNdjson,
+    'csv': _encodeCsv,
+}
+
+
+# - - - Jobs - - - - - - - - - - - - - - - - - - - - - - - -
+
+def start(kinds=None, fmt='ndjson', sink='datastore', target=None):
+    """Create an export job and enqueue its first task. Returns the job."""
+    kinds = kinds or sorted(EXPORT_KINDS)
+    for kind in kinds:
+        if kind not in EXPORT_KINDS:
+            raise ValueError('Unknown kind: %s' % kind)
+    if fmt not in FORMATS:
+        raise ValueError('Unknown format: %s' % fmt)
+    if sink not in SINKS:
+        raise ValueError('Unknown sink: %s' % sink)
+
+    job = ExportJob(id=uuid.uuid4().hex, kinds=kinds, format=fmt,
+                    sink=sink, target=target)
+    job.put()
+    _enqueue(job)
+    return job
+
+
+def _enqueue(job):
+    # named per sequence so a retried task cannot chain its successor twice
+    try:
+        taskqueue.add(url=EXPORT_TASK_URL,
+                      name='export-%s-%d' % (job.key.id(), job.sequence),
+                      params={'job': job.key.id()})
+    except (taskqueue.TaskAlreadyExistsError, taskqueue.TombstonedTaskError):
+        pass
+
+
+def run(job_id, batches=BATCHES_PER_TASK):
+    """Export up to `batches` batches of the job from its checkpointed
+    cursor, then chain the next task if entities remain."""
+    job = ExportJob.get_by_id(job_id)
+    if not job or job.done:
+        return job
+
+    sink = SINKS[job.sink](job)
+    encode = ENCODERS[job.format]
+
+    for _ in xrange(batches):
+        kind = job.kinds[job.kindIndex]
+        model = EXPORT_KINDS[kind]
+        cursor = Cursor(urlsafe=job.cursor) if job.cursor else None
+        keys, next_cursor, more = model.query().fetch_page(
+            BATCH_SIZE, start_cursor=cursor, keys_only=True)
+        entities = [e for e in ndb.get_multi(keys) if e]
+
+        if entities:
+            sink.write(kind, encode(model, entities, header=not job.cursor))
+            job.exported += len(entities)
+            job.sequence += 1
+
+        # checkpoint; the sink has the batch so a retry resumes after it.
+        if more and next_cursor:
+            job.cursor = next_cursor.urlsafe()
+        else:
+            job.cursor = None
+            job.kindIndex += 1
+            if job.kindIndex >= len(job.kinds):
+                job.done = True
+        job.put()
+        if job.done:
+            logging.info('export %s done: %d entities',
+                         job.key.id(), job.exported)
+            return job
+
+    job.sequence += 1
+    job.put()
+    _enqueue(job)
+    return job
+
+
+# - - - Benchmark - - - - - - - - - - - - - - - - - - - - - -
+
+def _speakers(first, count):
+    return [Speaker(key=ndb.Key(Speaker, i + 1), speaker='Speaker %d' % i,
+                    organization='Org %d' % (i % 97))
+            for i in xrange(first, first + count)]
+
+
+def _maxRss():
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def benchmark(entities=1000000, fmt='ndjson'):
+    """Encode `entities` generated speakers in BATCH_SIZE batches and write
+    them to a file sink, as the job's tasks do, without the datastore.
+    Returns (seconds, bytes written, peak RSS growth in MB)."""
+    import tempfile
+    handle, path = tempfile.mkstemp(suffix='.' + fmt)
+    os.close(handle)
+    sink = FileSink(ExportJob(target=path))
+    encode = ENCODERS[fmt]
+    rss = _maxRss()
+    started = time.time()
+    try:
+        for first in xrange(0, entities, BATCH_SIZE):
+            batch = _speakers(first, min(BATCH_SIZE, entities - first))
+            sink.write('Speaker', encode(Speaker, batch, header=not first))
+        return time.time() - started, os.path.getsize(path), _maxRss() - rss
+    finally:
+        os.remove(path)
+
+
+def stubBenchmark(entities=10000, fmt='ndjson'):
+    """Store `entities` generated speakers in the datastore stub and run an
+    export job to a file sink, one task after the other. Returns (tasks,
+    seconds). Run inside an activated testbed."""
+    import tempfile
+    for first in xrange(0, entities, BATCH_SIZE):
+        ndb.put_multi(_speakers(first, min(BATCH_SIZE, entities - first)))
+    handle, path = tempfile.mkstemp(suffix='.' + fmt)
+    os.close(handle)
+    try:
+        job = ExportJob(id=uuid.uuid4().hex, kinds=['Speaker'], format=fmt,
+                        sink='file', target=path)
+        job.put()
+        tasks = 0
+        started = time.time()
+        while not job.done:
+            job = run(job.key.id())
+            tasks += 1
+        assert job.exported == entities
+        return tasks, time.time() - started
+    finally:
+        os.remove(path)
+
+
+def main(argv):
+    from google.appengine.ext import testbed
+    entities = int(argv[1]) if len(argv) > 1 else 1000000
+    stored = int(argv[2]) if len(argv) > 2 else 10000
+    bed = testbed.Testbed()
+    bed.activate()
+    bed.init_datastore_v3_stub()
+    bed.init_memcache_stub()
+    bed.init_taskqueue_stub()
+    ndb.get_context().set_cache_policy(False)
+    ndb.get_context().set_memcache_policy(False)
+    try:
+        for fmt in FORMATS:
+            secs, size, rss = benchmark(entities, fmt)
+            print '%s: %d speakers encoded and written in %.1fs, ' \
+                '%.0f entities/s, %.1f MB, peak RSS +%.1f MB' % (
+                    fmt, entities, secs, entities / secs,
+                    size / 1024.0 / 1024, rss)
+        tasks, secs = stubBenchmark(stored)
+        print 'stub: %d stored speakers exported in %d tasks in %.1fs, ' \
+            '%.0f entities/s' % (stored, tasks, secs, stored / secs)
+    finally:
+        bed.deactivate()
+
+
+if __name__ == '__main__':
+    main(sys.argv)
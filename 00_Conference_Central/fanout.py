@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+
+"""fanout.py
+
+Udacity conference server-side Python App Engine profile fan-out; copies a
+profile's display name to the conferences it organizes, in batches through
+chained tasks, after the profile is saved.
+
+"""
+
+import logging
+
+from google.appengine.datastore.datastore_query import Cursor
+from google.appengine.ext import ndb
+
+from models import Conference
+import sideeffects
+
+FANOUT_TASK_URL = '/tasks/fanout_display_name'
+
+# conferences updated per transaction; they share the organizer's entity
+# group, so a short transaction keeps registrations from waiting on it.
+BATCH_SIZE = 50
+
+
+def start(prof_key, cursor=None):
+    """Copy the profile's display name to its conferences in the
+    background."""
+    params = {'profile': prof_key.urlsafe()}
+    if cursor:
+        params['cursor'] = cursor
+    sideeffects.enqueue(FANOUT_TASK_URL, params=params)
+
+
+@ndb.transactional
+def _apply(prof_key, conf_keys):
+    """Set the profile's current display name on the conferences; return
+    the number changed."""
+    entities = ndb.get_multi([prof_key] + conf_keys)
+    prof, confs = entities[0], [c for c in entities[1:] if c]
+    if not prof:
+        return 0
+    stale = [c for c in confs
+             if c.organizerDisplayName != prof.displayName]
+    for conf in stale:
+        conf.organizerDisplayName = prof.displayName
+    ndb.put_multi(stale)
+    return len(stale)
+
+
+def run(wspk, cursor=None):
+    """Update the next batch of the profile's conferences, and chain the
+    next task while any remain."""
+    prof_key = ndb.Key(urlsafe=wspk)
+    conf_keys, next_cursor, more = Conference.query(
+        ancestor=prof_key).fetch_page(
+            BATCH_SIZE, keys_only=True,
+            start_cursor=Cursor(urlsafe=cursor) if cursor else None)
+    if conf_keys:
+        changed = _apply(prof_key, conf_keys)
+        logging.info('fanout %s: %d/%d conferences updated', wspk, changed,
+                     len(conf_keys))
+    if more and next_cursor:
+        start(prof_key, next_cursor.urlsafe())
@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+
+"""idtoken.py
+
+Udacity conference server-side Python App Engine ID token verification;
+checks the RS256 signature and the claims of Google ID tokens locally,
+against Google's public signing keys, instead of asking the tokeninfo
+endpoint about every token.
+
+The keys are cached in each instance and in memcache, refreshed every
+hour by a cron job, and fetched again at most once a minute when a token
+is signed with a key not seen yet. Tokens that cannot be verified locally
+raise UnverifiableTokenError.
+
+Run it locally, with the App Engine SDK and pycrypto on the path, to
+verify tokens signed with a generated key and compare the time taken with
+the tokeninfo endpoint, given a real ID token:
+
+    python idtoken.py [ID_TOKEN]
+
+"""
+
+import base64
+import json
+import logging
+import re
+import sys
+import threading
+import time
+
+import endpoints
+from google.appengine.api import memcache
+from google.appengine.api import urlfetch
+from Crypto.Hash import SHA256
+from Crypto.PublicKey import RSA
+from Crypto.Signature import PKCS1_v1_5
+
+from settings import WEB_CLIENT_ID
+
+CERTS_URL = 'https://www.googleapis.com/oauth2/v3/certs'
+TOKENINFO_URL = 'https://www.googleapis.com/oauth2/v1/tokeninfo?id_token=%s'
+ISSUERS = ('accounts.google.com', 'https://accounts.google.com')
+CLIENT_IDS = (WEB_CLIENT_ID, endpoints.API_EXPLORER_CLIENT_ID)
+
+MEMCACHE_KEYS_KEY = 'IDTOKEN:KEYS'
+# seconds keys are kept in memcache when the response does not say, and in
+# an instance before memcache is read again
+KEYS_TTL = 6 * 60 * 60
+LOCAL_TTL = 10 * 60
+# seconds between fetches for a key id not among the cached keys
+MIN_FETCH_INTERVAL = 60
+
+# seconds of clock difference allowed on the token's times
+CLOCK_SKEW = 300
+
+_MAX_AGE = re.compile(r'max-age=(\d+)')
+
+
+class Error(Exception):
+    """Base class of the errors of this module."""
+
+
+class InvalidTokenError(Error):
+    """The token is not a valid ID token."""
+
+
+class UnverifiableTokenError(Error):
+    """The token cannot be verified locally, e.g. it is not a JWT or its
+    signing key cannot be fetched."""
+
+
+def _b64decode(data):
+    data = str(data)
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip('=')
+
+
+def _int(data):
+    return long(_b64decode(data).encode('hex'), 16)
+
+
+def _b64int(number):
+    data = '%x' % number
+    return _b64encode(('0' * (len(data) % 2) + data).decode('hex'))
+
+
+# - - - Signing keys - - - - - - - - - - - - - - - - - - - - -
+
+_lock = threading.Lock()
+_local = {'keys': {}, 'loaded': 0, 'fetched': 0}
+
+
+def parseKeys(jwks):
+    """Return {key id: RSA public key} of a JSON Web Key Set."""
+    keys = {}
+    for jwk in json.loads(jwks).get('keys', []):
+        if jwk.get('kty') == 'RSA' and jwk.get('alg', 'RS256') == 'RS256':
+            keys[jwk['kid']] = RSA.construct((_int(jwk['n']), _int(jwk['e'])))
+    return keys
+
+
+def keySet(keys):
+    """Return the JSON Web Key Set of {key id: RSA key}; the inverse of
+    parseKeys(), for serving generated keys."""
+    return json.dumps({'keys': [
+        {'kty': 'RSA', 'alg': 'RS256', 'use': 'sig', 'kid': kid,
+         'n': _b64int(key.n), 'e': _b64int(key.e)}
+        for kid, key in sorted(keys.iteritems())]})
+
+
+def _install(keys, now):
+    with _lock:
+        _local['keys'] = keys
+        _local['loaded'] = now
+
+
+def refreshKeys():
+    """Fetch the signing keys into memcache and this instance; return their
+    key ids."""
+    _local['fetched'] = time.time()
+    resp = urlfetch.fetch(CERTS_URL, deadline=5)
+    if resp.status_code != 200:
+        raise UnverifiableTokenError(
+            'fetching signing keys failed: %d' % resp.status_code)
+    keys = parseKeys(resp.content)
+    match = _MAX_AGE.search(resp.headers.get('Cache-Control', ''))
+    ttl = int(match.group(1)) if match else KEYS_TTL
+    memcache.set(MEMCACHE_KEYS_KEY, resp.content, time=max(ttl, LOCAL_TTL))
+    _install(keys, time.time())
+    return sorted(keys)
+
+
+def _key(kid):
+    """Return the public key of a key id, reloading the cached keys when
+    they are old or do not have it."""
+    now = time.time()
+    key = _local['keys'].get(kid)
+    if key and now - _local['loaded'] < LOCAL_TTL:
+        return key
+
+    jwks = memcache.get(MEMCACHE_KEYS_KEY)
+    if jwks:
+        _install(parseKeys(jwks), now)
+        key = _local['keys'].get(kid)
+    if not key and now - _local['fetched'] >= MIN_FETCH_INTERVAL:
+        try:
+            refreshKeys()
+        except (urlfetch.Error, UnverifiableTokenError, ValueError) as e:
+            logging.warning('fetching ID token signing keys failed: %s', e)
+        key = _local['keys'].get(kid)
+    if not key:
+        raise UnverifiableTokenError('unknown signing key: %s' % kid)
+    return key
+
+
+# - - - Verification - - - - - - - - - - - - - - - - - - - - -
+
+def verify(token, client_ids=CLIENT_IDS, now=None, key=None):
+    """Return the claims of a valid ID token issued to one of client_ids.
+
+    The token is checked against `key` if given, and otherwise against the
+    Google signing key it names.
+    """
+    try:
+        header_data, claims_data, signature_data = str(token).split('.')
+        header = json.loads(_b64decode(header_data))
+        claims = json.loads(_b64decode(claims_data))
+        signature = _b64decode(signature_data)
+    except (ValueError, TypeError, UnicodeError):
+        raise UnverifiableTokenError('not a JWT')
+    if header.get('alg') != 'RS256':
+        raise UnverifiableTokenError('unsupported algorithm: %s' %
+                                     header.get('alg'))
+
+    key = key or _key(header.get('kid'))
+    digest = SHA256.new('%s.%s' % (header_data, claims_data))
+    if not PKCS1_v1_5.new(key).verify(digest, signature):
+        raise InvalidTokenError('bad signature')
+
+    now = time.time() if now is None else now
+    if claims.get('iss') not in ISSUERS:
+        raise InvalidTokenError('issuer %s' % claims.get('iss'))
+    # a token for several audiences names the party it was issued to in azp
+    audiences = claims.get('aud')
+    if not isinstance(audiences, list):
+        audiences = [audiences]
+    if not any(aud in client_ids for aud in audiences) and not (
+            len(audiences) > 1 and claims.get('azp') in client_ids):
+        raise InvalidTokenError('not issued to this application')
+    try:
+        expires, issued = int(claims['exp']), int(claims['iat'])
+    except (KeyError, TypeError, ValueError):
+        raise InvalidTokenError('missing times')
+    if expires < now - CLOCK_SKEW:
+        raise InvalidTokenError('expired')
+    if issued > now + CLOCK_SKEW:
+        raise InvalidTokenError('issued in the future')
+    if not claims.get('sub'):
+        raise InvalidTokenError('no subject')
+    return claims
+
+
+def sign(claims, key, kid='local'):
+    """Return an RS256 token of claims signed with a private RSA key, for
+    trying verify() out with generated keys."""
+    signing_input = '%s.%s' % (
+        _b64encode(json.dumps({'alg': 'RS256', 'typ': 'JWT', 'kid': kid})),
+        _b64encode(json.dumps(claims)))
+    signature = PKCS1_v1_5.new(key).sign(SHA256.new(signing_input))
+    return '%s.%s' % (signing_input, _b64encode(signature))
+
+
+# - - - Benchmark - - - - - - - - - - - - - - - - - - - - - -
+
+def benchmark(count=200, token=None):
+    """Return (path, seconds per token) of local verification with the keys
+    in the instance, and with the keys read from memcache as a new instance
+    does, and of the tokeninfo endpoint if a real ID token is given. Run
+    inside an activated testbed."""
+    key = RSA.generate(2048)
+    now = int(time.time())
+    claims = {'iss': ISSUERS[1], 'aud': WEB_CLIENT_ID, 'sub': '1234567890',
+              'email': 'user@example.com', 'iat': now, 'exp': now + 3600}
+    tokens = [sign(dict(claims, sub=str(i)), key) for i in xrange(count)]
+
+    _install({'local': key.publickey()}, time.time())
+    started = time.time()
+    for t in tokens:
+        verify(t)
+    results = [('local', (time.time() - started) / count)]
+
+    memcache.set(MEMCACHE_KEYS_KEY, keySet({'local': key.publickey()}))
+    started = time.time()
+    for t in tokens:
+        _install({}, 0)
+        verify(t)
+    results.append(('memcache', (time.time() - started) / count))
+
+    if token:
+        runs = min(count, 10)
+        started = time.time()
+        for _ in xrange(runs):
+            urlfetch.fetch(TOKENINFO_URL % token)
+        results.append(('tokeninfo', (time.time() - started) / runs))
+    return results
+
+
+def main(argv):
+    from google.appengine.ext import testbed
+    bed = testbed.Testbed()
+    bed.activate()
+    bed.init_memcache_stub()
+    bed.init_urlfetch_stub()
+    try:
+        for path, secs in benchmark(token=argv[1] if len(argv) > 1 else None):
+            print '%-10s %8.2fms per token' % (path, secs * 1000)
+    finally:
+        bed.deactivate()
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,324 @@
+#!/usr/bin/env python
+
+"""indexaudit.py
+
+Udacity conference server-side Python App Engine index footprint audit;
+maps the query shapes the application issues to the minimal set of
+composite indexes, and counts the index writes each put() costs.
+
+Run it locally with the App Engine SDK on the path:
+
+    python indexaudit.py [index.yaml]
+
+It reports, per kind and per write path, the index writes of a put()
+with every property indexed and the given index.yaml ("before"; pass the
+index.yaml of an earlier revision to compare with it), and with the
+models' indexed flags and the minimal indexes ("after"). It also
+lists indexed properties no query uses, and indexes no query needs.
+
+"""
+
+import collections
+import datetime
+import itertools
+import os
+import sys
+
+import yaml
+from google.appengine.datastore import entity_pb
+from google.appengine.ext import ndb
+
+from conference import FIELDS
+import models
+
+# - - - Query shapes - - - - - - - - - - - - - - - - - - - -
+
+# Every query issued by ConferenceApi and the background jobs. equality
+# holds the properties filtered with = (or IN, which runs as = subqueries),
+# inequality the one property filtered with <, <=, >, >= or !=, and
+# orders the sort orders. ancestor marks ancestor queries.
+Shape = collections.namedtuple(
+    'Shape', 'name kind ancestor equality inequality orders')
+
+
+def _shape(name, kind, ancestor=False, equality=(), inequality=None,
+           orders=()):
+    return Shape(name, kind, ancestor, tuple(equality), inequality,
+                 tuple(orders))
+
+
+def _conferenceFilterShapes():
+    """The shapes queryConferences can produce: any subset of FIELDS with
+    equality filters, sorted by name, optionally with an inequality filter
+    on one more field, which _getQuery sorts on before name."""
+    fields = sorted(FIELDS.values())
+    shapes = []
+    for n in xrange(len(fields) + 1):
+        for equality in itertools.combinations(fields, n):
+            shapes.append(_shape('queryConferences', 'Conference',
+                                 equality=equality, orders=['name']))
+    for inequality in fields:
+        others = [f for f in fields if f != inequality]
+        for n in xrange(len(others) + 1):
+            for equality in itertools.combinations(others, n):
+                shapes.append(_shape(
+                    'queryConferences', 'Conference', equality=equality,
+                    inequality=inequality, orders=[inequality, 'name']))
+    return shapes
+
+
+def queryShapes():
+    """Return the shapes of all queries the application issues."""
+    return _conferenceFilterShapes() + [
+        _shape('getConferencesCreated', 'Conference', ancestor=True),
+        _shape('fanout', 'Conference', ancestor=True),
+        _shape('getOrganizerDashboard', 'ConferenceStats', ancestor=True),
+        _shape('searchConferencesByDate', 'Conference',
+               equality=['weeks'], orders=['__key__']),
+        _shape('_computeAnnouncement', 'Conference',
+               inequality='seatsAvailable', orders=['seatsAvailable', 'name']),
+        _shape('warmup', 'Conference', orders=['name']),
+        _shape('capture', 'CaptureChunk', orders=['created']),
+        _shape('bulksync', 'Conference', inequality='lastModified',
+               orders=['lastModified']),
+        _shape('bulksync', 'Session', inequality='lastModified',
+               orders=['lastModified']),
+        _shape('getConferenceSessions', 'Session', ancestor=True),
+        _shape('getConferenceSessionsByType', 'Session', ancestor=True,
+               equality=['typeOfSession']),
+        _shape('getSessionsBySpeaker', 'Session',
+               equality=['speaker.speaker', 'speaker.organization']),
+        _shape('getConferenceSessionsBySpeaker', 'Session', ancestor=True,
+               equality=['speaker.speaker', 'speaker.organization']),
+        _shape('beforeSevenNonWorkshopSession', 'Session',
+               equality=['startTime.hour']),
+        _shape('getSessionsByHighlights', 'Session',
+               equality=['highlights']),
+        _shape('getSessionsByDuration', 'Session', inequality='duration',
+               orders=['duration']),
+        _shape('getSpeaker', 'Speaker',
+               equality=['speaker', 'organization']),
+        _shape('cascade registrations', 'Profile',
+               equality=['conferenceKeys']),
+        _shape('cascade wishlists', 'Profile', equality=['wishListKeys']),
+        _shape('cascade overflow registrations', 'Registration',
+               equality=['conference']),
+        _shape('cascade overflow wishlists', 'WishlistEntry',
+               equality=['session']),
+        _shape('KeySet.keys', 'Registration', ancestor=True),
+        _shape('KeySet.keys', 'WishlistEntry', ancestor=True),
+        _shape('_processRegistrationQueue', 'RegistrationTicket',
+               ancestor=True, equality=['status'], orders=['queued']),
+        _shape('migrations.progress', 'MigrationShard', equality=['run']),
+    ]
+
+
+# - - - Indexes - - - - - - - - - - - - - - - - - - - - - - -
+
+# (kind, ancestor, property names); sort directions are all ascending here.
+Index = collections.namedtuple('Index', 'kind ancestor properties')
+
+
+def requiredIndexes(shape):
+    """Return the composite indexes a query shape needs, [] if the built-in
+    indexes serve it.
+
+    Equality filters without sort orders are merge-joined over the built-in
+    single property indexes. Equality filters with sort orders, the
+    inequality property first, are merge-joined over one (property,
+    orders...) index per filter, so all such queries share those indexes
+    rather than needing one per combination. Without equality filters the
+    query scans the (orders...) index.
+    """
+    orders = [o for o in shape.orders if o != '__key__']
+    if shape.inequality and shape.inequality not in orders:
+        orders.insert(0, shape.inequality)
+
+    if not orders:
+        return []
+    if not shape.equality:
+        if not shape.ancestor and len(orders) <= 1:
+            return []
+        return [Index(shape.kind, shape.ancestor, tuple(orders))]
+    return [Index(shape.kind, shape.ancestor, (prop,) + tuple(orders))
+            for prop in shape.equality]
+
+
+def minimalIndexes(shapes):
+    """Return the sorted set of composite indexes serving all shapes."""
+    indexes = set()
+    for shape in shapes:
+        indexes.update(requiredIndexes(shape))
+    return sorted(indexes)
+
+
+def loadIndexYaml(path):
+    """Return the composite indexes declared in an index.yaml file."""
+    with open(path) as f:
+        data = yaml.safe_load(f) or {}
+    return [Index(index['kind'], index.get('ancestor') in (True, 'yes'),
+                  tuple(prop['name'] for prop in index.get('properties', [])))
+            for index in data.get('indexes') or []]
+
+
+def queriedProperties(shapes):
+    """Return {kind: set of property names} the shapes filter or sort on."""
+    queried = collections.defaultdict(set)
+    for shape in shapes:
+        queried[shape.kind].update(shape.equality)
+        queried[shape.kind].update(shape.orders)
+        if shape.inequality:
+            queried[shape.kind].add(shape.inequality)
+    return queried
+
+
+def unqueriedIndexed(entity, shapes):
+    """Return the names of the entity's indexed properties no shape uses."""
+    queried = queriedProperties(shapes)[entity._get_kind()]
+    return sorted(set(p.name() for p in entity._to_pb().property_list())
+                  - queried)
+
+
+# - - - Write cost - - - - - - - - - - - - - - - - - - - - -
+
+def _values(entity, every_property):
+    """Return {property name: number of index values} for the entity.
+    every_property counts the unindexed properties as well, as they were
+    before indexed=False, except Text and Blob values that never are."""
+    pb = entity._to_pb()
+    props = list(pb.property_list())
+    if every_property:
+        props.extend(p for p in pb.raw_property_list()
+                     if p.meaning() not in (entity_pb.Property.TEXT,
+                                            entity_pb.Property.BLOB))
+    values = collections.Counter()
+    for prop in props:
+        values[prop.name()] += 1
+    return values
+
+
+def indexWrites(entity, composites, every_property=False):
+    """Return the index writes of putting a new entity: two for the entity
+    and the kind index, two per indexed value (ascending and descending
+    rows), and one per row of each composite index of its kind."""
+    values = _values(entity, every_property)
+    writes = 2 + 2 * sum(values.itervalues())
+    depth = len(entity.key.pairs())
+    for index in composites:
+        if index.kind != entity._get_kind():
+            continue
+        rows = depth if index.ancestor else 1
+        for name in index.properties:
+            rows *= values.get(name, 0)
+        writes += rows
+    return writes
+
+
+def sampleEntities():
+    """Return {kind: entity} of typically sized entities, not stored."""
+    prof_key = ndb.Key(models.Profile, 'user@example.com')
+    conf_key = ndb.Key(models.Conference, 1, parent=prof_key)
+    session_key = ndb.Key(models.Session, 1, parent=conf_key)
+    speaker = models.Speaker(key=ndb.Key(models.Speaker, 1),
+                             speaker='Ada Lovelace', organization='Analytical')
+    conf = models.Conference(
+        key=conf_key, name='PyCon', organizerUserId='user@example.com',
+        topics=['Programming Languages', 'Web Technologies', 'Data'],
+        city='London', startDate=datetime.date(2016, 6, 1), month=6,
+        endDate=datetime.date(2016, 6, 3), maxAttendees=500,
+        seatsAvailable=120)
+    conf._pre_put_hook()
+    entities = {
+        'Conference': conf,
+        'ConferenceDetail': models.ConferenceDetail(
+            key=conf.detailKey(), description='x' * 2000),
+        'Session': models.Session(
+            key=session_key, name='Keynote', highlights=['intro', 'python'],
+            speaker=speaker, duration=60, typeOfSession=['Keynote', 'Talk'],
+            date=datetime.date(2016, 6, 1),
+            startTime=models.StartTime(hour=9, minute=30)),
+        'Speaker': speaker,
+        'Profile': models.Profile(
+            key=prof_key, displayName='Ada', mainEmail='user@example.com',
+            teeShirtSize='M_W',
+            conferenceKeysToAttend=[
+                ndb.Key(models.Conference, i, parent=prof_key)
+                for i in xrange(1, 6)],
+            wishList=[ndb.Key(models.Session, i, parent=conf_key)
+                      for i in xrange(1, 21)]),
+    }
+    for entity in entities.itervalues():
+        # sets the auto_now properties
+        entity._prepare_for_put()
+    return entities
+
+
+# kinds put by each write path
+WRITE_PATHS = [
+    ('_createConferenceObject', ['Conference', 'ConferenceDetail']),
+    ('_createSessionObject', ['Session']),
+    ('_conferenceRegistration', ['Profile', 'Conference']),
+    ('addSessionToWishlist', ['Profile']),
+    ('saveProfile', ['Profile']),
+]
+
+
+def report(index_yaml):
+    """Return the report lines comparing the index writes per put()."""
+    shapes = queryShapes()
+    deployed = loadIndexYaml(index_yaml)
+    minimal = minimalIndexes(shapes)
+    entities = sampleEntities()
+
+    writes = {}
+    for kind, entity in entities.iteritems():
+        writes[kind] = (indexWrites(entity, deployed, every_property=True),
+                        indexWrites(entity, minimal))
+
+    lines = ['%-26s %8s %8s' % ('put', 'before', 'after')]
+    for kind in sorted(writes):
+        lines.append('%-26s %8d %8d' % ((kind,) + writes[kind]))
+    lines.append('')
+    for path, kinds in WRITE_PATHS:
+        lines.append('%-26s %8d %8d' % (
+            path, sum(writes[k][0] for k in kinds),
+            sum(writes[k][1] for k in kinds)))
+
+    lines.append('')
+    lines.append('indexed but never queried:')
+    for kind in sorted(entities):
+        unused = unqueriedIndexed(entities[kind], shapes)
+        if unused:
+            lines.append('  %s: %s' % (kind, ', '.join(unused)))
+
+    lines.append('')
+    lines.append('declared indexes no query needs:')
+    for index in sorted(set(deployed) - set(minimal)):
+        lines.append('  %s%s (%s)' % (
+            index.kind, ' [ancestor]' if index.ancestor else '',
+            ', '.join(index.properties)))
+    lines.append('')
+    lines.append('needed indexes not declared:')
+    for index in sorted(set(minimal) - set(deployed)):
+        lines.append('  %s%s (%s)' % (
+            index.kind, ' [ancestor]' if index.ancestor else '',
+            ', '.join(index.properties)))
+    return lines
+
+
+def main(argv):
+    from google.appengine.ext import testbed
+    bed = testbed.Testbed()
+    bed.activate()
+    bed.init_datastore_v3_stub()
+    bed.init_memcache_stub()
+    try:
+        path = argv[1] if len(argv) > 1 else os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), 'index.yaml')
+        print '\n'.join(report(path))
+    finally:
+        bed.deactivate()
+
+
+if __name__ == '__main__':
+    main(sys.argv)
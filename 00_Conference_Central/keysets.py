@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+
+"""keysets.py
+
+Udacity conference server-side Python App Engine key sets; set semantics
+over a repeated KeyProperty that overflows into child entities so the
+parent entity stays small.
+
+"""
+
+from google.appengine.ext import ndb
+
+# keys held inline on the parent entity before new members overflow into
+# child entities.
+INLINE_LIMIT = 500
+
+
+class KeySet(object):
+    """Set of keys held in the repeated KeyProperty `prop` of `entity`.
+
+    Once INLINE_LIMIT keys are held inline, new members are stored as
+    `child_model` entities parented on `entity`, keyed by the member's
+    urlsafe key and holding the member key in property `ref`. The number
+    of overflowed members is kept in the integer property `overflow`.
+
+    Changes are only written by put().
+    """
+
+    def __init__(self, entity, prop, overflow, child_model, ref):
+        self.entity = entity
+        self.prop = prop
+        self.overflow = overflow
+        self.child_model = child_model
+        self.ref = ref
+        self._members = None
+        self._puts = []
+        self._deletes = []
+
+    def _inline(self):
+        return getattr(self.entity, self.prop)
+
+    def _inlineSet(self):
+        if self._members is None:
+            self._members = set(self._inline())
+        return self._members
+
+    def _overflowCount(self):
+        return getattr(self.entity, self.overflow) or 0
+
+    def _addOverflow(self, delta):
+        setattr(self.entity, self.overflow, self._overflowCount() + delta)
+
+    def _childKey(self, key):
+        return ndb.Key(self.child_model, key.urlsafe(),
+                       parent=self.entity.key)
+
+    def __contains__(self, key):
+        if key in self._inlineSet():
+            return True
+        if self._overflowCount():
+            return self._childKey(key).get() is not None
+        return False
+
+    def __len__(self):
+        return len(self._inline()) + self._overflowCount()
+
+    def add(self, key):
+        """Add key; returns False if it already was a member."""
+        if key in self:
+            return False
+        if len(self._inline()) < INLINE_LIMIT:
+            self._inline().append(key)
+            self._inlineSet().add(key)
+        else:
+            child = self.child_model(key=self._childKey(key))
+            setattr(child, self.ref, key)
+            self._puts.append(child)
+            self._addOverflow(1)
+        return True
+
+    def remove(self, key):
+        """Remove key; returns False if it was not a member."""
+        if key in self._inlineSet():
+            self._inline().remove(key)
+            self._inlineSet().discard(key)
+            return True
+        if self._overflowCount() and key in self:
+            self._deletes.append(self._childKey(key))
+            self._addOverflow(-1)
+            return True
+        return False
+
+    def keys(self):
+        """Return all member keys, inline members first."""
+        keys = list(self._inline())
+        if self._overflowCount():
+            children = self.child_model.query(
+                ancestor=self.entity.key).fetch(keys_only=True)
+            keys.extend(ndb.Key(urlsafe=child.id()) for child in children)
+        return keys
+
+    def put(self):
+        """Write the entity along with any added or removed children."""
+        ndb.put_multi([self.entity] + self._puts)
+        if self._deletes:
+            ndb.delete_multi(self._deletes)
+        self._puts = []
+        self._deletes = []
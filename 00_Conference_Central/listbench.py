@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+
+"""listbench.py
+
+Udacity conference server-side Python App Engine conference list path
+benchmark; compares the list query and its response before and after the
+conference_details migration moves descriptions into ConferenceDetail.
+
+Run it locally with the App Engine SDK on the path:
+
+    python listbench.py [CONFERENCES]
+
+Sizes are those of the encoded entities the query fetches and of the JSON
+response sent, not the memory the instance uses to hold them.
+
+"""
+
+import datetime
+import random
+import sys
+import time
+
+from google.appengine.ext import ndb
+from protorpc import protojson
+
+from migrations import BATCH_SIZE
+from migrations import _migrateGroup
+from migrations import conferenceDetails
+from models import Conference
+from models import ConferenceForms
+from models import Profile
+
+
+def _measureList(copy, repeat=5):
+    """Return (encoded entity size, fetch ms, response size) of a
+    conference list query, sizes in bytes."""
+    fetches = []
+    for _ in xrange(repeat):
+        ndb.get_context().clear_cache()
+        started = time.time()
+        confs = Conference.query().fetch()
+        fetches.append(time.time() - started)
+    response = protojson.encode_message(
+        ConferenceForms(items=[copy(conf) for conf in confs]))
+    return (sum(conf._to_pb().ByteSize() for conf in confs),
+            sorted(fetches)[repeat // 2] * 1000, len(response))
+
+
+def benchmark(count=1000, description=2000, seed=0):
+    """Store `count` conferences with inline descriptions of `description`
+    characters, measure the list path as it was, run conference_details
+    over them and measure the list path again. Returns [(phase, encoded
+    entity size, fetch ms, response size)]. Run inside an activated
+    testbed."""
+    from conference import ConferenceApi
+    api = ConferenceApi()
+    rng = random.Random(seed)
+    words = ['conference', 'cloud', 'python', 'keynote', 'workshop', 'data',
+             'speakers', 'engine', 'mobile', 'scale', 'the', 'and', 'of']
+    organizer = ndb.Key(Profile, 'organizer@example.com')
+    confs = []
+    for i in xrange(count):
+        text = []
+        while sum(len(w) + 1 for w in text) < description:
+            text.append(rng.choice(words))
+        start = datetime.date(2030, 1, 1) + datetime.timedelta(days=i % 365)
+        confs.append(Conference(
+            parent=organizer, name='Conference %d' % i,
+            organizerUserId=organizer.id(), city='City %d' % (i % 50),
+            topics=rng.sample(words, 4), startDate=start, month=start.month,
+            endDate=start + datetime.timedelta(days=2), maxAttendees=100,
+            seatsAvailable=100, legacyDescription=' '.join(text)))
+    ndb.put_multi(confs)
+
+    # the list responses sent topics and the description before the split
+    results = [('before',) + _measureList(
+        lambda conf: api._copyConferenceToForm(conf, False))]
+    for i in xrange(0, count, BATCH_SIZE):
+        _migrateGroup([conf.key for conf in confs[i:i + BATCH_SIZE]],
+                      conferenceDetails).get_result()
+    results.append(('after',) + _measureList(api._copyConferenceToForm))
+    return results
+
+
+def main(argv):
+    from google.appengine.ext import testbed
+    count = int(argv[1]) if len(argv) > 1 else 1000
+    bed = testbed.Testbed()
+    bed.activate()
+    bed.setup_env(current_version_id='testbed.1', overwrite=True)
+    bed.init_datastore_v3_stub()
+    bed.init_memcache_stub()
+    bed.init_taskqueue_stub()
+    ndb.get_context().set_cache_policy(False)
+    ndb.get_context().set_memcache_policy(False)
+    try:
+        results = benchmark(count)
+    finally:
+        bed.deactivate()
+    print '%d conferences, sizes in bytes' % count
+    print '%-8s %12s %12s %10s %14s' % (
+        'list', 'entity size', 'fetched size', 'fetch', 'response size')
+    for phase, size, fetch, response in results:
+        print '%-8s %12d %12d %8.1fms %14d' % (
+            phase, size / count, size, fetch, response)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
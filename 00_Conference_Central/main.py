@@ -13,9 +13,23 @@ created by wesc on 2014 may 24
 __author__ = 'wesc+api@google.com (Wesley Chun)'
 
 import webapp2
+import warmup
+warmup.import_modules()
+
 from google.appengine.api import app_identity
 from google.appengine.api import mail
 from conference import ConferenceApi
+import bulksync
+import capture
+import cascade
+import dashboard
+import export
+import fanout
+import idtoken
+import migrations
+import popularity
+import recommend
+import swrcache
 
 
 class SetAnnouncementHandler(webapp2.RequestHandler):
@@ -47,8 +61,206 @@ class AddFeaturedSpeaker(webapp2.RequestHandler):
         self.response.set_status(204)
 
 
+class RefreshIdTokenKeysHandler(webapp2.RequestHandler):
+    def get(self):
+        """Fetch the ID token signing keys into memcache."""
+        idtoken.refreshKeys()
+        self.response.set_status(204)
+
+
+class StartRecommendationsHandler(webapp2.RequestHandler):
+    def get(self):
+        """Start the session recommendations job in a task."""
+        recommend.start()
+        self.response.set_status(204)
+
+
+class BuildRecommendationsHandler(webapp2.RequestHandler):
+    def post(self):
+        """Count the next batch of wishlists of a recommendations job, or
+        store the recommendations once all are counted."""
+        recommend.run(self.request.get('job'))
+        self.response.set_status(204)
+
+
+class CascadeDeleteHandler(webapp2.RequestHandler):
+    def post(self):
+        """Delete the next batch of a deleted entity's descendants."""
+        cascade.run(self.request.get('key'))
+        self.response.set_status(204)
+
+
+class FanoutDisplayNameHandler(webapp2.RequestHandler):
+    def post(self):
+        """Copy a profile's display name to a batch of its conferences."""
+        fanout.run(self.request.get('profile'),
+                   self.request.get('cursor') or None)
+        self.response.set_status(204)
+
+
+class RefreshCacheHandler(webapp2.RequestHandler):
+    def post(self):
+        """Recompute a stale or missing memcache value."""
+        swrcache.refresh(self.request.get('prefix'), self.request.get('arg'))
+        self.response.set_status(204)
+
+
+class AllocateSeatsHandler(webapp2.RequestHandler):
+    def post(self):
+        """Grant seats to a batch of queued registrations."""
+        ConferenceApi._processRegistrationQueue(self.request.get('conf_key'))
+        self.response.set_status(204)
+
+
+class PersistTrendingHandler(webapp2.RequestHandler):
+    def post(self):
+        """Write a conference's trending sessions to datastore."""
+        popularity.persist(self.request.get('conf_key'))
+        self.response.set_status(204)
+
+
+class StartExportHandler(webapp2.RequestHandler):
+    def get(self):
+        """Start a bulk export of the requested kinds."""
+        try:
+            job = export.start(
+                kinds=self.request.get_all('kind'),
+                fmt=self.request.get('format', 'ndjson'),
+                sink=self.request.get('sink', 'datastore'),
+                target=self.request.get('target') or None)
+        except ValueError as e:
+            self.abort(400, detail=str(e))
+        self.response.headers['Content-Type'] = 'text/plain'
+        self.response.write(job.key.id())
+
+
+class ExportHandler(webapp2.RequestHandler):
+    def post(self):
+        """Export the next batches of a bulk export job."""
+        export.run(self.request.get('job'))
+        self.response.set_status(204)
+
+
+class CaptureHandler(webapp2.RequestHandler):
+    def get(self):
+        """Download the captured request envelopes for replay."""
+        self.response.headers['Content-Type'] = 'application/x-ndjson'
+        capture.download(self.response.write)
+
+
+class StartMigrationHandler(webapp2.RequestHandler):
+    def get(self):
+        """Start a run of the named migration."""
+        try:
+            run = migrations.start(self.request.get('name'))
+        except ValueError as e:
+            self.abort(400, detail=str(e))
+        self.response.headers['Content-Type'] = 'text/plain'
+        self.response.write(run)
+
+
+class MigrationStatusHandler(webapp2.RequestHandler):
+    def get(self):
+        """Report the progress of a migration run."""
+        shards, done, processed, updated = migrations.progress(
+            self.request.get('run'))
+        self.response.headers['Content-Type'] = 'text/plain'
+        self.response.write(
+            'shards: %d/%d done\nprocessed: %d\nupdated: %d\n' % (
+                done, shards, processed, updated))
+
+
+class MigrationSplitHandler(webapp2.RequestHandler):
+    def post(self):
+        """Cut the next shard of a migration run."""
+        migrations.split(self.request.get('migration'),
+                         self.request.get('run'),
+                         int(self.request.get('shard')),
+                         self.request.get('cursor') or None)
+        self.response.set_status(204)
+
+
+class MigrationShardHandler(webapp2.RequestHandler):
+    def post(self):
+        """Migrate the next batches of a migration shard."""
+        migrations.migrate_shard(self.request.get('shard'),
+                                 int(self.request.get('sequence', 0)))
+        self.response.set_status(204)
+
+
+class BulkSyncHandler(webapp2.RequestHandler):
+    def get(self, kind):
+        """Serve a batch of the conferences or sessions changed in a sync
+        window to a machine client."""
+        if not bulksync.authorized(self.request.headers.get('Authorization')):
+            self.abort(401)
+        try:
+            batch = bulksync.fetchBatch(
+                kind,
+                since=self.request.get('since') or None,
+                until=self.request.get('until') or None,
+                cursor=self.request.get('cursor') or None,
+                batch_size=int(self.request.get('limit', bulksync.BATCH_SIZE)))
+        except ValueError as e:
+            self.abort(400, detail=str(e))
+        self.response.headers['Content-Type'] = bulksync.CONTENT_TYPE
+        self.response.write(bulksync.encode(batch))
+
+
+class ReconcileAllStatsHandler(webapp2.RequestHandler):
+    def get(self):
+        """Schedule the reconciliation of every conference's stats."""
+        dashboard.reconcileAll()
+        self.response.set_status(204)
+
+
+class ReconcileStatsHandler(webapp2.RequestHandler):
+    def post(self):
+        """Recompute a conference's dashboard stats."""
+        dashboard.reconcile(self.request.get('conf_key'))
+        self.response.set_status(204)
+
+
+class FoldInterestHandler(webapp2.RequestHandler):
+    def post(self):
+        """Write a conference's pending wishlist interest to its stats."""
+        dashboard.foldInterest(self.request.get('conf_key'))
+        self.response.set_status(204)
+
+
+class WarmupHandler(webapp2.RequestHandler):
+    def get(self):
+        """Prime caches on a new instance and report import times."""
+        timings = warmup.warm()
+        lines = warmup.import_report()
+        lines.extend('%-40s %8.1f ms' % ('warmup ' + step, secs * 1000)
+                     for step, secs in timings)
+        self.response.headers['Content-Type'] = 'text/plain'
+        self.response.write('\n'.join(lines))
+
+
 app = webapp2.WSGIApplication([
+    ('/_ah/warmup', WarmupHandler),
     ('/crons/set_announcement', SetAnnouncementHandler),
+    ('/crons/refresh_id_token_keys', RefreshIdTokenKeysHandler),
+    ('/crons/build_recommendations', StartRecommendationsHandler),
+    ('/tasks/build_recommendations', BuildRecommendationsHandler),
     ('/tasks/send_confirmation_email', SendConfirmationEmailHandler),
-    ('/tasks/add_featured_speaker', AddFeaturedSpeaker)
+    ('/tasks/add_featured_speaker', AddFeaturedSpeaker),
+    ('/tasks/cascade_delete', CascadeDeleteHandler),
+    ('/tasks/fanout_display_name', FanoutDisplayNameHandler),
+    ('/tasks/refresh_cache', RefreshCacheHandler),
+    ('/tasks/allocate_seats', AllocateSeatsHandler),
+    ('/tasks/persist_trending', PersistTrendingHandler),
+    ('/crons/reconcile_stats', ReconcileAllStatsHandler),
+    ('/tasks/reconcile_stats', ReconcileStatsHandler),
+    ('/tasks/fold_interest', FoldInterestHandler),
+    ('/admin/export', StartExportHandler),
+    ('/tasks/export', ExportHandler),
+    ('/admin/capture', CaptureHandler),
+    ('/admin/migrate', StartMigrationHandler),
+    ('/admin/migrate/status', MigrationStatusHandler),
+    ('/tasks/migrate/split', MigrationSplitHandler),
+    ('/tasks/migrate/shard', MigrationShardHandler),
+    ('/sync/(conferences|sessions)', BulkSyncHandler),
 ], debug=True)
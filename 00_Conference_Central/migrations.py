@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+
+"""migrations.py
+
+Udacity conference server-side Python App Engine schema migrations;
+cursor-sharded, checkpointed backfills run through chained tasks.
+
+A migration is a function registered with @migration(name, model). It is
+called with each entity of the model and must update the entity in place,
+returning True only if it changed anything, so that re-running a migration
+over already migrated entities is a no-op. Each call runs in a transaction
+on a fresh read of the entity, so writes made by live traffic while a
+batch is processed are not overwritten; anything else it reads or writes
+must be in the entity's group. The entities of a batch are migrated in one
+transaction per entity group, and the groups' transactions run
+concurrently.
+
+"""
+
+import collections
+import logging
+import time
+import uuid
+
+from google.appengine.api import taskqueue
+from google.appengine.datastore.datastore_query import Cursor
+from google.appengine.ext import ndb
+
+from models import Conference
+from models import ConferenceDetail
+from models import MigrationShard
+from models import isoWeeks
+from models import Profile
+from models import Session
+
+MIGRATION_QUEUE = 'migrations'
+SPLIT_TASK_URL = '/tasks/migrate/split'
+SHARD_TASK_URL = '/tasks/migrate/shard'
+
+# entities per shard, entities per batch, batches per task and
+# the pause, in seconds, before a shard's next task runs.
+SHARD_SIZE = 5000
+BATCH_SIZE = 100
+BATCHES_PER_TASK = 10
+THROTTLE = 1
+
+# name -> (model, function)
+MIGRATIONS = {}
+
+
+def migration(name, model):
+    """Register the decorated function as migration `name` over `model`."""
+    def register(fn):
+        MIGRATIONS[name] = (model, fn)
+        return fn
+    return register
+
+
+def _cursor(urlsafe):
+    return Cursor(urlsafe=urlsafe) if urlsafe else None
+
+
+def _urlsafe(cursor):
+    return cursor.urlsafe() if cursor else None
+
+
+def start(name):
+    """Start a run of migration `name`; returns the run id."""
+    if name not in MIGRATIONS:
+        raise ValueError('Unknown migration: %s' % name)
+    run = uuid.uuid4().hex
+    taskqueue.add(url=SPLIT_TASK_URL, queue_name=MIGRATION_QUEUE,
+                  params={'migration': name, 'run': run, 'shard': 0})
+    return run
+
+
+def split(name, run, shard, cursor=None):
+    """Cut the next SHARD_SIZE keys into a shard, start a worker on it and
+    chain the split of the remainder, so shards run while splitting
+    continues."""
+    model, _ = MIGRATIONS[name]
+    start_cursor = _cursor(cursor)
+    _, end_cursor, more = model.query().fetch_page(
+        SHARD_SIZE, start_cursor=start_cursor, keys_only=True)
+    if not more:
+        end_cursor = None
+
+    shard_id = '%s-%d' % (run, shard)
+    MigrationShard(id=shard_id, migration=name, run=run,
+                   startCursor=cursor, cursor=cursor,
+                   endCursor=_urlsafe(end_cursor)).put()
+    _enqueue(SHARD_TASK_URL, 'migrate-%s-0' % shard_id, {'shard': shard_id})
+
+    if more:
+        _enqueue(SPLIT_TASK_URL, 'split-%s-%d' % (run, shard + 1),
+                 {'migration': name, 'run': run, 'shard': shard + 1,
+                  'cursor': end_cursor.urlsafe()})
+
+
+def _enqueue(url, task_name, params, countdown=0):
+    # task names make a retried task's enqueue of its successor a no-op
+    try:
+        taskqueue.add(url=url, name=task_name, params=params,
+                      queue_name=MIGRATION_QUEUE, countdown=countdown)
+    except (taskqueue.TaskAlreadyExistsError, taskqueue.TombstonedTaskError):
+        pass
+
+
+@ndb.transactional_tasklet
+def _migrateGroup(keys, fn):
+    """Re-read entities of one entity group and apply fn to each; the
+    future's result is the number that changed."""
+    entities = yield ndb.get_multi_async(keys)
+    changed = [entity for entity in entities
+               if entity is not None and fn(entity)]
+    yield ndb.put_multi_async(changed)
+    raise ndb.Return(len(changed))
+
+
+def migrate_shard(shard_id, sequence=0):
+    """Migrate up to BATCHES_PER_TASK batches of a shard from its
+    checkpointed cursor, then chain the shard's next task."""
+    shard = MigrationShard.get_by_id(shard_id)
+    if not shard or shard.done:
+        return shard
+    model, fn = MIGRATIONS[shard.migration]
+    end_cursor = _cursor(shard.endCursor)
+
+    for _ in xrange(BATCHES_PER_TASK):
+        start = time.time()
+        keys, cursor, more = model.query().fetch_page(
+            BATCH_SIZE, start_cursor=_cursor(shard.cursor),
+            end_cursor=end_cursor, keys_only=True)
+        # one transaction per entity group, as concurrent transactions on
+        # the same group would conflict; the groups' transactions run
+        # concurrently, so their reads and commits are batched
+        groups = collections.OrderedDict()
+        for key in keys:
+            groups.setdefault(key.root(), []).append(key)
+        futures = [_migrateGroup(group, fn) for group in groups.itervalues()]
+        ndb.Future.wait_all(futures)
+        changed = sum(future.get_result() for future in futures)
+
+        shard.processed += len(keys)
+        shard.updated += changed
+        shard.cursor = _urlsafe(cursor)
+        shard.done = not (more and cursor)
+        shard.put()
+        logging.info('migration %s shard %s: %d/%d updated in %.0f ms',
+                     shard.migration, shard_id, changed, len(keys),
+                     (time.time() - start) * 1000)
+        if shard.done:
+            return shard
+
+    _enqueue(SHARD_TASK_URL, 'migrate-%s-%d' % (shard_id, sequence + 1),
+             {'shard': shard_id, 'sequence': sequence + 1},
+             countdown=THROTTLE)
+    return shard
+
+
+def progress(run):
+    """Return (shards, shards done, processed, updated) for a run."""
+    shards = MigrationShard.query(MigrationShard.run == run).fetch()
+    return (len(shards),
+            sum(1 for s in shards if s.done),
+            sum(s.processed for s in shards),
+            sum(s.updated for s in shards))
+
+
+# - - - Migrations - - - - - - - - - - - - - - - - - - - - - -
+
+@migration('profile_keys', Profile)
+def profileKeys(prof):
+    """Profile wishlist and registrations from urlsafe strings to keys."""
+    return prof.upgradeLegacyKeys()
+
+
+@migration('conference_details', Conference)
+def conferenceDetails(conf):
+    """Conference description into its ConferenceDetail child."""
+    if conf.legacyDescription is None:
+        return False
+    # the child is written first so a retry after a failed batch is safe
+    if not conf.detailKey().get():
+        ConferenceDetail(key=conf.detailKey(),
+                         description=conf.legacyDescription).put()
+    conf.legacyDescription = None
+    return True
+
+
+@migration('conference_weeks', Conference)
+def conferenceWeeks(conf):
+    """Conference ISO week buckets for date range search."""
+    # Conference._pre_put_hook recomputes the weeks on put
+    return conf.weeks != isoWeeks(conf.startDate, conf.endDate)
+
+
+@migration('conference_last_modified', Conference)
+def conferenceLastModified(conf):
+    """Conference lastModified, so bulk sync picks up older conferences."""
+    # the auto_now property is set by the put
+    return conf.lastModified is None
+
+
+@migration('session_last_modified', Session)
+def sessionLastModified(session):
+    """Session lastModified, so bulk sync picks up older sessions."""
+    return session.lastModified is None
+
+
+@migration('conference_organizer_names', Conference)
+def conferenceOrganizerNames(conf):
+    """Conference organizerDisplayName from the organizer's profile."""
+    prof = conf.key.parent().get()
+    name = prof.displayName if prof else None
+    if conf.organizerDisplayName == name:
+        return False
+    conf.organizerDisplayName = name
+    return True
+
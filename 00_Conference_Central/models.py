@@ -12,19 +12,72 @@ created/forked from conferences.py by wesc on 2014 may 24
 
 __author__ = 'wesc+api@google.com (Wesley Chun)'
 
+import datetime
 import httplib
 import endpoints
 from protorpc import messages
 from google.appengine.ext import ndb
 
+from keysets import KeySet
+
 
 class Profile(ndb.Model):
     """Profile -- User profile object"""
-    displayName = ndb.StringProperty()
-    mainEmail = ndb.StringProperty()
-    teeShirtSize = ndb.StringProperty(default='NOT_SPECIFIED')
-    conferenceKeysToAttend = ndb.StringProperty(repeated=True)
-    wishList = ndb.StringProperty(repeated=True)
+    displayName = ndb.StringProperty(indexed=False)
+    mainEmail = ndb.StringProperty(indexed=False)
+    teeShirtSize = ndb.StringProperty(default='NOT_SPECIFIED', indexed=False)
+    conferenceKeysToAttend = ndb.KeyProperty(
+        'conferenceKeys', kind='Conference', repeated=True)
+    wishList = ndb.KeyProperty('wishListKeys', kind='Session', repeated=True)
+    # number of keys overflowed into Registration/WishlistEntry children
+    registrationOverflow = ndb.IntegerProperty(default=0, indexed=False)
+    wishListOverflow = ndb.IntegerProperty(default=0, indexed=False)
+    # urlsafe key strings stored before the switch to KeyProperty; moved
+    # into the properties above by upgradeLegacyKeys()
+    legacyConferenceKeysToAttend = ndb.StringProperty(
+        'conferenceKeysToAttend', repeated=True, indexed=False)
+    legacyWishList = ndb.StringProperty(
+        'wishList', repeated=True, indexed=False)
+
+    def registrations(self):
+        """Return the set of keys of conferences the user attends."""
+        return KeySet(self, 'conferenceKeysToAttend', 'registrationOverflow',
+                      Registration, 'conference')
+
+    def wishlist(self):
+        """Return the set of keys of sessions on the user's wishlist."""
+        return KeySet(self, 'wishList', 'wishListOverflow',
+                      WishlistEntry, 'session')
+
+    def upgradeLegacyKeys(self):
+        """Move legacy urlsafe strings into the key properties, dropping
+        duplicates; returns True if the profile changed."""
+        if not (self.legacyConferenceKeysToAttend or self.legacyWishList):
+            return False
+        for legacy, prop in (
+                (self.legacyConferenceKeysToAttend, self.conferenceKeysToAttend),
+                (self.legacyWishList, self.wishList)):
+            seen = set(prop)
+            for wsk in legacy:
+                key = ndb.Key(urlsafe=wsk)
+                if key not in seen:
+                    seen.add(key)
+                    prop.append(key)
+        self.legacyConferenceKeysToAttend = []
+        self.legacyWishList = []
+        return True
+
+
+class Registration(ndb.Model):
+    """Registration -- conference registration overflowing the Profile's
+    inline list; child of Profile"""
+    conference = ndb.KeyProperty(kind='Conference')
+
+
+class WishlistEntry(ndb.Model):
+    """WishlistEntry -- wishlist session overflowing the Profile's inline
+    list; child of Profile"""
+    session = ndb.KeyProperty(kind='Session')
 
 
 class ProfileMiniForm(messages.Message):
@@ -61,17 +114,74 @@ class TeeShirtSize(messages.Enum):
 
 
 class Conference(ndb.Model):
-    """Conference -- Conference object"""
+    """Conference -- Conference object; the description is kept in a
+    ConferenceDetail child so list queries do not load it"""
     name            = ndb.StringProperty(required=True)
-    description     = ndb.StringProperty()
-    organizerUserId = ndb.StringProperty()
+    organizerUserId = ndb.StringProperty(indexed=False)
+    # copy of the organizer's Profile.displayName, so conference lists need
+    # no profile reads; kept up to date by fanout.py
+    organizerDisplayName = ndb.StringProperty(indexed=False)
     topics          = ndb.StringProperty(repeated=True)
     city            = ndb.StringProperty()
-    startDate       = ndb.DateProperty()
+    startDate       = ndb.DateProperty(indexed=False)
     month           = ndb.IntegerProperty()
-    endDate         = ndb.DateProperty()
+    endDate         = ndb.DateProperty(indexed=False)
     maxAttendees    = ndb.IntegerProperty()
     seatsAvailable  = ndb.IntegerProperty()
+    # ISO weeks ('2016-W23') the conference runs in, so date overlap
+    # queries become equality filters; kept up to date on every put
+    weeks           = ndb.StringProperty(repeated=True)
+    # set on every put; drives the incremental bulk sync
+    lastModified    = ndb.DateTimeProperty(auto_now=True)
+    # description stored inline before ConferenceDetail existed; moved out
+    # by the conference_details migration
+    legacyDescription = ndb.StringProperty('description', indexed=False)
+
+    def detailKey(self):
+        """Return the key of the conference's ConferenceDetail."""
+        return ConferenceDetail.keyFor(self.key)
+
+    def _pre_put_hook(self):
+        self.weeks = isoWeeks(self.startDate, self.endDate)
+
+
+def isoWeeks(start, end=None):
+    """Return the ISO weeks, in order, of the days from start to end."""
+    if not start:
+        return []
+    end = max(end or start, start)
+    day = start - datetime.timedelta(days=start.weekday())
+    weeks = []
+    while day <= end:
+        year, week, _ = day.isocalendar()
+        weeks.append('%04d-W%02d' % (year, week))
+        day += datetime.timedelta(weeks=1)
+    return weeks
+
+
+class ConferenceDetail(ndb.Model):
+    """ConferenceDetail -- heavy, detail-page-only Conference fields; child
+    of Conference with id 1"""
+    description = ndb.TextProperty(compressed=True)
+
+    @staticmethod
+    def keyFor(conf_key):
+        """Return the ConferenceDetail key of the conference with conf_key,
+        without loading the conference."""
+        return ndb.Key(ConferenceDetail, 1, parent=conf_key)
+
+
+class ConferenceStats(ndb.Model):
+    """ConferenceStats -- organizer dashboard figures of a conference;
+    child of Conference with id 1, updated with every change and recomputed
+    by a reconciliation task"""
+    name             = ndb.StringProperty(indexed=False)
+    registrations    = ndb.IntegerProperty(default=0, indexed=False)
+    seatsAvailable   = ndb.IntegerProperty(default=0, indexed=False)
+    sessions         = ndb.IntegerProperty(default=0, indexed=False)
+    speakers         = ndb.IntegerProperty(default=0, indexed=False)
+    wishlistInterest = ndb.IntegerProperty(default=0, indexed=False)
+    reconciled       = ndb.DateTimeProperty(indexed=False)
 
 
 class ConferenceForm(messages.Message):
@@ -95,6 +205,21 @@ class ConferenceForms(messages.Message):
     items = messages.MessageField(ConferenceForm, 1, repeated=True)
 
 
+class ConferencePageForm(messages.Message):
+    """ConferencePageForm -- one page of Conference outbound form messages"""
+    items = messages.MessageField(ConferenceForm, 1, repeated=True)
+    nextPageToken = messages.StringField(2)
+
+
+class DateRangeQueryForm(messages.Message):
+    """DateRangeQueryForm -- inbound query for conferences running during a
+    date window; dates as YYYY-MM-DD"""
+    startDate = messages.StringField(1)
+    endDate = messages.StringField(2)
+    pageSize = messages.IntegerField(3, variant=messages.Variant.INT32)
+    pageToken = messages.StringField(4)
+
+
 class ConferenceQueryForm(messages.Message):
     """ConferenceQueryForm -- Conference query inbound form message"""
     field = messages.StringField(1)
@@ -144,6 +269,45 @@ class FeaturedSpeakerForm(messages.Message):
     websafeSessionKeys = messages.StringField(2, repeated=True)
 
 
+class FeaturedSpeakerForms(messages.Message):
+    """FeaturedSpeakerForms -- multiple FeaturedSpeakerForm outbound message;
+    items without a featured speaker are left empty"""
+    items = messages.MessageField(FeaturedSpeakerForm, 1, repeated=True)
+
+
+class WebsafeKeysForm(messages.Message):
+    """WebsafeKeysForm -- inbound (multi) websafe key message"""
+    websafeKeys = messages.StringField(1, repeated=True)
+
+
+class ConferenceDetailForm(messages.Message):
+    """ConferenceDetailForm -- Conference outbound detail message, with the
+    caller's registration and wishlist status for the conference"""
+    conference = messages.MessageField(ConferenceForm, 1)
+    registered = messages.BooleanField(2)
+    wishlistSessionKeys = messages.StringField(3, repeated=True)
+    featuredSpeaker = messages.MessageField(FeaturedSpeakerForm, 4)
+    seatsAvailable = messages.IntegerField(5, variant=messages.Variant.INT32)
+
+
+class ConferenceChangeForm(messages.Message):
+    """ConferenceChangeForm -- changed seats and/or featured speaker of a
+    conference"""
+    websafeConferenceKey = messages.StringField(1)
+    seatsAvailable = messages.IntegerField(2, variant=messages.Variant.INT32)
+    featuredSpeaker = messages.MessageField(FeaturedSpeakerForm, 3)
+
+
+class ChangeFeedForm(messages.Message):
+    """ChangeFeedForm -- changes since the version a client last saw; the
+    announcement is only set if it changed, and reset asks the client to
+    reload everything"""
+    version = messages.IntegerField(1)
+    reset = messages.BooleanField(2)
+    announcement = messages.StringField(3)
+    conferences = messages.MessageField(ConferenceChangeForm, 4, repeated=True)
+
+
 # Session
 
 class StartTime(ndb.Model):
@@ -151,17 +315,18 @@ class StartTime(ndb.Model):
     to make the start time of allow greater/less than queries of a conferences
     start times."""
     hour  = ndb.IntegerProperty()
-    minute = ndb.IntegerProperty()
+    minute = ndb.IntegerProperty(indexed=False)
 
 
 class Session(ndb.Model):
-    name = ndb.StringProperty()
+    name = ndb.StringProperty(indexed=False)
     highlights = ndb.StringProperty(repeated=True)
     speaker = ndb.StructuredProperty(Speaker)
     duration = ndb.IntegerProperty()
     typeOfSession = ndb.StringProperty(repeated=True)
-    date = ndb.DateProperty()
+    date = ndb.DateProperty(indexed=False)
     startTime = ndb.StructuredProperty(StartTime)
+    lastModified = ndb.DateTimeProperty(auto_now=True)
 
 
 class CreateSessionForm(messages.Message):
@@ -194,6 +359,53 @@ class SessionForms(messages.Message):
     items = messages.MessageField(SessionForm, 1, repeated=True)
 
 
+class ConferenceStatsForm(messages.Message):
+    """ConferenceStatsForm -- organizer dashboard figures of a conference"""
+    websafeConferenceKey = messages.StringField(1)
+    name = messages.StringField(2)
+    registrations = messages.IntegerField(3, variant=messages.Variant.INT32)
+    seatsAvailable = messages.IntegerField(4, variant=messages.Variant.INT32)
+    sessions = messages.IntegerField(5, variant=messages.Variant.INT32)
+    speakers = messages.IntegerField(6, variant=messages.Variant.INT32)
+    wishlistInterest = messages.IntegerField(7,
+                                             variant=messages.Variant.INT32)
+
+
+class ConferenceStatsForms(messages.Message):
+    """ConferenceStatsForms -- the dashboard of all of an organizer's
+    conferences"""
+    items = messages.MessageField(ConferenceStatsForm, 1, repeated=True)
+
+
+class SyncBatchForm(messages.Message):
+    """SyncBatchForm -- one batch of the conferences or sessions changed in
+    a bulk sync window; pass cursor back while more is set, and until as
+    the next sync's since once it is not"""
+    conferences = messages.MessageField(ConferenceForm, 1, repeated=True)
+    sessions = messages.MessageField(SessionForm, 2, repeated=True)
+    cursor = messages.StringField(3)
+    more = messages.BooleanField(4)
+    since = messages.StringField(5)
+    until = messages.StringField(6)
+
+
+class AgendaConflictForm(messages.Message):
+    """AgendaConflictForm -- two agenda sessions that overlap in time"""
+    websafeSessionKey = messages.StringField(1)
+    conflictingSessionKey = messages.StringField(2)
+
+
+class AgendaForm(messages.Message):
+    """AgendaForm -- the user's wishlisted sessions and the sessions of the
+    conferences the user is registered for, in time order, the overlapping
+    pairs among them, which of their conferences the user is registered for
+    and which of the sessions are wishlisted"""
+    items = messages.MessageField(SessionForm, 1, repeated=True)
+    conflicts = messages.MessageField(AgendaConflictForm, 2, repeated=True)
+    registeredConferenceKeys = messages.StringField(3, repeated=True)
+    wishlistSessionKeys = messages.StringField(4, repeated=True)
+
+
 class QuerySessionsByDurationForm(messages.Message):
     """QuerySessionByDurationForm -- Session query inbound form messages.
     Takes an integer."""
@@ -208,6 +420,28 @@ class SessionsOfConferenceByType(messages.Message):
 
 # needed for conference registration
 
+class RegistrationTicket(ndb.Model):
+    """RegistrationTicket -- queued registration request of a user, keyed
+    by user id; child of Conference"""
+    status = ndb.StringProperty(default='PENDING')
+    queued = ndb.DateTimeProperty(auto_now_add=True)
+
+
+class RegistrationStatus(messages.Enum):
+    """RegistrationStatus -- queued registration status enumeration value"""
+    NOT_REQUESTED = 1
+    PENDING = 2
+    GRANTED = 3
+    WAITLISTED = 4
+    CANCELLED = 5
+
+
+class RegistrationStatusForm(messages.Message):
+    """RegistrationStatusForm -- outbound queued registration status"""
+    websafeConferenceKey = messages.StringField(1)
+    status = messages.EnumField('RegistrationStatus', 2)
+
+
 class BooleanMessage(messages.Message):
     """BooleanMessage-- outbound Boolean value message"""
     data = messages.BooleanField(1)
@@ -218,6 +452,13 @@ class ConflictException(endpoints.ServiceException):
     http_status = httplib.CONFLICT
 
 
+class TooManyRequestsException(endpoints.ServiceException):
+    """TooManyRequestsException -- exception for shed requests; this
+    endpoints version cannot send 429, so it is sent as 408, which the
+    Endpoints frontend turns into a 503 response"""
+    http_status = httplib.REQUEST_TIMEOUT
+
+
 class HighlightsForm(messages.Message):
     """HighlightsForm -- outbound (multiple) string message."""
     highlights = messages.StringField(1, repeated=True)
@@ -235,3 +476,92 @@ class StringMessages(messages.Message):
     data = messages.StringField(1, repeated=True)
 
 
+
+
+# bulk export
+
+class ExportJob(ndb.Model):
+    """ExportJob -- checkpointed state of a bulk export run"""
+    kinds       = ndb.StringProperty(repeated=True, indexed=False)
+    kindIndex   = ndb.IntegerProperty(default=0, indexed=False)
+    format      = ndb.StringProperty(default='ndjson', indexed=False)
+    sink        = ndb.StringProperty(default='datastore', indexed=False)
+    target      = ndb.StringProperty(indexed=False)
+    cursor      = ndb.StringProperty(indexed=False)
+    sequence    = ndb.IntegerProperty(default=0, indexed=False)
+    exported    = ndb.IntegerProperty(default=0, indexed=False)
+    done        = ndb.BooleanProperty(default=False, indexed=False)
+    created     = ndb.DateTimeProperty(auto_now_add=True, indexed=False)
+
+
+class ExportChunk(ndb.Model):
+    """ExportChunk -- one batch of exported lines, child of ExportJob"""
+    kind = ndb.StringProperty(indexed=False)
+    data = ndb.TextProperty(compressed=True)
+
+
+# traffic capture
+
+class CaptureChunk(ndb.Model):
+    """CaptureChunk -- a batch of sampled request envelopes, one JSON
+    object per line"""
+    data    = ndb.TextProperty(compressed=True)
+    created = ndb.DateTimeProperty(auto_now_add=True)
+
+
+# migrations
+
+class MigrationShard(ndb.Model):
+    """MigrationShard -- checkpointed progress of one cursor range of a
+    migration run"""
+    migration   = ndb.StringProperty(indexed=False)
+    run         = ndb.StringProperty()
+    startCursor = ndb.StringProperty(indexed=False)
+    endCursor   = ndb.StringProperty(indexed=False)
+    cursor      = ndb.StringProperty(indexed=False)
+    processed   = ndb.IntegerProperty(default=0, indexed=False)
+    updated     = ndb.IntegerProperty(default=0, indexed=False)
+    done        = ndb.BooleanProperty(default=False, indexed=False)
+    modified    = ndb.DateTimeProperty(auto_now=True, indexed=False)
+
+
+# session popularity
+
+class SessionPopularityShard(ndb.Model):
+    """SessionPopularityShard -- one shard of a session's wishlist counter"""
+    count = ndb.IntegerProperty(default=0, indexed=False)
+
+
+class TrendingSessions(ndb.Model):
+    """TrendingSessions -- most wishlisted sessions of a conference, keyed
+    by the conference's urlsafe key; counts[i] belongs to sessions[i]"""
+    sessions = ndb.KeyProperty(kind='Session', repeated=True, indexed=False)
+    counts   = ndb.IntegerProperty(repeated=True, indexed=False)
+
+
+# session recommendations
+
+class SessionRecommendations(ndb.Model):
+    """SessionRecommendations -- sessions most often wishlisted together
+    with a session, keyed by the session's urlsafe key; scores[i] is the
+    number of wishlists holding both sessions and sessions[i]"""
+    sessions = ndb.KeyProperty(kind='Session', repeated=True, indexed=False)
+    scores   = ndb.IntegerProperty(repeated=True, indexed=False)
+    built    = ndb.DateTimeProperty(auto_now=True, indexed=False)
+
+
+class RecommendationJob(ndb.Model):
+    """RecommendationJob -- checkpointed state of a recommendations run"""
+    cursor   = ndb.StringProperty(indexed=False)
+    sequence = ndb.IntegerProperty(default=0, indexed=False)
+    profiles = ndb.IntegerProperty(default=0, indexed=False)
+    counted  = ndb.BooleanProperty(default=False, indexed=False)
+    done     = ndb.BooleanProperty(default=False, indexed=False)
+    created  = ndb.DateTimeProperty(auto_now_add=True, indexed=False)
+
+
+class RecommendationChunk(ndb.Model):
+    """RecommendationChunk -- piece of the co-occurrence counts of the
+    wishlists read by one task of a run, child of RecommendationJob keyed
+    by the task's sequence and the piece's number"""
+    data = ndb.BlobProperty()
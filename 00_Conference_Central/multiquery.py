@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+
+"""multiquery.py
+
+Udacity conference server-side Python App Engine multi-value queries; runs
+the equality sub-queries of an IN filter concurrently as keys-only queries,
+merges their key streams without duplicates, stops at the limit and only
+then fetches the surviving entities with one get_multi.
+
+ndb expands IN (and !=) filters itself, but runs the full entity queries
+and merges them without a limit pushed down to the sub-queries, so every
+matching entity of every value is loaded.
+
+Run it locally with the App Engine SDK on the path to compare both on the
+datastore stub as the number of IN values grows:
+
+    python multiquery.py
+
+The stub answers queries synchronously, so the numbers show the cost of
+loading entities twice or past the limit, not the gain of overlapping RPCs.
+
+"""
+
+import heapq
+import itertools
+import sys
+import time
+
+from google.appengine.ext import ndb
+
+# keys fetched per round trip of each sub-query
+BATCH_SIZE = 100
+
+
+def splitIn(query, prop, values):
+    """Return one equality query per distinct value, the sub-queries of
+    query.filter(prop.IN(values))."""
+    seen = set()
+    queries = []
+    for value in values:
+        if value not in seen:
+            seen.add(value)
+            queries.append(query.filter(prop == value))
+    return queries
+
+
+def mergeKeys(queries, limit=None, batch_size=BATCH_SIZE):
+    """Yield the keys matching any of the queries, in key order, each once.
+
+    The queries must only have equality filters, so each yields its keys in
+    key order. All of them are started before the first key is read, and
+    each fetches at most limit keys.
+    """
+    options = {'keys_only': True, 'batch_size': batch_size}
+    if limit:
+        options['limit'] = limit
+    streams = [q.iter(**options) for q in queries]
+    last = None
+    for key in heapq.merge(*streams):
+        if key != last:
+            yield key
+            last = key
+
+
+def fetchUnion(queries, limit=None):
+    """Return the entities matching any of the queries, in key order,
+    without duplicates; at most limit of them."""
+    keys = list(itertools.islice(mergeKeys(queries, limit), limit))
+    return [entity for entity in ndb.get_multi(keys) if entity]
+
+
+# - - - Benchmark - - - - - - - - - - - - - - - - - - - - - -
+
+def benchmark(value_counts=(1, 2, 5, 10, 20, 30), sessions=2000, limit=20,
+              repeat=3):
+    """Return (values, ndb IN seconds, fetchUnion seconds) per number of
+    highlights queried, over sessions carrying 3 of 30 highlights each."""
+    from models import Session
+    highlights = ['h%02d' % i for i in xrange(30)]
+    ndb.put_multi([
+        Session(name='s%d' % i,
+                highlights=[highlights[(i + j * 7) % 30] for j in xrange(3)])
+        for i in xrange(sessions)])
+
+    def timed(fn):
+        best = None
+        for _ in xrange(repeat):
+            ndb.get_context().clear_cache()
+            started = time.time()
+            fn()
+            elapsed = time.time() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    results = []
+    for n in value_counts:
+        values = highlights[:n]
+        builtin = timed(lambda: Session.query(
+            Session.highlights.IN(values)).fetch(limit))
+        union = timed(lambda: fetchUnion(
+            splitIn(Session.query(), Session.highlights, values), limit))
+        results.append((n, builtin, union))
+    return results
+
+
+def main(argv):
+    from google.appengine.datastore import datastore_stub_util
+    from google.appengine.ext import testbed
+    bed = testbed.Testbed()
+    bed.activate()
+    bed.init_datastore_v3_stub(
+        consistency_policy=datastore_stub_util.PseudoRandomHRConsistencyPolicy(
+            probability=1))
+    bed.init_memcache_stub()
+    try:
+        print '%8s %12s %12s' % ('values', 'ndb IN', 'fetchUnion')
+        for n, builtin, union in benchmark():
+            print '%8d %11.1fms %11.1fms' % (n, builtin * 1000, union * 1000)
+    finally:
+        bed.deactivate()
+
+
+if __name__ == '__main__':
+    main(sys.argv)
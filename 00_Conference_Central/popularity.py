@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+
+"""popularity.py
+
+Udacity conference server-side Python App Engine session popularity;
+sharded wishlist counters per session and an incrementally maintained
+list of the most wishlisted sessions per conference.
+
+"""
+
+import heapq
+import random
+import time
+
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+
+from models import SessionPopularityShard
+from models import TrendingSessions
+import sideeffects
+
+NUM_SHARDS = 20
+
+# sessions returned by trending(), and sessions tracked per conference;
+# the extra entries absorb sessions dropping out as their counts fall.
+TOP_N = 10
+TRACKED = 2 * TOP_N
+
+# seconds between writes of a conference's trending list to datastore.
+PERSIST_DELAY = 60
+PERSIST_TASK_URL = '/tasks/persist_trending'
+
+MEMCACHE_COUNT_KEY = 'POPULARITY:%s'
+MEMCACHE_TRENDING_KEY = 'TRENDING:%s'
+
+
+def _shardKeys(session_key):
+    wsk = session_key.urlsafe()
+    return [ndb.Key(SessionPopularityShard, '%s-%d' % (wsk, i))
+            for i in xrange(NUM_SHARDS)]
+
+
+@ndb.transactional
+def _incrementShard(shard_key, delta):
+    shard = shard_key.get() or SessionPopularityShard(key=shard_key)
+    shard.count += delta
+    shard.put()
+
+
+def count(session_key):
+    """Return the number of wishlists holding the session."""
+    cache_key = MEMCACHE_COUNT_KEY % session_key.urlsafe()
+    total = memcache.get(cache_key)
+    if total is None:
+        total = sum(shard.count for shard in
+                    ndb.get_multi(_shardKeys(session_key)) if shard)
+        memcache.add(cache_key, total)
+    return total
+
+
+def record(session_key, delta):
+    """Add delta to the session's wishlist count and update its
+    conference's trending list."""
+    _incrementShard(random.choice(_shardKeys(session_key)), delta)
+    cache_key = MEMCACHE_COUNT_KEY % session_key.urlsafe()
+    if delta >= 0:
+        total = memcache.incr(cache_key, delta)
+    else:
+        total = memcache.decr(cache_key, -delta)
+    if total is None:
+        total = count(session_key)
+    _updateTrending(session_key.parent(), session_key, total)
+
+
+def _load(conf_key):
+    """Return the stored trending list as [(count, session key)]."""
+    stored = TrendingSessions.get_by_id(conf_key.urlsafe())
+    if not stored:
+        return []
+    return zip(stored.counts, stored.sessions)
+
+
+def _updateTrending(conf_key, session_key, total):
+    cache_key = MEMCACHE_TRENDING_KEY % conf_key.urlsafe()
+    client = memcache.Client()
+    for _ in xrange(10):
+        entries = client.gets(cache_key)
+        if entries is None:
+            client.add(cache_key, _load(conf_key))
+            continue
+        entries = [e for e in entries if e[1] != session_key]
+        if total > 0:
+            entries.append((total, session_key))
+        entries = heapq.nlargest(TRACKED, entries)
+        if client.cas(cache_key, entries):
+            break
+    _schedulePersist(conf_key)
+
+
+def _schedulePersist(conf_key):
+    # one task per conference per PERSIST_DELAY window coalesces writes
+    window = int(time.time() / PERSIST_DELAY)
+    sideeffects.enqueue(PERSIST_TASK_URL, countdown=PERSIST_DELAY,
+                        name='trending-%s-%d' % (conf_key.urlsafe(), window),
+                        params={'conf_key': conf_key.urlsafe()})
+
+
+def persist(wsck):
+    """Write a conference's cached trending list to datastore."""
+    entries = memcache.get(MEMCACHE_TRENDING_KEY % wsck)
+    if entries is None:
+        return
+    TrendingSessions(id=wsck,
+                     counts=[c for c, _ in entries],
+                     sessions=[k for _, k in entries]).put()
+
+
+def trending(conf_key, limit=TOP_N):
+    """Return [(session key, count)] of the most wishlisted sessions of the
+    conference, most wishlisted first."""
+    cache_key = MEMCACHE_TRENDING_KEY % conf_key.urlsafe()
+    entries = memcache.get(cache_key)
+    if entries is None:
+        entries = _load(conf_key)
+        memcache.add(cache_key, entries)
+    return [(k, c) for c, k in heapq.nlargest(limit, entries)]
+
+
+def forget(session_keys, conf_key=None):
+    """Drop the counters of deleted sessions, and the trending list of a
+    deleted conference."""
+    shard_keys = []
+    for session_key in session_keys:
+        shard_keys.extend(_shardKeys(session_key))
+    if shard_keys:
+        ndb.delete_multi(shard_keys)
+        memcache.delete_multi([MEMCACHE_COUNT_KEY % k.urlsafe()
+                               for k in session_keys])
+    if conf_key:
+        ndb.Key(TrendingSessions, conf_key.urlsafe()).delete()
+        memcache.delete(MEMCACHE_TRENDING_KEY % conf_key.urlsafe())
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+
+"""ratelimit.py
+
+Udacity conference server-side Python App Engine admission control;
+per-instance concurrency limits and per-user token buckets for the write
+endpoints.
+
+"""
+
+import collections
+import functools
+import logging
+import math
+import threading
+import time
+
+import endpoints
+from google.appengine.api import memcache
+
+from models import TooManyRequestsException
+from utils import getUserId
+
+# endpoint name -> (tokens added per second, bucket size) per user
+LIMITS = {
+    'createConference':        (1 / 60.0, 5),
+    'createSession':           (1 / 6.0, 20),
+    'createSpeaker':           (1 / 6.0, 20),
+    'registerForConference':   (1 / 2.0, 10),
+    'unregisterFromConference': (1 / 2.0, 10),
+    'addSessionToWishlist':    (1.0, 30),
+    'deleteSessionInWishlist': (1.0, 30),
+}
+DEFAULT_LIMIT = (1.0, 10)
+
+# write requests allowed in flight on one instance at a time.
+MAX_CONCURRENT = 24
+
+MEMCACHE_BUCKET_KEY = 'RATELIMIT:%s:%s'
+MEMCACHE_REJECTED_KEY = 'RATELIMIT_REJECTED:%s:%s'
+
+# empty buckets remembered per instance; the least recently seen are
+# forgotten first, which only costs a memcache read when they are used again
+MAX_LOCAL_BUCKETS = 10000
+
+_lock = threading.Lock()
+_in_flight = [0]
+# bucket key -> (tokens, timestamp) of the buckets last seen empty in
+# memcache, least recently seen first
+_local = collections.OrderedDict()
+
+
+def _refill(state, rate, burst, now):
+    tokens, stamp = state
+    return min(burst, tokens + (now - stamp) * rate)
+
+
+def _remember(bucket_key, state):
+    """Keep the bucket's state on this instance while it is empty."""
+    with _lock:
+        _local.pop(bucket_key, None)
+        if state[0] < 1:
+            _local[bucket_key] = state
+            while len(_local) > MAX_LOCAL_BUCKETS:
+                _local.popitem(last=False)
+
+
+def _take(bucket_key, rate, burst):
+    """Take one token from the bucket; returns False if it is empty."""
+    now = time.time()
+
+    # a bucket that is empty on this instance's last view of it is empty
+    # in memcache too, as other instances only ever take tokens away
+    seen = _local.get(bucket_key)
+    if seen and _refill(seen, rate, burst, now) < 1:
+        return False
+
+    ttl = int(burst / rate) + 1
+    client = memcache.Client()
+    for _ in xrange(5):
+        state = client.gets(bucket_key)
+        if state is None:
+            if client.add(bucket_key, (burst - 1, now), time=ttl):
+                _remember(bucket_key, (burst - 1, now))
+                return True
+            continue
+        tokens = _refill(state, rate, burst, now)
+        if tokens < 1:
+            _remember(bucket_key, (tokens, now))
+            return False
+        if client.cas(bucket_key, (tokens - 1, now), time=ttl):
+            _remember(bucket_key, (tokens - 1, now))
+            return True
+    # fail open when memcache is unavailable or heavily contended
+    return True
+
+
+def _reject(name, reason, retry_after):
+    memcache.incr(MEMCACHE_REJECTED_KEY % (name, reason), initial_value=0)
+    logging.warning('%s rejected: %s', name, reason)
+    raise TooManyRequestsException(
+        'Too many requests, please try again later. Retry-After: %d'
+        % retry_after)
+
+
+def limited(name):
+    """Shed the decorated endpoint method's requests with a 503, through
+    TooManyRequestsException, when the instance is saturated or the caller
+    has exhausted its token bucket; the message says how many seconds to
+    wait before retrying."""
+    rate, burst = LIMITS.get(name, DEFAULT_LIMIT)
+    # seconds until an empty bucket has a token again
+    refill = int(math.ceil(1 / rate))
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(self, request):
+            with _lock:
+                admitted = _in_flight[0] < MAX_CONCURRENT
+                if admitted:
+                    _in_flight[0] += 1
+            if not admitted:
+                _reject(name, 'concurrency', 1)
+            try:
+                user = endpoints.get_current_user()
+                if user and not _take(
+                        MEMCACHE_BUCKET_KEY % (name, getUserId(user)),
+                        rate, burst):
+                    _reject(name, 'rate', refill)
+                return fn(self, request)
+            finally:
+                with _lock:
+                    _in_flight[0] -= 1
+        return wrapper
+    return decorator
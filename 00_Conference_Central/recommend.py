@@ -0,0 +1,353 @@
+#!/usr/bin/env python
+
+"""recommend.py
+
+Udacity conference server-side Python App Engine session recommendations;
+a batch job that counts how often sessions are wishlisted together and
+stores the top neighbors of every session.
+
+The session x session co-occurrence matrix is kept sparse as sorted int64
+pair codes (row << 32 | column) with a parallel array of counts, so it is
+built and reduced with vectorized NumPy operations only.
+
+The job runs as chained tasks. Each task counts the pairs of the next
+PROFILES_PER_TASK wishlists, stores its partial counts as
+RecommendationChunk children of the RecommendationJob and checkpoints the
+profile cursor; a last task merges the partial counts and stores the
+recommendations. Run the counting and merging locally, with the App
+Engine SDK and NumPy on the path, on generated wishlists with:
+
+    python recommend.py [PROFILES]
+
+"""
+
+import logging
+import StringIO
+import sys
+import time
+import uuid
+
+import numpy as np
+from google.appengine.api import taskqueue
+from google.appengine.datastore.datastore_query import Cursor
+from google.appengine.ext import ndb
+
+from models import Profile
+from models import RecommendationChunk
+from models import RecommendationJob
+from models import SessionRecommendations
+
+TOP_K = 10
+
+# sessions per wishlist taken into account; bounds the pairs a single
+# profile contributes to MAX_WISHLIST ** 2 / 2.
+MAX_WISHLIST = 200
+PROFILE_BATCH = 500
+# profile batches counted per task before its counts are stored and the
+# next task is chained
+BATCHES_PER_TASK = 20
+PROFILES_PER_TASK = PROFILE_BATCH * BATCHES_PER_TASK
+
+# pair codes buffered before they are reduced into the running counts.
+PAIR_BUFFER = 2000000
+PUT_BATCH = 200
+
+# bytes of serialized counts per RecommendationChunk, under the entity
+# size limit
+CHUNK_BYTES = 900 * 1024
+
+BUILD_TASK_URL = '/tasks/build_recommendations'
+
+
+def _reduce(codes, counts):
+    """Sum the counts of equal pair codes; returns sorted unique codes and
+    their counts."""
+    unique, inverse = np.unique(codes, return_inverse=True)
+    return unique, np.bincount(inverse, weights=counts).astype(np.int64)
+
+
+class _CoOccurrence(object):
+    """Sparse upper triangle of the session co-occurrence matrix."""
+
+    def __init__(self):
+        self.codes = np.zeros(0, dtype=np.int64)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self._pending = []
+        self._pending_size = 0
+
+    def addWishlist(self, columns):
+        columns = np.unique(np.asarray(columns[:MAX_WISHLIST],
+                                       dtype=np.int64))
+        if len(columns) < 2:
+            return
+        i, j = np.triu_indices(len(columns), 1)
+        self.addCounts((columns[i] << 32) | columns[j])
+
+    def addCounts(self, codes, counts=None):
+        """Add counts, one each by default, to the pairs of codes."""
+        if counts is None:
+            counts = np.ones(len(codes), dtype=np.int64)
+        self._pending.append((codes, counts))
+        self._pending_size += len(codes)
+        if self._pending_size >= PAIR_BUFFER:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        codes, counts = zip(*self._pending)
+        self._pending, self._pending_size = [], 0
+        self.codes, self.counts = _reduce(
+            np.concatenate((self.codes,) + codes),
+            np.concatenate((self.counts,) + counts))
+
+    def topNeighbors(self, k):
+        """Yield (row, [columns], [counts]) with each row's k largest
+        counts, largest first, over the symmetric matrix."""
+        self.flush()
+        if not len(self.codes):
+            return
+        a = self.codes >> 32
+        b = self.codes & 0xffffffff
+        rows = np.concatenate([a, b])
+        cols = np.concatenate([b, a])
+        counts = np.concatenate([self.counts, self.counts])
+
+        # order by row, then by descending count, then rank within the row
+        order = np.lexsort((cols, -counts, rows))
+        rows, cols, counts = rows[order], cols[order], counts[order]
+        starts = np.concatenate(
+            [[0], np.nonzero(np.diff(rows))[0] + 1, [len(rows)]])
+        for start, end in zip(starts[:-1], starts[1:]):
+            end = min(end, start + k)
+            yield rows[start], cols[start:end], counts[start:end]
+
+
+# - - - Partial counts - - - - - - - - - - - - - - - - - - - -
+
+def _dumpCounts(sessions, matrix):
+    """Serialize the counts of a matrix whose columns are the sessions
+    (websafe keys) given."""
+    matrix.flush()
+    out = StringIO.StringIO()
+    np.savez_compressed(out, sessions=np.array(sessions, dtype=str),
+                        codes=matrix.codes, counts=matrix.counts)
+    return out.getvalue()
+
+
+def _mergeCounts(dumps):
+    """Return ([websafe session keys], matrix) of the sum of serialized
+    partial counts, each with its own columns."""
+    columns = {}
+    sessions = []
+    matrix = _CoOccurrence()
+    for data in dumps:
+        part = np.load(StringIO.StringIO(data))
+        remap = np.zeros(len(part['sessions']), dtype=np.int64)
+        for i, wssk in enumerate(part['sessions'].tolist()):
+            if wssk not in columns:
+                columns[wssk] = len(sessions)
+                sessions.append(wssk)
+            remap[i] = columns[wssk]
+        codes = part['codes']
+        a, b = remap[codes >> 32], remap[codes & 0xffffffff]
+        matrix.addCounts((np.minimum(a, b) << 32) | np.maximum(a, b),
+                         part['counts'])
+    return sessions, matrix
+
+
+def _storeChunks(job, data):
+    ndb.put_multi([
+        RecommendationChunk(parent=job.key,
+                            id='%06d-%03d' % (job.sequence, i / CHUNK_BYTES),
+                            data=data[i:i + CHUNK_BYTES])
+        for i in xrange(0, len(data), CHUNK_BYTES)])
+
+
+def _loadChunks(job):
+    """Yield the serialized counts of every counting task of the job."""
+    sequence, pieces = None, []
+    for chunk in RecommendationChunk.query(ancestor=job.key):
+        chunk_sequence = chunk.key.id().split('-')[0]
+        if pieces and chunk_sequence != sequence:
+            yield ''.join(pieces)
+            pieces = []
+        sequence = chunk_sequence
+        pieces.append(chunk.data)
+    if pieces:
+        yield ''.join(pieces)
+
+
+# - - - Job - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def start():
+    """Create a recommendations job and enqueue its first task. Returns
+    the job."""
+    job = RecommendationJob(id=uuid.uuid4().hex)
+    job.put()
+    _enqueue(job)
+    return job
+
+
+def _enqueue(job):
+    # named per sequence so a retried task cannot chain its successor twice
+    try:
+        taskqueue.add(url=BUILD_TASK_URL,
+                      name='recommend-%s-%d' % (job.key.id(), job.sequence),
+                      params={'job': job.key.id()})
+    except (taskqueue.TaskAlreadyExistsError, taskqueue.TombstonedTaskError):
+        pass
+
+
+def _count(job, batches):
+    """Count the wishlists of up to `batches` profile batches from the
+    job's cursor, store the counts and checkpoint the cursor."""
+    columns = {}
+    sessions = []
+    matrix = _CoOccurrence()
+    cursor = Cursor(urlsafe=job.cursor) if job.cursor else None
+    profiles = 0
+    more = True
+    for _ in xrange(batches):
+        page, cursor, more = Profile.query().fetch_page(
+            PROFILE_BATCH, start_cursor=cursor)
+        for prof in page:
+            wishlist = []
+            for key in prof.wishlist().keys():
+                if key not in columns:
+                    columns[key] = len(sessions)
+                    sessions.append(key.urlsafe())
+                wishlist.append(columns[key])
+            matrix.addWishlist(wishlist)
+        profiles += len(page)
+        if not (more and cursor):
+            more = False
+            break
+
+    # the counts are stored before the checkpoint, under the task's
+    # sequence, so a retry overwrites them
+    if sessions:
+        _storeChunks(job, _dumpCounts(sessions, matrix))
+    job.cursor = cursor.urlsafe() if more else None
+    job.counted = not more
+    job.profiles += profiles
+    job.sequence += 1
+    job.put()
+
+
+def _merge(job, k):
+    """Merge the job's counts, store the top k neighbors of every
+    wishlisted session and drop the counts."""
+    sessions, matrix = _mergeCounts(_loadChunks(job))
+    written = set()
+    batch = []
+    for row, cols, counts in matrix.topNeighbors(k):
+        written.add(sessions[row])
+        batch.append(SessionRecommendations(
+            id=sessions[row],
+            sessions=[ndb.Key(urlsafe=sessions[c]) for c in cols],
+            scores=[int(c) for c in counts]))
+        if len(batch) >= PUT_BATCH:
+            ndb.put_multi(batch)
+            batch = []
+    if batch:
+        ndb.put_multi(batch)
+    # the recommendations of sessions this run found no neighbors for, e.g.
+    # deleted or no longer wishlisted ones, are left from earlier runs
+    ndb.delete_multi([key for key in SessionRecommendations.query().iter(
+        keys_only=True) if key.id() not in written])
+    ndb.delete_multi(RecommendationChunk.query(ancestor=job.key).fetch(
+        keys_only=True))
+
+    job.done = True
+    job.put()
+    logging.info('recommendations: %d profiles, %d sessions, %d pairs '
+                 'in %d tasks', job.profiles, len(sessions),
+                 len(matrix.codes), job.sequence)
+
+
+def run(job_id, k=TOP_K, batches=BATCHES_PER_TASK, chain=True):
+    """Count the next profiles of the job, or merge its counts once every
+    profile is counted, then chain the next task unless the job is
+    done."""
+    job = RecommendationJob.get_by_id(job_id)
+    if not job or job.done:
+        return job
+    if job.counted:
+        _merge(job, k)
+    else:
+        _count(job, batches)
+        if chain:
+            _enqueue(job)
+    return job
+
+
+def build(k=TOP_K):
+    """Run a whole recommendations job in this process, without tasks."""
+    job = RecommendationJob(id=uuid.uuid4().hex)
+    job.put()
+    while not job.done:
+        job = run(job.key.id(), k, chain=False)
+    return job
+
+
+def recommendations(session_key):
+    """Return the sessions recommended alongside a session, less those
+    deleted since the recommendations were built."""
+    stored = SessionRecommendations.get_by_id(session_key.urlsafe())
+    if not stored:
+        return []
+    return [sess for sess in ndb.get_multi(stored.sessions) if sess]
+
+
+# - - - Benchmark - - - - - - - - - - - - - - - - - - - - - -
+
+def benchmark(profiles=1000000, sessions=20000, mean_wishlist=8, k=TOP_K,
+              seed=0):
+    """Count and merge generated wishlists in PROFILES_PER_TASK parts, as
+    the job's tasks do, without the datastore. Returns [(phase, seconds)]
+    and the pairs and serialized bytes of the counts."""
+    rng = np.random.RandomState(seed)
+    # popular sessions are wishlisted far more often than the rest
+    weights = 1.0 / np.arange(1, sessions + 1)
+    weights /= weights.sum()
+    lengths = np.minimum(rng.poisson(mean_wishlist, profiles), MAX_WISHLIST)
+
+    timings = []
+    started = time.time()
+    dumps = []
+    for first in xrange(0, profiles, PROFILES_PER_TASK):
+        part = lengths[first:first + PROFILES_PER_TASK]
+        picks = rng.choice(sessions, part.sum(), p=weights)
+        # a part's columns are the sessions in the order first met
+        names, local = np.unique(picks, return_inverse=True)
+        matrix = _CoOccurrence()
+        offset = 0
+        for length in part:
+            matrix.addWishlist(local[offset:offset + length])
+            offset += length
+        dumps.append(_dumpCounts(['s%d' % n for n in names], matrix))
+    timings.append(('count', time.time() - started))
+
+    started = time.time()
+    names, matrix = _mergeCounts(dumps)
+    timings.append(('merge', time.time() - started))
+
+    started = time.time()
+    rows = sum(1 for _ in matrix.topNeighbors(k))
+    timings.append(('top %d of %d rows' % (k, rows), time.time() - started))
+    return timings, len(matrix.codes), sum(len(d) for d in dumps)
+
+
+def main(argv):
+    profiles = int(argv[1]) if len(argv) > 1 else 1000000
+    timings, pairs, size = benchmark(profiles)
+    print '%d profiles in %d tasks: %d pairs, %.1f MB of partial counts' % (
+        profiles, -(-profiles // PROFILES_PER_TASK), pairs,
+        size / 1024.0 / 1024)
+    for phase, secs in timings:
+        print '%-24s %8.1fs' % (phase, secs)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+
+"""replay.py
+
+Udacity conference server-side Python App Engine traffic replay; drives
+the endpoint requests of a capture, as downloaded from /admin/capture,
+against a development server at 1x to 50x their recorded pace, and reports
+throughput, latency and failures per endpoint, and the entities whose
+requests failed most, like a conference whose registration transactions
+collide.
+
+Start the development server, then replay a capture with:
+
+    python replay.py capture.ndjson [SPEED] [URL]
+
+Speakers, conferences and sessions are created first for the captured
+entity buckets to map onto, and every user bucket becomes a user of its
+own. Requests depend only on the capture, so replays of a capture send the
+same requests in the same order.
+
+"""
+
+import collections
+import json
+import sys
+import threading
+import time
+import urllib2
+
+SPI_PREFIX = '/_ah/spi/'
+API = 'ConferenceApi'
+
+MIN_SPEED = 1
+MAX_SPEED = 50
+
+# requests in flight at once; when all are taken, requests start late
+MAX_IN_FLIGHT = 64
+
+SEED_SPEAKERS = 10
+SEED_CONFERENCES = 20
+SEED_SESSIONS = 5           # per conference
+SEED_SEATS = 200
+
+# honoured by capture.middleware on the development server only
+USER_HEADER = 'X-Replay-User'
+
+Result = collections.namedtuple('Result', 'path status ms lag keys')
+
+
+def load(path):
+    """Return the captured endpoint requests, oldest first."""
+    envelopes = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                envelope = json.loads(line)
+                if envelope['p'].startswith(SPI_PREFIX):
+                    envelopes.append(envelope)
+    envelopes.sort(key=lambda e: e['t'])
+    return envelopes
+
+
+def call(url, method, body, user=None):
+    """Return (status, response) of an endpoint method call."""
+    headers = {'Content-Type': 'application/json'}
+    if user:
+        headers[USER_HEADER] = user
+    request = urllib2.Request('%s%s%s.%s' % (url, SPI_PREFIX, API, method),
+                              json.dumps(body or {}), headers)
+    try:
+        response = urllib2.urlopen(request)
+        return response.getcode(), json.loads(response.read() or '{}')
+    except urllib2.HTTPError as e:
+        return e.code, None
+    except urllib2.URLError:
+        return 0, None
+
+
+def _check(method, status, response):
+    if status != 200:
+        raise RuntimeError('seeding failed: %s returned %s' % (method, status))
+    return response
+
+
+def seed(url):
+    """Create the entities replayed requests refer to; return {kind:
+    [websafe keys]}."""
+    speakers = []
+    for i in xrange(SEED_SPEAKERS):
+        form = _check('createSpeaker', *call(url, 'createSpeaker', {
+            'speaker': 'Speaker %d' % i, 'organization': 'Replay'},
+            'replay-speakers@example.com'))
+        speakers.append(form['websafeSpeakerKey'])
+
+    conferences = []
+    sessions = []
+    for i in xrange(SEED_CONFERENCES):
+        organizer = 'replay-organizer-%d@example.com' % i
+        _check('createConference', *call(url, 'createConference', {
+            'name': 'Conference %d' % i, 'city': 'London',
+            'topics': ['Web Technologies'], 'startDate': '2030-06-01',
+            'endDate': '2030-06-03', 'maxAttendees': SEED_SEATS}, organizer))
+        created = _check('getConferencesCreated', *call(
+            url, 'getConferencesCreated', {}, organizer))
+        wsck = created['items'][0]['websafeKey']
+        conferences.append(wsck)
+        for j in xrange(SEED_SESSIONS):
+            form = _check('createSession', *call(url, 'createSession', {
+                'name': 'Session %d' % j, 'date': '2030-06-01',
+                'startTime': '%02d:00' % (9 + j), 'duration': 60,
+                'highlights': ['replay'],
+                'typeOfSession': ['Workshop' if j % 2 else 'Talk'],
+                'websafeSpeakerKey': speakers[(i + j) % len(speakers)],
+                'websafeConferenceKey': wsck}, organizer))
+            sessions.append(form['websafeSessionKey'])
+    return {'Speaker': speakers, 'Conference': conferences,
+            'Session': sessions}
+
+
+def resolve(value, seeds, keys=None):
+    """Return a captured payload with its placeholders filled in, adding
+    the key placeholders met to keys."""
+    if isinstance(value, dict):
+        return dict((k, resolve(v, seeds, keys))
+                    for k, v in value.iteritems())
+    if isinstance(value, list):
+        return [resolve(v, seeds, keys) for v in value]
+    if isinstance(value, basestring) and value.startswith('$'):
+        placeholder, _, arg = value[1:].partition(':')
+        if placeholder == 'str':
+            return 'x' * int(arg)
+        if placeholder == 'key':
+            if keys is not None:
+                keys.append(value)
+            kind, bucket = arg.rsplit(':', 1)
+            seeded = seeds.get(kind)
+            return seeded[int(bucket) % len(seeded)] if seeded else ''
+    return value
+
+
+def replay(url, envelopes, seeds, speed):
+    """Send the requests at speed times their captured pace; return
+    ([Result], seconds taken)."""
+    results = []
+    lock = threading.Lock()
+    slots = threading.BoundedSemaphore(MAX_IN_FLIGHT)
+    threads = []
+
+    def send(envelope, due):
+        try:
+            lag = time.time() - due
+            keys = []
+            body = resolve(envelope['b'], seeds, keys)
+            user = envelope['u']
+            if user is not None:
+                user = 'replay-%d@example.com' % user
+            method = envelope['p'][len(SPI_PREFIX):].rsplit('.', 1)[-1]
+            started = time.time()
+            status, _ = call(url, method, body, user)
+            result = Result(method, status, (time.time() - started) * 1000,
+                            lag * 1000, keys)
+            with lock:
+                results.append(result)
+        finally:
+            slots.release()
+
+    start = time.time()
+    first = envelopes[0]['t'] if envelopes else 0
+    for envelope in envelopes:
+        due = start + (envelope['t'] - first) / speed
+        delay = due - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        slots.acquire()
+        thread = threading.Thread(target=send, args=(envelope, due))
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    return results, time.time() - start
+
+
+def _percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def _failed(status):
+    # server errors, conflicts and requests that got no response; rate
+    # limited requests were turned away before doing any work
+    return status == 0 or status == 409 or status >= 500
+
+
+def report(envelopes, results, elapsed, speed):
+    """Return the report lines of a replay."""
+    span = (envelopes[-1]['t'] - envelopes[0]['t']) / speed
+    lines = ['%d requests at %gx: offered over %.1fs, done in %.1fs '
+             '(%.1f/s), started up to %dms late' % (
+                 len(results), speed, span, elapsed,
+                 len(results) / elapsed if elapsed else 0,
+                 max([r.lag for r in results] or [0])), '']
+
+    by_path = collections.defaultdict(list)
+    for r in results:
+        by_path[r.path].append(r)
+    lines.append('%-32s %6s %8s %8s %7s  %s' % (
+        'endpoint', 'count', 'p50', 'p95', 'failed', 'statuses'))
+    for path in sorted(by_path):
+        rs = by_path[path]
+        ms = [r.ms for r in rs]
+        statuses = collections.Counter(r.status for r in rs)
+        lines.append('%-32s %6d %6dms %6dms %7d  %s' % (
+            path, len(rs), _percentile(ms, .5), _percentile(ms, .95),
+            sum(1 for r in rs if _failed(r.status)),
+            ' '.join('%s:%d' % s for s in sorted(statuses.items()))))
+
+    hotspots = collections.Counter()
+    for r in results:
+        if _failed(r.status):
+            hotspots.update(set(r.keys))
+    if hotspots:
+        lines.append('')
+        lines.append('entities with most failed requests:')
+        for key, failed in hotspots.most_common(10):
+            lines.append('  %-32s %6d' % (key[1:], failed))
+    return lines
+
+
+def main(argv):
+    if len(argv) < 2:
+        print 'usage: python replay.py CAPTURE [SPEED] [URL]'
+        return 2
+    speed = float(argv[2]) if len(argv) > 2 else MIN_SPEED
+    if not MIN_SPEED <= speed <= MAX_SPEED:
+        print 'SPEED must be between %d and %d' % (MIN_SPEED, MAX_SPEED)
+        return 2
+    url = (argv[3] if len(argv) > 3 else 'http://localhost:8080').rstrip('/')
+
+    envelopes = load(argv[1])
+    if not envelopes:
+        print 'no endpoint requests in %s' % argv[1]
+        return 1
+    seeds = seed(url)
+    results, elapsed = replay(url, envelopes, seeds, speed)
+    print '\n'.join(report(envelopes, results, elapsed, speed))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
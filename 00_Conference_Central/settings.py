@@ -14,3 +14,12 @@ created/forked from conference.py by wesc on 2014 may 24
 # Console or Cloud Console.
 WEB_CLIENT_ID = '181286731273-elkv32br8l7e51clt2rad6vfai4oav3d.apps.googleusercontent.com'
 
+# Emails of the users allowed to delete speakers, which are shared by the
+# sessions of every organizer.
+ADMIN_EMAILS = []
+
+# Bearer tokens of the machine clients allowed to use the bulk sync route.
+SYNC_TOKENS = []
+
+# Fraction of requests recorded by capture.py for replay; 0 turns it off.
+CAPTURE_RATE = 0.0
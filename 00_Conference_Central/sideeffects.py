@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+
+"""sideeffects.py
+
+Udacity conference server-side Python App Engine side-effect dispatcher;
+collects the tasks enqueued while handling a request and adds them with
+batched asynchronous calls when the request ends, or transactionally with
+the write transaction they belong to.
+
+"""
+
+import logging
+import threading
+
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+# tasks per add call, the task queue's limit
+MAX_BATCH = 100
+
+_local = threading.local()
+
+
+def enqueue(url, params=None, queue_name='default', name=None, **options):
+    """Add a task to run url.
+
+    Inside a transaction the task is added transactionally, so it runs if
+    and only if the transaction commits. Otherwise it is buffered until the
+    end of the request, or added at once outside a request. Named tasks
+    cannot be transactional and are always buffered; adding a name already
+    in use is not an error.
+    """
+    task = taskqueue.Task(url=url, params=params, name=name, **options)
+    if name is None and ndb.in_transaction():
+        taskqueue.Queue(queue_name).add(task, transactional=True)
+        return
+    pending = getattr(_local, 'pending', None)
+    if pending is None:
+        _wait([taskqueue.Queue(queue_name).add_async(task)])
+    else:
+        pending.append((queue_name, task))
+
+
+def _wait(rpcs):
+    for rpc in rpcs:
+        try:
+            rpc.get_result()
+        except (taskqueue.TaskAlreadyExistsError,
+                taskqueue.TombstonedTaskError):
+            pass
+        except taskqueue.Error:
+            logging.exception('adding buffered tasks failed')
+
+
+def flush():
+    """Add the buffered tasks: unnamed ones in one batch per queue, named
+    ones on their own so a duplicate name cannot fail a batch."""
+    pending = getattr(_local, 'pending', None) or []
+    _local.pending = []
+    batches = {}
+    rpcs = []
+    for queue_name, task in pending:
+        if task.name:
+            rpcs.append(taskqueue.Queue(queue_name).add_async(task))
+        else:
+            batches.setdefault(queue_name, []).append(task)
+    for queue_name, tasks in batches.iteritems():
+        for i in xrange(0, len(tasks), MAX_BATCH):
+            rpcs.append(taskqueue.Queue(queue_name).add_async(
+                tasks[i:i + MAX_BATCH]))
+    _wait(rpcs)
+
+
+def middleware(app):
+    """Wrap a WSGI app so the tasks enqueued by each request are added
+    when it ends, whether or not it failed."""
+    def dispatching_app(environ, start_response):
+        if getattr(_local, 'pending', None) is not None:
+            # already inside a dispatching app
+            return app(environ, start_response)
+        _local.pending = []
+        try:
+            return app(environ, start_response)
+        finally:
+            try:
+                flush()
+            finally:
+                _local.pending = None
+    return dispatching_app
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+
+"""swrcache.py
+
+Udacity conference server-side Python App Engine memcache access layer;
+soft TTLs with stale-while-revalidate, single-flight recomputation behind
+a memcache lease, and background refresh through a task.
+
+Cached values are grouped by prefix. Each prefix is registered with a
+function that recomputes the value for an argument, so that a value can
+be rebuilt on a miss or refreshed by a task. The memcache key of a value
+is the prefix, or 'prefix:arg' when an argument is given.
+
+"""
+
+import collections
+import logging
+import threading
+import time
+
+from google.appengine.api import memcache
+
+import sideeffects
+
+REFRESH_TASK_URL = '/tasks/refresh_cache'
+
+# values are kept in memcache for HARD_TTL_FACTOR soft TTLs so they can
+# still be served, stale, while they are being refreshed.
+HARD_TTL_FACTOR = 24
+LEASE_SECONDS = 30
+
+# polls, and seconds between them, while waiting on another request's
+# recomputation of a missing value.
+MISS_WAIT_POLLS = 5
+MISS_WAIT_SECONDS = 0.1
+
+# last values kept per instance to serve on a miss; the least recently
+# seen are forgotten first, and are recomputed if memcache lost them too
+MAX_STALE = 1000
+
+# prefix -> (function(arg), soft ttl in seconds)
+_registry = {}
+_lock = threading.Lock()
+# memcache key -> last value seen by this instance, least recently seen
+# first
+_stale = collections.OrderedDict()
+
+
+def register(prefix, fn, soft_ttl):
+    """Register fn(arg) as the recomputation of the values of prefix."""
+    _registry[prefix] = (fn, soft_ttl)
+
+
+def key(prefix, arg=''):
+    """Return the memcache key of a value."""
+    return '%s:%s' % (prefix, arg) if arg else prefix
+
+
+def _keepStale(cache_key, value):
+    with _lock:
+        _stale.pop(cache_key, None)
+        _stale[cache_key] = value
+        while len(_stale) > MAX_STALE:
+            _stale.popitem(last=False)
+
+
+def _leaseKey(cache_key):
+    return 'LEASE:' + cache_key
+
+
+def _lease(cache_key):
+    """Take the recomputation lease of a value; only one holder at a time."""
+    return memcache.add(_leaseKey(cache_key), 1, time=LEASE_SECONDS)
+
+
+def put(prefix, arg, value):
+    """Store a fresh value."""
+    _, soft_ttl = _registry[prefix]
+    cache_key = key(prefix, arg)
+    memcache.set(cache_key,
+                 {'value': value, 'freshUntil': time.time() + soft_ttl},
+                 time=soft_ttl * HARD_TTL_FACTOR)
+    _keepStale(cache_key, value)
+
+
+def delete(prefix, arg=''):
+    """Drop a value, e.g. when its source data is deleted."""
+    cache_key = key(prefix, arg)
+    memcache.delete(cache_key)
+    with _lock:
+        _stale.pop(cache_key, None)
+
+
+def peek(prefix, arg=''):
+    """Return the cached value, fresh or stale, without any recomputation."""
+    envelope = memcache.get(key(prefix, arg))
+    return envelope['value'] if isinstance(envelope, dict) else None
+
+
+def refresh(prefix, arg=''):
+    """Recompute and store a value, releasing its lease. Returns the
+    value."""
+    fn, _ = _registry[prefix]
+    try:
+        value = fn(arg)
+        put(prefix, arg, value)
+        return value
+    finally:
+        memcache.delete(_leaseKey(key(prefix, arg)))
+
+
+def _scheduleRefresh(prefix, arg):
+    sideeffects.enqueue(REFRESH_TASK_URL,
+                        params={'prefix': prefix, 'arg': arg})
+
+
+def resolve(prefix, arg, envelope, compute_on_miss=True):
+    """Return the value for an envelope read from memcache.
+
+    A stale value is served while one task refreshes it. On a miss the
+    lease holder recomputes the value inline while other callers wait for
+    it, or serve this instance's last known value if they have one. With
+    compute_on_miss False a miss is only refreshed in the background and
+    None is served if no value is known.
+    """
+    cache_key = key(prefix, arg)
+    if not isinstance(envelope, dict):
+        # absent, or written before this layer existed
+        envelope = None
+    if envelope is not None:
+        _keepStale(cache_key, envelope['value'])
+        if envelope['freshUntil'] < time.time() and _lease(cache_key):
+            _scheduleRefresh(prefix, arg)
+        return envelope['value']
+
+    if cache_key in _stale or not compute_on_miss:
+        if _lease(cache_key):
+            _scheduleRefresh(prefix, arg)
+        return _stale.get(cache_key)
+
+    if _lease(cache_key):
+        return refresh(prefix, arg)
+    for _ in xrange(MISS_WAIT_POLLS):
+        time.sleep(MISS_WAIT_SECONDS)
+        envelope = memcache.get(cache_key)
+        if isinstance(envelope, dict):
+            return envelope['value']
+    logging.warning('swrcache: computing %s without the lease', cache_key)
+    fn, _ = _registry[prefix]
+    return fn(arg)
+
+
+def get(prefix, arg=''):
+    """Return a value, recomputing it inline only if it is missing and
+    no stale copy is known."""
+    return resolve(prefix, arg, memcache.get(key(prefix, arg)))
+
+
+def get_multi(prefix, args):
+    """Return {arg: value} for several values with one memcache round
+    trip; missing values are refreshed in the background."""
+    envelopes = memcache.get_multi([key(prefix, arg) for arg in args])
+    return dict((arg, resolve(prefix, arg, envelopes.get(key(prefix, arg)),
+                              compute_on_miss=False))
+                for arg in args)
@@ -0,0 +1,19 @@
+"""Tests of the conference app, run from this directory with the App
+Engine SDK installed or its location in GAE_SDK:
+
+    python -m unittest discover -s tests -t .
+
+"""
+
+import os
+import sys
+
+_sdk = os.environ.get('GAE_SDK')
+if _sdk and _sdk not in sys.path:
+    sys.path.insert(0, _sdk)
+
+import dev_appserver
+dev_appserver.fix_sys_path()
+
+# the Endpoints API server reads it when conference.py is imported
+os.environ.setdefault('CURRENT_VERSION_ID', 'testbed.1')
@@ -0,0 +1,104 @@
+"""Shared test case running against the App Engine service stubs."""
+
+import os
+import unittest
+
+from google.appengine.datastore import datastore_stub_util
+from google.appengine.ext import ndb
+from google.appengine.ext import testbed
+
+from models import Conference
+from models import ConferenceDetail
+from models import Profile
+from models import Session
+from models import Speaker
+from models import StartTime
+import dashboard
+
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TestCase(unittest.TestCase):
+    """Activates a testbed with the datastore, memcache, task queue and
+    urlfetch stubs. The datastore is strongly consistent and, like
+    production, fails queries index.yaml has no index for."""
+
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.setup_env(current_version_id='testbed.1',
+                               overwrite=True)
+        self.testbed.init_datastore_v3_stub(
+            consistency_policy=datastore_stub_util.
+            PseudoRandomHRConsistencyPolicy(probability=1),
+            require_indexes=True, root_path=APP_ROOT)
+        self.testbed.init_memcache_stub()
+        self.testbed.init_taskqueue_stub(root_path=APP_ROOT)
+        self.testbed.init_urlfetch_stub()
+        self.taskqueue = self.testbed.get_stub(testbed.TASKQUEUE_SERVICE_NAME)
+        ndb.get_context().set_cache_policy(False)
+        ndb.get_context().clear_cache()
+
+    def tearDown(self):
+        for name in ('ENDPOINTS_AUTH_EMAIL', 'ENDPOINTS_AUTH_DOMAIN'):
+            os.environ.pop(name, None)
+        self.testbed.deactivate()
+
+    def login(self, email):
+        """Make the following endpoint calls as the given user."""
+        os.environ['ENDPOINTS_AUTH_EMAIL'] = email
+        os.environ['ENDPOINTS_AUTH_DOMAIN'] = 'gmail.com'
+
+    def patch(self, module, name, value):
+        """Set a module attribute for the rest of the test."""
+        original = getattr(module, name)
+        setattr(module, name, value)
+        self.addCleanup(setattr, module, name, original)
+
+    def tasks(self, url=None, queue_name='default'):
+        """Return the tasks waiting in a push queue, optionally for url."""
+        return [t for t in self.taskqueue.get_filtered_tasks(
+            queue_names=[queue_name]) if url is None or t.url == url]
+
+    # - - - fixtures, written directly to the datastore - - - -
+
+    def makeProfile(self, email='user@example.com', **fields):
+        fields.setdefault('displayName', email.split('@')[0])
+        prof = Profile(id=email, mainEmail=email, **fields)
+        prof.put()
+        return prof
+
+    def makeConference(self, organizer='organizer@example.com',
+                       description='', **fields):
+        prof_key = ndb.Key(Profile, organizer)
+        if not prof_key.get():
+            self.makeProfile(organizer)
+        fields.setdefault('name', 'Conference')
+        fields.setdefault('maxAttendees', 100)
+        fields.setdefault('seatsAvailable', fields['maxAttendees'])
+        conf = Conference(parent=prof_key, organizerUserId=organizer,
+                          **fields)
+        conf.put()
+        ndb.put_multi([ConferenceDetail(key=conf.detailKey(),
+                                        description=description),
+                       dashboard.initialStats(conf)])
+        return conf
+
+    def makeSpeaker(self, name='Ada Lovelace', organization='Analytical'):
+        speaker = Speaker(speaker=name, organization=organization)
+        speaker.put()
+        return speaker
+
+    def makeSession(self, conf, speaker=None, hour=9, minute=0, **fields):
+        fields.setdefault('name', 'Session')
+        fields.setdefault('duration', 60)
+        session = Session(parent=conf.key, speaker=speaker,
+                          startTime=StartTime(hour=hour, minute=minute),
+                          **fields)
+        session.put()
+        return session
+
+
+def request(container, **fields):
+    """Return the request message of an endpoint's ResourceContainer."""
+    return container.combined_message_class(**fields)
@@ -0,0 +1,146 @@
+"""Personal agenda: session intervals, conflicts and the getAgenda
+endpoint."""
+
+import datetime
+
+from google.appengine.api import memcache
+from protorpc import message_types
+
+from agenda import MEMCACHE_AGENDA_KEY
+from conference import ConferenceApi
+from conference import SESS_GET_REQUEST
+import agenda
+from models import StartTime
+from tests import base
+
+USER = 'user@example.com'
+DAY = datetime.date(2030, 6, 4)
+
+
+def at(hour, minute=0):
+    return datetime.datetime.combine(DAY, datetime.time(hour, minute))
+
+
+def pairs(conflicts):
+    return set(frozenset(pair) for pair in conflicts)
+
+
+class IntervalTest(base.TestCase):
+
+    def testSessionWithoutDateHasNoInterval(self):
+        sess = self.makeSession(self.makeConference())
+        self.assertEqual(None, agenda.interval(sess))
+
+    def testSessionWithoutTimeStartsAtMidnight(self):
+        sess = self.makeSession(self.makeConference(), date=DAY, duration=30)
+        sess.startTime = None
+        self.assertEqual((at(0), at(0, 30)), agenda.interval(sess))
+
+    def testDurationInMinutes(self):
+        sess = self.makeSession(self.makeConference(), hour=9, minute=15,
+                                date=DAY, duration=90)
+        self.assertEqual((at(9, 15), at(10, 45)), agenda.interval(sess))
+
+    def testMissingHourAndDuration(self):
+        sess = self.makeSession(self.makeConference(), date=DAY,
+                                duration=None)
+        sess.startTime = StartTime(minute=30)
+        self.assertEqual((at(0, 30), at(0, 30)), agenda.interval(sess))
+
+
+class FindConflictsTest(base.TestCase):
+
+    def testOverlap(self):
+        self.assertEqual(pairs([('a', 'b')]), pairs(agenda.findConflicts(
+            [(at(9), at(10), 'a'), (at(9, 30), at(11), 'b')])))
+
+    def testTouchingIntervalsDoNotConflict(self):
+        self.assertEqual([], agenda.findConflicts(
+            [(at(10), at(11), 'b'), (at(9), at(10), 'a'),
+             (at(11), at(12), 'c')]))
+
+    def testNestedAndEqualIntervals(self):
+        self.assertEqual(
+            pairs([('a', 'b'), ('a', 'c'), ('b', 'c')]),
+            pairs(agenda.findConflicts(
+                [(at(9), at(12), 'a'), (at(10), at(11), 'b'),
+                 (at(10), at(11), 'c'), (at(12), at(13), 'd')])))
+
+    def testEachPairOnce(self):
+        conflicts = agenda.findConflicts(
+            [(at(9), at(11), 'a'), (at(9, 30), at(11), 'b'),
+             (at(10), at(11), 'c')])
+        self.assertEqual(3, len(conflicts))
+        self.assertEqual(3, len(pairs(conflicts)))
+
+    def testMatchesPairwise(self):
+        # benchmark() checks the sweep against comparing every pair
+        [(_, conflicts, _, _)] = agenda.benchmark(sizes=(200,), days=2)
+        self.assertTrue(conflicts)
+
+
+class GetAgendaTest(base.TestCase):
+
+    def setUp(self):
+        super(GetAgendaTest, self).setUp()
+        self.api = ConferenceApi()
+        self.speaker = self.makeSpeaker()
+        self.login(USER)
+
+    def _session(self, conf, hour, minute=0, **fields):
+        fields.setdefault('date', DAY)
+        return self.makeSession(conf, self.speaker, hour, minute, **fields)
+
+    def _agenda(self):
+        return self.api.getAgenda(message_types.VoidMessage())
+
+    def _keys(self, form):
+        return [item.websafeSessionKey for item in form.items]
+
+    def testIncludesSessionsOfRegisteredConferences(self):
+        attended = self.makeConference(name='Attended')
+        other = self.makeConference(name='Other')
+        late = self._session(attended, 14)
+        early = self._session(attended, 9)
+        wished = self._session(other, 11)
+        undated = self._session(other, 8, date=None)
+        self._session(other, 12)
+        self.makeProfile(USER, conferenceKeysToAttend=[attended.key],
+                         wishList=[undated.key, wished.key, early.key])
+
+        form = self._agenda()
+        self.assertEqual([s.key.urlsafe() for s in (early, wished, late,
+                                                    undated)],
+                         self._keys(form))
+        self.assertEqual([attended.key.urlsafe()],
+                         form.registeredConferenceKeys)
+        self.assertEqual(set(s.key.urlsafe() for s in (undated, wished,
+                                                       early)),
+                         set(form.wishlistSessionKeys))
+
+    def testConflictsAcrossWishlistAndRegistrations(self):
+        attended = self.makeConference(name='Attended')
+        other = self.makeConference(name='Other')
+        self._session(attended, 9, duration=60)
+        touching = self._session(attended, 10, duration=60)
+        overlapping = self._session(other, 10, 30, duration=60)
+        self._session(attended, 13, date=None)
+        self.makeProfile(USER, conferenceKeysToAttend=[attended.key],
+                         wishList=[overlapping.key])
+
+        form = self._agenda()
+        self.assertEqual(
+            pairs([(touching.key.urlsafe(), overlapping.key.urlsafe())]),
+            pairs((c.websafeSessionKey, c.conflictingSessionKey)
+                  for c in form.conflicts))
+
+    def testCachedUntilTheWishlistChanges(self):
+        conf = self.makeConference()
+        sess = self._session(conf, 9)
+        self.makeProfile(USER)
+        self.assertEqual([], self._agenda().items)
+        self.assertTrue(memcache.get(MEMCACHE_AGENDA_KEY % USER))
+
+        self.api.addSessionToWishlist(base.request(
+            SESS_GET_REQUEST, websafeSessionKey=sess.key.urlsafe()))
+        self.assertEqual([sess.key.urlsafe()], self._keys(self._agenda()))
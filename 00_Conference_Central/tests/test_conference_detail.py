@@ -0,0 +1,70 @@
+"""Conference descriptions: kept off the list path, read on the detail
+endpoint."""
+
+from conference import CONF_GET_REQUEST
+from conference import ConferenceApi
+from models import ConferenceDetail
+from models import ConferenceQueryForms
+from models import MigrationShard
+import migrations
+from tests import base
+
+
+class ConferenceDetailTest(base.TestCase):
+
+    def setUp(self):
+        super(ConferenceDetailTest, self).setUp()
+        self.api = ConferenceApi()
+
+    def _detail(self, conf):
+        return self.api.getConference(base.request(
+            CONF_GET_REQUEST, websafeConferenceKey=conf.key.urlsafe()))
+
+    def testListOmitsHeavyFields(self):
+        self.makeConference(description='A long description',
+                            topics=['Python'])
+        [item] = self.api.queryConferences(ConferenceQueryForms()).items
+        self.assertEqual(None, item.description)
+        self.assertEqual([], item.topics)
+
+    def testDetailReadsTheChild(self):
+        conf = self.makeConference(description='A long description',
+                                   topics=['Python'])
+        form = self._detail(conf).conference
+        self.assertEqual('A long description', form.description)
+        self.assertEqual(['Python'], form.topics)
+        self.assertEqual(ConferenceDetail.keyFor(conf.key), conf.detailKey())
+
+    def testLegacyDescriptionServedUntilMigrated(self):
+        conf = self.makeConference()
+        conf.detailKey().delete()
+        conf.legacyDescription = 'Stored inline'
+        conf.put()
+        self.assertEqual('Stored inline',
+                         self._detail(conf).conference.description)
+
+        self.assertEqual(1, migrations._migrateGroup(
+            [conf.key], migrations.conferenceDetails).get_result())
+        self.assertEqual(None, conf.key.get().legacyDescription)
+        self.assertEqual('Stored inline', conf.detailKey().get().description)
+        self.assertEqual('Stored inline',
+                         self._detail(conf).conference.description)
+
+    def testShardMigratesConcurrently(self):
+        confs = []
+        for i in xrange(5):
+            conf = self.makeConference(name='Conference %d' % i)
+            conf.detailKey().delete()
+            conf.legacyDescription = 'Description %d' % i
+            conf.put()
+            confs.append(conf)
+        MigrationShard(id='run-0', migration='conference_details',
+                       run='run').put()
+
+        shard = migrations.migrate_shard('run-0')
+        self.assertTrue(shard.done)
+        self.assertEqual((5, 5), (shard.processed, shard.updated))
+        for i, conf in enumerate(confs):
+            self.assertEqual(None, conf.key.get().legacyDescription)
+            self.assertEqual('Description %d' % i,
+                             conf.detailKey().get().description)
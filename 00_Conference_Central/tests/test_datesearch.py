@@ -0,0 +1,99 @@
+"""Date-range conference search over ISO week buckets."""
+
+import datetime
+
+import endpoints
+
+from conference import ConferenceApi
+from models import DateRangeQueryForm
+from models import isoWeeks
+import datesearch
+from tests import base
+
+
+def day(month, dom, year=2030):
+    return datetime.date(year, month, dom)
+
+
+class IsoWeeksTest(base.TestCase):
+
+    def testSpansYearBoundary(self):
+        self.assertEqual(['2026-W53', '2027-W01'],
+                         isoWeeks(day(12, 31, 2026), day(1, 4, 2027)))
+
+    def testSingleDayAndMissingDates(self):
+        self.assertEqual(['2030-W24'], isoWeeks(day(6, 10)))
+        self.assertEqual([], isoWeeks(None))
+
+
+class DateSearchTest(base.TestCase):
+
+    def _conference(self, name, start, end=None):
+        return self.makeConference(name=name, startDate=start, endDate=end)
+
+    def _search(self, start, end, page_size=20):
+        """Return the names of all matches, reading page by page."""
+        names, token, pages = [], None, 0
+        while True:
+            confs, token = datesearch.search(start, end, page_size, token)
+            names.extend(conf.name for conf in confs)
+            pages += 1
+            if not token:
+                return names, pages
+
+    def testOverlappingConferencesOnce(self):
+        self._conference('inside', day(6, 12), day(6, 13))
+        self._conference('spanning', day(6, 1), day(6, 30))
+        self._conference('touching start', day(6, 5), day(6, 10))
+        self._conference('touching end', day(6, 20), day(6, 22))
+        self._conference('no end date', day(6, 15))
+        # in the window's first and last weeks, but not on its days
+        self._conference('before', day(6, 9))
+        self._conference('after', day(6, 21), day(6, 23))
+
+        names, _ = self._search(day(6, 10), day(6, 20))
+        self.assertEqual(sorted(['inside', 'spanning', 'touching start',
+                                 'touching end', 'no end date']),
+                         sorted(names))
+
+    def testPagesAcrossWeeks(self):
+        for i in xrange(7):
+            self._conference('c%d' % i, day(6, 3) + datetime.timedelta(
+                days=4 * i))
+        names, pages = self._search(day(6, 1), day(6, 30), page_size=2)
+        self.assertEqual(sorted('c%d' % i for i in xrange(7)), sorted(names))
+        self.assertTrue(pages >= 4)
+
+    def testMatchesScan(self):
+        [(_, _, matches, _, _, _, _)] = datesearch.benchmark(
+            years=(2,), per_year=100)
+        self.assertTrue(matches)
+
+    def testInvalidPageToken(self):
+        self.assertRaises(ValueError, datesearch.search, day(6, 1),
+                          day(6, 2), 10, 'x:y')
+
+
+class SearchEndpointTest(base.TestCase):
+
+    def setUp(self):
+        super(SearchEndpointTest, self).setUp()
+        self.api = ConferenceApi()
+
+    def testReturnsPageAndToken(self):
+        for i in xrange(3):
+            self.makeConference(name='c%d' % i, startDate=day(6, 10))
+        form = self.api.searchConferencesByDate(DateRangeQueryForm(
+            startDate='2030-06-10', endDate='2030-06-10', pageSize=2))
+        self.assertEqual(2, len(form.items))
+        self.assertTrue(form.nextPageToken)
+
+    def testRejectsBadRequests(self):
+        for request in (
+                DateRangeQueryForm(startDate='2030-06-10', endDate='2030-06-01'),
+                DateRangeQueryForm(startDate='June'),
+                DateRangeQueryForm(startDate='2030-01-01',
+                                   endDate='2031-06-01'),
+                DateRangeQueryForm(startDate='2030-06-10', pageToken='x:y')):
+            self.assertRaises(endpoints.BadRequestException,
+                              self.api.searchConferencesByDate, request)
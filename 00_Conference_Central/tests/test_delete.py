@@ -0,0 +1,64 @@
+"""Delete endpoints: who may delete conferences, sessions and speakers."""
+
+import endpoints
+
+from conference import CONF_GET_REQUEST
+from conference import ConferenceApi
+from conference import SESS_GET_REQUEST
+from conference import SPEAKER_GET_REQUEST
+from models import ConflictException
+import conference
+from tests import base
+
+ADMIN = 'admin@example.com'
+ORGANIZER = 'organizer@example.com'
+
+
+class DeleteTest(base.TestCase):
+
+    def setUp(self):
+        super(DeleteTest, self).setUp()
+        self.api = ConferenceApi()
+        self.patch(conference, 'ADMIN_EMAILS', [ADMIN])
+        self.speaker = self.makeSpeaker()
+        self.conf = self.makeConference(ORGANIZER)
+
+    def _deleteSpeaker(self):
+        return self.api.deleteSpeaker(base.request(
+            SPEAKER_GET_REQUEST, websafeSpeakerKey=self.speaker.key.urlsafe()))
+
+    def testOnlyAdminsDeleteSpeakers(self):
+        for user in (ORGANIZER, 'user@example.com'):
+            self.login(user)
+            self.assertRaises(endpoints.ForbiddenException,
+                              self._deleteSpeaker)
+        self.assertTrue(self.speaker.key.get())
+
+        self.login(ADMIN)
+        self.assertTrue(self._deleteSpeaker().data)
+        self.assertEqual(None, self.speaker.key.get())
+
+    def testSpeakerWithSessionsIsKept(self):
+        self.makeSession(self.conf, self.speaker)
+        self.login(ADMIN)
+        self.assertRaises(ConflictException, self._deleteSpeaker)
+        self.assertTrue(self.speaker.key.get())
+
+    def testOnlyOrganizerDeletesConferenceAndSessions(self):
+        session = self.makeSession(self.conf, self.speaker)
+        conf_request = base.request(
+            CONF_GET_REQUEST, websafeConferenceKey=self.conf.key.urlsafe())
+        session_request = base.request(
+            SESS_GET_REQUEST, websafeSessionKey=session.key.urlsafe())
+
+        self.login(ADMIN)
+        self.assertRaises(endpoints.ForbiddenException,
+                          self.api.deleteSession, session_request)
+        self.assertRaises(endpoints.ForbiddenException,
+                          self.api.deleteConference, conf_request)
+
+        self.login(ORGANIZER)
+        self.assertTrue(self.api.deleteSession(session_request).data)
+        self.assertTrue(self.api.deleteConference(conf_request).data)
+        self.assertEqual([None, None],
+                         [session.key.get(), self.conf.key.get()])
@@ -0,0 +1,87 @@
+"""Bulk export: chained tasks, checkpointed cursors, formats and sinks."""
+
+import csv
+import json
+import os
+import shutil
+import tempfile
+
+from models import ExportChunk
+import export
+from tests import base
+
+
+class ExportTest(base.TestCase):
+
+    def setUp(self):
+        super(ExportTest, self).setUp()
+        self.patch(export, 'BATCH_SIZE', 2)
+        self.speakers = [self.makeSpeaker('Speaker %d' % i, 'Org')
+                         for i in xrange(5)]
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.path = os.path.join(self.dir, 'export')
+
+    def _runTasks(self, batches):
+        """Run the job's chained tasks from the queue, one at a time."""
+        runs = 0
+        while True:
+            tasks = self.tasks(export.EXPORT_TASK_URL)
+            if not tasks:
+                return runs
+            self.taskqueue.DeleteTask('default', tasks[0].name)
+            export.run(tasks[0].extract_params()['job'], batches=batches)
+            runs += 1
+
+    def testChainedTasksExportEveryEntityOnce(self):
+        job = export.start(['Speaker'], sink='file', target=self.path)
+        # three batches of two, one batch per task
+        self.assertEqual(3, self._runTasks(batches=1))
+
+        job = job.key.get()
+        self.assertTrue(job.done)
+        self.assertEqual(5, job.exported)
+        with open(self.path) as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual(sorted(s.key.urlsafe() for s in self.speakers),
+                         sorted(line['websafeKey'] for line in lines))
+        self.assertEqual('Org', lines[0]['organization'])
+
+    def testResumesFromCheckpoint(self):
+        job = export.start(['Speaker'], sink='file', target=self.path)
+        self.taskqueue.FlushQueue('default')
+        export.run(job.key.id(), batches=1)
+        self.assertTrue(job.key.get().cursor)
+
+        # the chained task is lost; running the job again resumes it
+        self.taskqueue.FlushQueue('default')
+        export.run(job.key.id(), batches=10)
+        job = job.key.get()
+        self.assertTrue(job.done)
+        with open(self.path) as f:
+            self.assertEqual(5, len(f.readlines()))
+
+    def testCsvWritesOneHeaderPerKind(self):
+        conf = self.makeConference()
+        self.makeSession(conf, self.speakers[0])
+        job = export.start(['Session', 'Speaker'], fmt='csv', sink='file',
+                           target=self.path)
+        self._runTasks(batches=10)
+
+        with open(self.path) as f:
+            rows = list(csv.reader(f))
+        headers = [row for row in rows if row[0] == 'websafeKey']
+        self.assertEqual([export._columns(export.Session),
+                          export._columns(export.Speaker)], headers)
+        self.assertEqual(1 + 2 + 5, len(rows))
+        self.assertEqual(6, job.key.get().exported)
+
+    def testDatastoreSink(self):
+        job = export.start(['Speaker'])
+        self._runTasks(batches=10)
+        chunks = ExportChunk.query(ancestor=job.key).fetch()
+        self.assertEqual(3, len(chunks))
+        self.assertEqual(5, sum(len(c.data.splitlines()) for c in chunks))
+
+    def testRejectsUnknownKind(self):
+        self.assertRaises(ValueError, export.start, ['Nope'])
@@ -0,0 +1,133 @@
+"""Local ID token verification against cached signing keys."""
+
+import json
+import time
+
+from Crypto.PublicKey import RSA
+from google.appengine.api import memcache
+
+from settings import WEB_CLIENT_ID
+import idtoken
+from tests import base
+
+NOW = 1900000000
+
+
+class Response(object):
+
+    def __init__(self, content, status_code=200, headers=None):
+        self.content = content
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class IdTokenTest(base.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.key = RSA.generate(1024)
+        cls.other = RSA.generate(1024)
+
+    def setUp(self):
+        super(IdTokenTest, self).setUp()
+        self.patch(idtoken, '_local', {'keys': {}, 'loaded': 0, 'fetched': 0})
+        self.fetched = []
+        self.responses = []
+        self.patch(idtoken.urlfetch, 'fetch', self._fetch)
+
+    def _fetch(self, url, **kwargs):
+        self.fetched.append(url)
+        return self.responses.pop(0)
+
+    def _claims(self, **claims):
+        fields = {'iss': 'https://accounts.google.com', 'aud': WEB_CLIENT_ID,
+                  'sub': '1234567890', 'email': 'user@example.com',
+                  'iat': NOW, 'exp': NOW + 3600}
+        fields.update(claims)
+        return fields
+
+    def _token(self, key=None, kid='k1', **claims):
+        return idtoken.sign(self._claims(**claims), key or self.key, kid)
+
+    def _verify(self, token, now=NOW):
+        return idtoken.verify(token, now=now, key=self.key.publickey())
+
+    # - - - signature and claims - - - - - - - - - - - - - - -
+
+    def testValidToken(self):
+        self.assertEqual('1234567890', self._verify(self._token())['sub'])
+
+    def testTamperedClaims(self):
+        header, _, signature = self._token().split('.')
+        claims = idtoken._b64encode(json.dumps(self._claims(sub='someone')))
+        self.assertRaises(idtoken.InvalidTokenError, self._verify,
+                          '.'.join([header, claims, signature]))
+
+    def testSignedWithAnotherKey(self):
+        self.assertRaises(idtoken.InvalidTokenError, self._verify,
+                          self._token(key=self.other))
+
+    def testExpiry(self):
+        token = self._token(exp=NOW - 60)
+        self.assertTrue(self._verify(token))
+        self.assertRaises(idtoken.InvalidTokenError, self._verify, token,
+                          now=NOW + idtoken.CLOCK_SKEW)
+
+    def testIssuedInTheFuture(self):
+        self.assertRaises(idtoken.InvalidTokenError, self._verify,
+                          self._token(iat=NOW + idtoken.CLOCK_SKEW + 1))
+
+    def testAudience(self):
+        self.assertRaises(idtoken.InvalidTokenError, self._verify,
+                          self._token(aud='someone-else'))
+        self.assertTrue(self._verify(
+            self._token(aud=['someone-else', WEB_CLIENT_ID])))
+
+    def testAuthorizedPartyOnlyWithSeveralAudiences(self):
+        for aud in ('someone-else', ['someone-else']):
+            self.assertRaises(idtoken.InvalidTokenError, self._verify,
+                              self._token(aud=aud, azp=WEB_CLIENT_ID))
+        self.assertTrue(self._verify(self._token(
+            aud=['someone-else', 'another'], azp=WEB_CLIENT_ID)))
+
+    def testIssuer(self):
+        self.assertRaises(idtoken.InvalidTokenError, self._verify,
+                          self._token(iss='https://example.com'))
+
+    def testNotVerifiableLocally(self):
+        hs256 = '.'.join(idtoken._b64encode(json.dumps(part)) for part in (
+            {'alg': 'HS256'}, self._claims(), 'x'))
+        for token in ('not a token', hs256):
+            self.assertRaises(idtoken.UnverifiableTokenError, self._verify,
+                              token)
+
+    # - - - signing keys - - - - - - - - - - - - - - - - - - -
+
+    def testKeysFetchedOnceAndCached(self):
+        self.responses.append(Response(
+            idtoken.keySet({'k1': self.key}),
+            headers={'Cache-Control': 'public, max-age=20000'}))
+        token = self._token()
+        self.assertTrue(idtoken.verify(token, now=NOW))
+        self.assertTrue(idtoken.verify(token, now=NOW))
+        self.assertEqual([idtoken.CERTS_URL], self.fetched)
+
+        # a fresh instance reads the keys from memcache
+        idtoken._local.update(keys={}, loaded=0, fetched=time.time())
+        self.assertTrue(idtoken.verify(token, now=NOW))
+        self.assertEqual(1, len(self.fetched))
+        self.assertTrue(memcache.get(idtoken.MEMCACHE_KEYS_KEY))
+
+    def testRotatedKeyFetchedAtMostOncePerInterval(self):
+        self.responses.append(Response(idtoken.keySet({'k1': self.key})))
+        idtoken.refreshKeys()
+        token = self._token(key=self.other, kid='k2')
+        self.assertRaises(idtoken.UnverifiableTokenError, idtoken.verify,
+                          token, now=NOW)
+        self.assertEqual(1, len(self.fetched))
+
+        idtoken._local['fetched'] -= idtoken.MIN_FETCH_INTERVAL
+        self.responses.append(Response(idtoken.keySet({'k1': self.key,
+                                             'k2': self.other})))
+        self.assertTrue(idtoken.verify(token, now=NOW))
+        self.assertEqual(2, len(self.fetched))
@@ -0,0 +1,36 @@
+"""Modules the app imports at startup stay importable in the runtime."""
+
+import ast
+import os
+
+from tests import base
+
+# modules only the local benchmarks and tools use; resource is not on the
+# runtime's C module whitelist, and the others have no place in a request
+LOCAL_ONLY = ('resource', 'tempfile', 'google.appengine.ext.testbed',
+              'google.appengine.datastore.datastore_stub_util')
+
+
+def moduleImports(path):
+    """Yield the names imported at module level by a source file."""
+    with open(path) as f:
+        tree = ast.parse(f.read(), path)
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                yield alias.name
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            for alias in node.names:
+                yield '%s.%s' % (node.module, alias.name)
+            yield node.module
+
+
+class ModuleImportsTest(base.TestCase):
+
+    def testNoLocalOnlyImportsAtModuleLevel(self):
+        for name in sorted(os.listdir(base.APP_ROOT)):
+            if not name.endswith('.py'):
+                continue
+            imports = set(moduleImports(os.path.join(base.APP_ROOT, name)))
+            self.assertEqual([], [m for m in LOCAL_ONLY if m in imports],
+                             name)
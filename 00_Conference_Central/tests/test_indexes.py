@@ -0,0 +1,81 @@
+"""index.yaml against the queries the application issues."""
+
+import os
+
+from conference import ConferenceApi
+from models import Conference
+from models import ConferenceQueryForm
+from models import ConferenceQueryForms
+import indexaudit
+from tests import base
+
+# the indexes index.yaml declared before indexaudit.py
+BASELINE_INDEXES = [indexaudit.Index(kind, False, props) for kind, props in [
+    ('Conference', ('city', 'maxAttendees', 'month', 'name')),
+    ('Conference', ('city', 'maxAttendees', 'month', 'topics', 'name')),
+    ('Conference', ('city', 'maxAttendees', 'name')),
+    ('Conference', ('city', 'month', 'name')),
+    ('Conference', ('city', 'month', 'topics', 'name')),
+    ('Conference', ('city', 'name')),
+    ('Conference', ('city', 'topics', 'name')),
+    ('Conference', ('maxAttendees', 'month', 'name')),
+    ('Conference', ('maxAttendees', 'month', 'topics', 'name')),
+    ('Conference', ('maxAttendees', 'name')),
+    ('Conference', ('maxAttendees', 'topics', 'name')),
+    ('Conference', ('month', 'name')),
+    ('Conference', ('month', 'topics', 'name')),
+    ('Conference', ('seatsAvailable', 'name')),
+    ('Conference', ('topics', 'name')),
+    ('Session', ('__key__', 'conferenceKeysToAttend')),
+    ('Session', ('startTime.hour', 'typeOfSession')),
+]]
+
+
+class IndexYamlTest(base.TestCase):
+
+    def testDeclaresEveryNeededIndex(self):
+        declared = indexaudit.loadIndexYaml(
+            os.path.join(base.APP_ROOT, 'index.yaml'))
+        needed = indexaudit.minimalIndexes(indexaudit.queryShapes())
+        self.assertEqual([], sorted(set(needed) - set(declared)))
+
+    def testWritePathsWriteFewerIndexRows(self):
+        declared = indexaudit.loadIndexYaml(
+            os.path.join(base.APP_ROOT, 'index.yaml'))
+        entities = indexaudit.sampleEntities()
+        for path, kinds in indexaudit.WRITE_PATHS:
+            before = sum(indexaudit.indexWrites(
+                entities[kind], BASELINE_INDEXES, every_property=True)
+                for kind in kinds)
+            after = sum(indexaudit.indexWrites(entities[kind], declared)
+                        for kind in kinds)
+            self.assertLess(after, before, path)
+
+    def _query(self, *filters):
+        request = ConferenceQueryForms(filters=[
+            ConferenceQueryForm(field=field, operator=op, value=value)
+            for field, op, value in filters])
+        return [c.name for c in
+                ConferenceApi().queryConferences(request).items]
+
+    def testInequalityWithEqualityFilters(self):
+        for i, (city, seats, month) in enumerate(
+                [('London', 10, 3), ('London', 500, 6), ('Paris', 500, 6)]):
+            Conference(name='C%d' % i, city=city, maxAttendees=seats,
+                       month=month, topics=['Web']).put()
+        self.assertEqual(['C1'], self._query(
+            ('CITY', 'EQ', 'London'), ('MAX_ATTENDEES', 'GT', '100')))
+        self.assertEqual(['C1'], self._query(
+            ('CITY', 'EQ', 'London'), ('MONTH', 'GT', '4')))
+        self.assertEqual(['C1', 'C2'], self._query(
+            ('TOPIC', 'EQ', 'Web'), ('MONTH', 'GTEQ', '6')))
+        self.assertEqual(['C2'], self._query(
+            ('MONTH', 'EQ', '6'), ('MAX_ATTENDEES', 'EQ', '500'),
+            ('CITY', 'GT', 'M')))
+
+    def testEqualityFiltersMergeJoin(self):
+        Conference(name='A', city='London', month=6, topics=['Web']).put()
+        Conference(name='B', city='London', month=7, topics=['Web']).put()
+        self.assertEqual(['A'], self._query(
+            ('CITY', 'EQ', 'London'), ('MONTH', 'EQ', '6'),
+            ('TOPIC', 'EQ', 'Web')))
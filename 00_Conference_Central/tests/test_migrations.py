@@ -0,0 +1,57 @@
+"""Migration shards against concurrent writes."""
+
+from google.appengine.ext import ndb
+
+from models import MigrationShard
+from models import Speaker
+import migrations
+from tests import base
+
+
+class MigrateShardTest(base.TestCase):
+
+    def setUp(self):
+        super(MigrateShardTest, self).setUp()
+        self.speakers = [self.makeSpeaker('Speaker %d' % i, 'org')
+                         for i in xrange(3)]
+        self.renamed = False
+        migrations.MIGRATIONS['test_organizations'] = (
+            Speaker, self._upperOrganization)
+        MigrationShard(id='run-0', migration='test_organizations',
+                       run='run').put()
+
+    def tearDown(self):
+        migrations.MIGRATIONS.pop('test_organizations')
+        super(MigrateShardTest, self).tearDown()
+
+    def _upperOrganization(self, speaker):
+        if not self.renamed:
+            # live traffic renames a speaker of the batch being migrated
+            self.renamed = True
+            self._rename(self.speakers[-1].key)
+        if speaker.organization.isupper():
+            return False
+        speaker.organization = speaker.organization.upper()
+        return True
+
+    @ndb.non_transactional
+    def _rename(self, key):
+        speaker = key.get()
+        speaker.speaker = 'Renamed'
+        speaker.put()
+
+    def testKeepsConcurrentWrites(self):
+        shard = migrations.migrate_shard('run-0')
+
+        self.assertTrue(shard.done)
+        self.assertEqual((3, 3), (shard.processed, shard.updated))
+        speaker = self.speakers[-1].key.get()
+        self.assertEqual(('Renamed', 'ORG'),
+                         (speaker.speaker, speaker.organization))
+
+    def testRerunIsNoOp(self):
+        migrations.migrate_shard('run-0')
+        MigrationShard(id='run-1', migration='test_organizations',
+                       run='run').put()
+        shard = migrations.migrate_shard('run-1')
+        self.assertEqual((3, 0), (shard.processed, shard.updated))
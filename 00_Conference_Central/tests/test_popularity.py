@@ -0,0 +1,43 @@
+"""Session popularity counters and the trending sessions."""
+
+from conference import ConferenceApi
+from conference import SESS_GET_REQUEST
+import popularity
+from tests import base
+
+
+class PopularityTest(base.TestCase):
+
+    def setUp(self):
+        super(PopularityTest, self).setUp()
+        self.api = ConferenceApi()
+        self.conf = self.makeConference()
+        self.sessions = [self.makeSession(self.conf, name='S%d' % i)
+                         for i in xrange(3)]
+
+    def _wishlist(self, user, session, add=True):
+        self.login(user)
+        method = (self.api.addSessionToWishlist if add
+                  else self.api.deleteSessionInWishlist)
+        method(base.request(SESS_GET_REQUEST,
+                            websafeSessionKey=session.key.urlsafe()))
+
+    def testCountsFollowAddsAndRemovals(self):
+        first, second = self.sessions[:2]
+        for i in xrange(3):
+            self._wishlist('user%d@example.com' % i, first)
+        self._wishlist('user0@example.com', second)
+        self._wishlist('user1@example.com', first, add=False)
+
+        self.assertEqual(2, popularity.count(first.key))
+        self.assertEqual(1, popularity.count(second.key))
+        self.assertEqual([(first.key, 2), (second.key, 1)],
+                         popularity.trending(self.conf.key))
+
+    def testRemovalCountedWithoutCachedCount(self):
+        session = self.sessions[0]
+        self._wishlist('user@example.com', session)
+        popularity.count(session.key)
+        self._wishlist('user@example.com', session, add=False)
+        self.assertEqual(0, popularity.count(session.key))
+        self.assertEqual([], popularity.trending(self.conf.key))
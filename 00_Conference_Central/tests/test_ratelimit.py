@@ -0,0 +1,86 @@
+"""Per-user token buckets and their per-instance view."""
+
+import collections
+import httplib
+
+from endpoints import apiserving
+from google.appengine.api import memcache
+
+from conference import ConferenceApi
+from models import NewSpeakerForm
+from models import TooManyRequestsException
+import ratelimit
+from tests import base
+
+
+class TakeTest(base.TestCase):
+
+    def setUp(self):
+        super(TakeTest, self).setUp()
+        self.patch(ratelimit, '_local', collections.OrderedDict())
+
+    def testEmptyBucketRejects(self):
+        self.assertEqual([True] * 3 + [False],
+                         [ratelimit._take('b', 0.001, 3) for _ in xrange(4)])
+        self.assertEqual(['b'], list(ratelimit._local))
+
+    def testEmptyBucketRejectedWithoutMemcache(self):
+        for _ in xrange(3):
+            ratelimit._take('b', 0.001, 3)
+        memcache.flush_all()
+        self.assertFalse(ratelimit._take('b', 0.001, 3))
+
+    def testOnlyEmptyBucketsAreKept(self):
+        for i in xrange(10):
+            ratelimit._take('full%d' % i, 1.0, 10)
+        ratelimit._take('single', 0.001, 1)
+        self.assertEqual(['single'], list(ratelimit._local))
+
+    def testLocalBucketsAreCapped(self):
+        self.patch(ratelimit, 'MAX_LOCAL_BUCKETS', 3)
+        for i in xrange(5):
+            ratelimit._take('b%d' % i, 0.001, 1)
+        self.assertEqual(['b2', 'b3', 'b4'], list(ratelimit._local))
+        # a forgotten bucket is still empty in memcache
+        self.assertFalse(ratelimit._take('b0', 0.001, 1))
+        self.assertEqual(['b3', 'b4', 'b0'], list(ratelimit._local))
+
+
+class LimitedEndpointTest(base.TestCase):
+
+    def setUp(self):
+        super(LimitedEndpointTest, self).setUp()
+        self.patch(ratelimit, '_local', collections.OrderedDict())
+        self.api = ConferenceApi()
+        self.login('user@example.com')
+
+    def _createSpeaker(self):
+        return self.api.createSpeaker(
+            NewSpeakerForm(speaker='Ada', organization='Analytical'))
+
+    def assertShed(self, retry_after):
+        try:
+            self._createSpeaker()
+        except TooManyRequestsException as e:
+            # the error name is one endpoints maps to a status, 408, which
+            # the frontend sends as 503
+            self.assertEqual(httplib.REQUEST_TIMEOUT,
+                             apiserving._ERROR_NAME_MAP[e.error_name]
+                             .http_status)
+            self.assertTrue(e.message.endswith(
+                'Retry-After: %d' % retry_after))
+        else:
+            self.fail('request was not shed')
+
+    def testShedPastTheBucket(self):
+        rate, burst = ratelimit.LIMITS['createSpeaker']
+        for _ in xrange(burst):
+            self._createSpeaker()
+        self.assertShed(6)
+        self.assertEqual(1, memcache.get(
+            ratelimit.MEMCACHE_REJECTED_KEY % ('createSpeaker', 'rate')))
+
+    def testShedWhenSaturated(self):
+        self.patch(ratelimit, '_in_flight', [ratelimit.MAX_CONCURRENT])
+        self.assertShed(1)
+        self.assertEqual([ratelimit.MAX_CONCURRENT], ratelimit._in_flight)
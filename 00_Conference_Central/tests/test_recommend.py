@@ -0,0 +1,88 @@
+"""Session recommendations built by chained, checkpointed tasks."""
+
+from models import RecommendationChunk
+from models import RecommendationJob
+from models import SessionRecommendations
+import recommend
+from tests import base
+
+
+def recommended(session_key):
+    return [sess.key for sess in recommend.recommendations(session_key)]
+
+
+class RecommendTest(base.TestCase):
+
+    def setUp(self):
+        super(RecommendTest, self).setUp()
+        conf = self.makeConference()
+        speaker = self.makeSpeaker()
+        self.sessions = [self.makeSession(conf, speaker, name='S%d' % i).key
+                         for i in xrange(4)]
+        a, b, c, d = self.sessions
+        # a and b are wishlisted together three times, a and c twice
+        wishlists = [[a, b], [a, b, c], [a, b], [a, c], [d]]
+        for i, wishlist in enumerate(wishlists):
+            self.makeProfile('user%d@example.com' % i, wishList=wishlist)
+
+    def _runTasks(self, batches):
+        """Run the job's chained tasks from the queue, one at a time."""
+        runs = 0
+        while True:
+            tasks = self.tasks(recommend.BUILD_TASK_URL)
+            if not tasks:
+                return runs
+            self.taskqueue.DeleteTask('default', tasks[0].name)
+            recommend.run(tasks[0].extract_params()['job'],
+                          batches=batches)
+            runs += 1
+
+    def testChainedTasks(self):
+        self.patch(recommend, 'PROFILE_BATCH', 2)
+        job = recommend.start()
+        self.assertEqual(4, self._runTasks(batches=1))
+
+        job = job.key.get()
+        self.assertTrue(job.done)
+        self.assertEqual((6, 3), (job.profiles, job.sequence))
+        self.assertEqual([], RecommendationChunk.query().fetch())
+        a, b, c, d = self.sessions
+        self.assertEqual([b, c], recommended(a))
+        self.assertEqual([a, c], recommended(b))
+        self.assertEqual([], recommended(d))
+
+    def testResumesFromCheckpoint(self):
+        self.patch(recommend, 'PROFILE_BATCH', 2)
+        job = RecommendationJob(id='job')
+        job.put()
+        recommend.run('job', batches=1, chain=False)
+        # the task is retried after its checkpoint: the partial counts
+        # are kept and counting continues from the cursor
+        job = recommend.run('job', batches=10, chain=False)
+        self.assertEqual((6, 2, True), (job.profiles, job.sequence,
+                                        job.counted))
+        self.assertEqual(2, len(RecommendationChunk.query(
+            ancestor=job.key).fetch()))
+        recommend.run('job', chain=False)
+        self.assertEqual(self.sessions[1:3],
+                         recommended(self.sessions[0]))
+
+    def testSplitsLargeCounts(self):
+        self.patch(recommend, 'CHUNK_BYTES', 100)
+        job = recommend.build()
+        self.assertTrue(job.done)
+        self.assertEqual(self.sessions[1:3],
+                         recommended(self.sessions[0]))
+
+    def testRebuildDropsStaleRecommendations(self):
+        a, b, c, d = self.sessions
+        SessionRecommendations(id=d.urlsafe(), sessions=[a], scores=[1]).put()
+        recommend.build()
+        self.assertEqual(None, SessionRecommendations.get_by_id(d.urlsafe()))
+        self.assertEqual([b, c], recommended(a))
+
+    def testSkipsDeletedSessions(self):
+        recommend.build()
+        a, b, c, d = self.sessions
+        b.delete()
+        self.assertEqual([c], recommended(a))
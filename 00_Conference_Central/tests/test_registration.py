@@ -0,0 +1,152 @@
+"""Queued registration: tickets, seat allocation and an opening burst."""
+
+from google.appengine.ext import ndb
+
+from conference import CONF_GET_REQUEST
+from conference import ConferenceApi
+from conference import REGISTRATION_QUEUE
+from models import ConflictException
+from models import Profile
+from models import RegistrationTicket
+from tests import base
+
+# a popular conference opening: every user queues a registration, and
+# every DIRECT_EVERY-th user also registers directly while queued
+BURST_USERS = 10000
+BURST_SEATS = 500
+DIRECT_EVERY = 100
+UNREGISTERED = 20
+
+
+class RegistrationQueueTest(base.TestCase):
+
+    def setUp(self):
+        super(RegistrationQueueTest, self).setUp()
+        self.api = ConferenceApi()
+
+    def _conference(self, seats):
+        self.conf = self.makeConference(maxAttendees=seats)
+        self.wsck = self.conf.key.urlsafe()
+        return base.request(CONF_GET_REQUEST, websafeConferenceKey=self.wsck)
+
+    def _ticket(self, user):
+        return ndb.Key(RegistrationTicket, user, parent=self.conf.key).get()
+
+    def _queued(self):
+        return self.tasks(queue_name=REGISTRATION_QUEUE)
+
+    def _drain(self):
+        """Run allocation until the registration queue is empty."""
+        while self._queued():
+            ConferenceApi._processRegistrationQueue(self.wsck)
+
+    def _registered(self):
+        return set(Profile.query(
+            Profile.conferenceKeysToAttend == self.conf.key).fetch(
+                keys_only=True))
+
+    def testTicketIsQueuedWithItsTask(self):
+        request = self._conference(10)
+        self.login('user@example.com')
+        self.api.requestRegistration(request)
+        self.api.requestRegistration(request)
+
+        self.assertEqual('PENDING', self._ticket('user@example.com').status)
+        self.assertEqual(1, len(self._queued()))
+        self._drain()
+        self.assertEqual('GRANTED', self._ticket('user@example.com').status)
+        self.assertEqual(9, self.conf.key.get().seatsAvailable)
+
+    def testPendingTicketSchedulesAllocationAgain(self):
+        request = self._conference(10)
+        self.login('user@example.com')
+        self.api.requestRegistration(request)
+        self.taskqueue.FlushQueue('default')
+
+        self.api.requestRegistration(request)
+        self.assertEqual(1, len(self.tasks('/tasks/allocate_seats')))
+
+    def testDirectRegistrationCancelsQueuedTicket(self):
+        request = self._conference(10)
+        self.login('user@example.com')
+        self.api.requestRegistration(request)
+        self.api.registerForConference(request)
+
+        self.assertEqual('CANCELLED', self._ticket('user@example.com').status)
+        self._drain()
+        self.assertEqual(9, self.conf.key.get().seatsAvailable)
+
+    def testGrantedTicketRejectsDirectRegistration(self):
+        request = self._conference(10)
+        self.login('user@example.com')
+        self.api.requestRegistration(request)
+        # seats are granted before the profile records the registration
+        ConferenceApi._allocateSeats(self.conf.key, ['user@example.com'])
+
+        self.assertRaises(ConflictException,
+                          self.api.registerForConference, request)
+        self.assertEqual(9, self.conf.key.get().seatsAvailable)
+
+    def testUnregisterReturnsSeatOfGrantedTicket(self):
+        request = self._conference(10)
+        self.login('user@example.com')
+        self.api.requestRegistration(request)
+        ConferenceApi._allocateSeats(self.conf.key, ['user@example.com'])
+
+        self.assertTrue(self.api.unregisterFromConference(request).data)
+        self.assertEqual('CANCELLED', self._ticket('user@example.com').status)
+        self.assertEqual(10, self.conf.key.get().seatsAvailable)
+        # the grant still queued does not register the user
+        self._drain()
+        self.assertEqual(set(), self._registered())
+        self.assertEqual(10, self.conf.key.get().seatsAvailable)
+
+    def testUnregisterAfterGrantReturnsOneSeat(self):
+        request = self._conference(10)
+        self.login('user@example.com')
+        self.api.requestRegistration(request)
+        self._drain()
+
+        self.assertTrue(self.api.unregisterFromConference(request).data)
+        self.assertEqual(set(), self._registered())
+        self.assertEqual(10, self.conf.key.get().seatsAvailable)
+
+    def testOpeningBurst(self):
+        request = self._conference(BURST_SEATS)
+        users = ['user%05d@example.com' % i for i in xrange(BURST_USERS)]
+        for i, user in enumerate(users):
+            self.login(user)
+            self.api.requestRegistration(request)
+            if i % DIRECT_EVERY == 0:
+                try:
+                    self.api.registerForConference(request)
+                except ConflictException:
+                    pass
+            if i % 1000 == 0:
+                ConferenceApi._processRegistrationQueue(self.wsck)
+        self._drain()
+
+        # every seat is taken once, by a registered user, and everyone
+        # else is waitlisted in request order
+        registered = self._registered()
+        self.assertEqual(0, self.conf.key.get().seatsAvailable)
+        self.assertEqual(BURST_SEATS, len(registered))
+        tickets = RegistrationTicket.query(ancestor=self.conf.key).fetch()
+        status = dict((t.key.id(), t.status) for t in tickets)
+        waitlisted = [user for user in users
+                      if status[user] == 'WAITLISTED']
+        self.assertEqual(BURST_USERS - BURST_SEATS, len(waitlisted))
+        for user in users:
+            self.assertNotEqual(ndb.Key(Profile, user) in registered,
+                                user in waitlisted)
+
+        # freed seats go to the longest waiting users
+        for user in sorted(registered)[:UNREGISTERED]:
+            self.login(user.id())
+            self.api.unregisterFromConference(request)
+        ConferenceApi._processRegistrationQueue(self.wsck)
+        self.assertEqual(0, self.conf.key.get().seatsAvailable)
+        self.assertEqual(BURST_SEATS, len(self._registered()))
+        promoted = [user for user in waitlisted[:UNREGISTERED]
+                    if self._ticket(user).status == 'GRANTED']
+        self.assertEqual(waitlisted[:UNREGISTERED], promoted)
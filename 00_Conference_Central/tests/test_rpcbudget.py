@@ -0,0 +1,377 @@
+"""RPC budgets of the read endpoints.
+
+Every endpoint below is called on data seeded at several result sizes,
+counting the datastore, memcache, task queue and URL fetch calls it makes.
+The counts must stay within the endpoint's budget and must not grow with
+the result, so an endpoint making a call per returned item, like a get()
+in a loop, fails here rather than in production.
+"""
+
+import collections
+import datetime
+
+from google.appengine.api import apiproxy_stub_map
+from google.appengine.ext import ndb
+
+from conference import CHANGES_GET_REQUEST
+from conference import CONF_GET_REQUEST
+from conference import ConferenceApi
+from conference import MEMCACHE_FEATURED_SPEAKER_KEY
+from conference import SESS_GET_REQUEST
+from conference import SPEAKER_GET_REQUEST
+from models import ConferenceQueryForm
+from models import ConferenceQueryForms
+from models import DateRangeQueryForm
+from models import HighlightsForm
+from models import QuerySessionsByDurationForm
+from models import SessionRecommendations
+from models import SessionsOfConferenceByType
+from models import TrendingSessions
+from models import WebsafeKeysForm
+from protorpc import message_types
+import changefeed
+import swrcache
+from tests import base
+
+SIZES = (1, 10, 40)
+
+SERVICES = ('datastore_v3', 'memcache', 'taskqueue', 'urlfetch')
+
+# continuations of a query already counted when it was run, and the
+# stub loading index.yaml on the first query
+UNCOUNTED = frozenset([('datastore_v3', 'Next'),
+                       ('datastore_v3', 'CreateIndex'),
+                       ('datastore_v3', 'UpdateIndex')])
+
+# a get across many entity groups is sent as concurrent RPCs of ten groups
+# each; they cost one round trip, so they are counted as one call
+MAX_ENTITY_GROUPS_PER_RPC = 1000
+
+# calls per service allowed to any endpoint request
+DEFAULT_BUDGET = {
+    'datastore_v3': 12,
+    'memcache':     16,
+    'taskqueue':    4,
+    'urlfetch':     3,
+}
+
+# endpoint method -> budget overrides; the read endpoints listing many
+# entities are held to the few batched calls they need. On a cold cache
+# every batched ndb get also costs up to four memcache calls.
+BUDGETS = {
+    'getConference':               {'datastore_v3': 3, 'memcache': 6},
+    'queryConferences':            {'datastore_v3': 2, 'memcache': 2},
+    'getConferencesCreated':       {'datastore_v3': 2, 'memcache': 4},
+    'searchConferencesByDate':     {'datastore_v3': 4, 'memcache': 4},
+    'getConferencesToAttend':      {'datastore_v3': 4, 'memcache': 8},
+    'getConferenceSessions':       {'datastore_v3': 2, 'memcache': 2},
+    'getConferenceSessionsByType': {'datastore_v3': 2, 'memcache': 2},
+    'getSessionsBySpeaker':        {'datastore_v3': 3, 'memcache': 4},
+    'getSessionsByDurartion':      {'datastore_v3': 2, 'memcache': 2},
+    # one keys-only sub-query per hour, or per highlight asked for
+    'beforeSevenNonWorkshopSession': {'datastore_v3': 22},
+    'getSessionsByHighlights':     {'datastore_v3': 34},
+    'getTrendingSessions':         {'datastore_v3': 3, 'memcache': 10},
+    'getSessionRecommendations':   {'datastore_v3': 3, 'memcache': 8},
+    'getConferencesBatch':         {'datastore_v3': 2, 'memcache': 4},
+    'getSessionsBatch':            {'datastore_v3': 2, 'memcache': 4},
+    'getSpeakersBatch':            {'datastore_v3': 2, 'memcache': 4},
+    'getFeaturedSpeakersBatch':    {'datastore_v3': 2, 'memcache': 4},
+    'getSessionsInWishlist':       {'datastore_v3': 4, 'memcache': 8},
+    'getNotRegisteredWishlist':    {'datastore_v3': 5, 'memcache': 8},
+    'getAgenda':                   {'datastore_v3': 6, 'memcache': 10},
+    'getAnnouncement':             {'datastore_v3': 2, 'memcache': 3},
+    'getFeaturedSpeaker':          {'datastore_v3': 3, 'memcache': 3},
+    'getOrganizerDashboard':       {'datastore_v3': 1, 'memcache': 0},
+    # a read of the version counter per poll interval while waiting
+    'getChanges':                  {'datastore_v3': 0, 'memcache': 24},
+}
+
+USER = 'user@example.com'
+ORGANIZER = 'organizer@example.com'
+
+
+def budget(endpoint):
+    """Return {service: calls allowed} for an endpoint method."""
+    allowed = dict(DEFAULT_BUDGET)
+    allowed.update(BUDGETS.get(endpoint, {}))
+    return allowed
+
+
+class RpcBudgetTest(base.TestCase):
+
+    def setUp(self):
+        super(RpcBudgetTest, self).setUp()
+        ndb.set_context(ndb.tasklets.make_context(config=ndb.ContextOptions(
+            max_entity_groups_per_rpc=MAX_ENTITY_GROUPS_PER_RPC)))
+        ndb.get_context().set_cache_policy(False)
+        self.api = ConferenceApi()
+        self.counts = None
+        # the testbed installs a new stub map on every activation
+        apiproxy_stub_map.apiproxy.GetPreCallHooks().Append(
+            'rpcbudget', self._count)
+
+    def _count(self, service, call, request, response):
+        if self.counts is not None and service in SERVICES \
+                and (service, call) not in UNCOUNTED:
+            self.counts[service] += 1
+
+    def measure(self, endpoint, request):
+        """Return {service: calls} made by one call of an endpoint."""
+        self.counts = collections.Counter()
+        try:
+            getattr(self.api, endpoint)(request)
+        finally:
+            counts, self.counts = self.counts, None
+        return dict((service, counts[service]) for service in SERVICES)
+
+    def assertBudget(self, endpoint, seed):
+        """Call the endpoint on each of SIZES results, seeded by
+        seed(n) into an empty datastore, which returns the request."""
+        allowed = budget(endpoint)
+        by_size = []
+        for n in SIZES:
+            self.tearDown()
+            self.setUp()
+            counts = self.measure(endpoint, seed(n))
+            for service in SERVICES:
+                self.assertLessEqual(
+                    counts[service], allowed[service],
+                    '%s made %d %s calls for %d results; %d allowed' % (
+                        endpoint, counts[service], service, n,
+                        allowed[service]))
+            by_size.append(counts)
+        for n, counts in zip(SIZES[1:], by_size[1:]):
+            self.assertEqual(by_size[0], counts,
+                             '%s calls grow with the result: %s for %d, '
+                             '%s for %d' % (endpoint, by_size[0], SIZES[0],
+                                            counts, n))
+
+    # - - - seeding helpers - - - - - - - - - - - - - - - - - -
+
+    def sessions(self, n, conf=None, speaker=None, **fields):
+        conf = conf or self.makeConference()
+        speaker = speaker or self.makeSpeaker()
+        return [self.makeSession(conf, speaker, name='S%d' % i,
+                                 hour=9 + i % 8, **fields)
+                for i in xrange(n)]
+
+    def sessionsAcrossConferences(self, n):
+        speaker = self.makeSpeaker()
+        return [self.makeSession(self.makeConference(
+                    'organizer%d@example.com' % i, name='C%d' % i), speaker)
+                for i in xrange(n)]
+
+    def profile(self, wishlist=(), registrations=()):
+        prof = self.makeProfile(USER)
+        prof.wishList = [s.key for s in wishlist]
+        prof.conferenceKeysToAttend = [c.key for c in registrations]
+        prof.put()
+        self.login(USER)
+        return prof
+
+    # - - - conferences - - - - - - - - - - - - - - - - - - - -
+
+    def testGetConference(self):
+        def seed(n):
+            conf = self.makeConference(description='About')
+            self.profile(wishlist=self.sessions(n, conf),
+                         registrations=[conf])
+            return base.request(CONF_GET_REQUEST,
+                                websafeConferenceKey=conf.key.urlsafe())
+        self.assertBudget('getConference', seed)
+
+    def testQueryConferences(self):
+        def seed(n):
+            for i in xrange(n):
+                self.makeConference(name='C%d' % i, city='London')
+            return ConferenceQueryForms(filters=[ConferenceQueryForm(
+                field='CITY', operator='EQ', value='London')])
+        self.assertBudget('queryConferences', seed)
+
+    def testGetConferencesCreated(self):
+        def seed(n):
+            for i in xrange(n):
+                self.makeConference(ORGANIZER, name='C%d' % i)
+            self.login(ORGANIZER)
+            return message_types.VoidMessage()
+        self.assertBudget('getConferencesCreated', seed)
+
+    def testSearchConferencesByDate(self):
+        def seed(n):
+            for i in xrange(n):
+                self.makeConference(name='C%d' % i,
+                                    startDate=datetime.date(2030, 6, 4))
+            return DateRangeQueryForm(startDate='2030-06-03',
+                                      endDate='2030-06-07', pageSize=100)
+        self.assertBudget('searchConferencesByDate', seed)
+
+    def testGetConferencesToAttend(self):
+        def seed(n):
+            self.profile(registrations=[
+                self.makeConference(name='C%d' % i) for i in xrange(n)])
+            return message_types.VoidMessage()
+        self.assertBudget('getConferencesToAttend', seed)
+
+    def testGetOrganizerDashboard(self):
+        def seed(n):
+            for i in xrange(n):
+                self.makeConference(ORGANIZER, name='C%d' % i)
+            self.login(ORGANIZER)
+            return message_types.VoidMessage()
+        self.assertBudget('getOrganizerDashboard', seed)
+
+    def testGetAnnouncement(self):
+        def seed(n):
+            for i in xrange(n):
+                self.makeConference(name='C%d' % i, maxAttendees=3)
+            ConferenceApi._cacheAnnouncement()
+            return message_types.VoidMessage()
+        self.assertBudget('getAnnouncement', seed)
+
+    # - - - sessions - - - - - - - - - - - - - - - - - - - - -
+
+    def testGetConferenceSessions(self):
+        def seed(n):
+            conf = self.makeConference()
+            self.sessions(n, conf)
+            return base.request(CONF_GET_REQUEST,
+                                websafeConferenceKey=conf.key.urlsafe())
+        self.assertBudget('getConferenceSessions', seed)
+
+    def testGetConferenceSessionsByType(self):
+        def seed(n):
+            conf = self.makeConference()
+            self.sessions(n, conf, typeOfSession=['Workshop'])
+            self.login(USER)
+            return SessionsOfConferenceByType(
+                type='Workshop', websafeConferenceKey=conf.key.urlsafe())
+        self.assertBudget('getConferenceSessionsByType', seed)
+
+    def testGetSessionsBySpeaker(self):
+        def seed(n):
+            speaker = self.makeSpeaker()
+            for i in xrange(n):
+                self.makeSession(self.makeConference(name='C%d' % i),
+                                 speaker=speaker)
+            return base.request(SPEAKER_GET_REQUEST,
+                                websafeSpeakerKey=speaker.key.urlsafe())
+        self.assertBudget('getSessionsBySpeaker', seed)
+
+    def testGetSessionsByDuration(self):
+        def seed(n):
+            self.sessions(n, duration=30)
+            return QuerySessionsByDurationForm(duration=60)
+        self.assertBudget('getSessionsByDurartion', seed)
+
+    def testBeforeSevenNonWorkshopSession(self):
+        def seed(n):
+            self.sessions(n, typeOfSession=['Talk'])
+            return message_types.VoidMessage()
+        self.assertBudget('beforeSevenNonWorkshopSession', seed)
+
+    def testGetSessionsByHighlights(self):
+        def seed(n):
+            self.sessions(n, highlights=['python'])
+            return HighlightsForm(highlights=['python', 'ndb'])
+        self.assertBudget('getSessionsByHighlights', seed)
+
+    def testGetTrendingSessions(self):
+        def seed(n):
+            conf = self.makeConference()
+            sessions = self.sessions(n, conf)
+            TrendingSessions(id=conf.key.urlsafe(),
+                             sessions=[s.key for s in sessions],
+                             counts=range(n, 0, -1)).put()
+            return base.request(CONF_GET_REQUEST,
+                                websafeConferenceKey=conf.key.urlsafe())
+        self.assertBudget('getTrendingSessions', seed)
+
+    def testGetSessionRecommendations(self):
+        def seed(n):
+            session = self.sessions(1)[0]
+            others = self.sessions(n)
+            SessionRecommendations(id=session.key.urlsafe(),
+                                   sessions=[s.key for s in others],
+                                   scores=range(n, 0, -1)).put()
+            return base.request(SESS_GET_REQUEST,
+                                websafeSessionKey=session.key.urlsafe())
+        self.assertBudget('getSessionRecommendations', seed)
+
+    def testGetFeaturedSpeaker(self):
+        def seed(n):
+            conf = self.makeConference()
+            self.sessions(n + 1, conf, speaker=self.makeSpeaker())
+            wsck = conf.key.urlsafe()
+            swrcache.put(MEMCACHE_FEATURED_SPEAKER_KEY, wsck,
+                         ConferenceApi._computeFeaturedSpeaker(wsck))
+            return base.request(CONF_GET_REQUEST, websafeConferenceKey=wsck)
+        self.assertBudget('getFeaturedSpeaker', seed)
+
+    # - - - batch gets - - - - - - - - - - - - - - - - - - - -
+
+    def testGetConferencesBatch(self):
+        def seed(n):
+            return WebsafeKeysForm(websafeKeys=[
+                self.makeConference(name='C%d' % i).key.urlsafe()
+                for i in xrange(n)])
+        self.assertBudget('getConferencesBatch', seed)
+
+    def testGetSessionsBatch(self):
+        def seed(n):
+            return WebsafeKeysForm(websafeKeys=[
+                s.key.urlsafe() for s in self.sessions(n)])
+        self.assertBudget('getSessionsBatch', seed)
+
+    def testGetSpeakersBatch(self):
+        def seed(n):
+            return WebsafeKeysForm(websafeKeys=[
+                self.makeSpeaker('Speaker %d' % i).key.urlsafe()
+                for i in xrange(n)])
+        self.assertBudget('getSpeakersBatch', seed)
+
+    def testGetFeaturedSpeakersBatch(self):
+        def seed(n):
+            speaker = self.makeSpeaker()
+            wscks = []
+            for i in xrange(n):
+                wsck = self.makeConference(name='C%d' % i).key.urlsafe()
+                swrcache.put(MEMCACHE_FEATURED_SPEAKER_KEY, wsck, {
+                    'speaker': speaker.key.urlsafe(),
+                    'websafeSessionKeys': []})
+                wscks.append(wsck)
+            return WebsafeKeysForm(websafeKeys=wscks)
+        self.assertBudget('getFeaturedSpeakersBatch', seed)
+
+    # - - - wishlist - - - - - - - - - - - - - - - - - - - - -
+
+    def testGetSessionsInWishlist(self):
+        def seed(n):
+            self.profile(wishlist=self.sessions(n))
+            return message_types.VoidMessage()
+        self.assertBudget('getSessionsInWishlist', seed)
+
+    def testGetNotRegisteredWishlist(self):
+        def seed(n):
+            self.profile(wishlist=self.sessionsAcrossConferences(n))
+            return message_types.VoidMessage()
+        self.assertBudget('getNotRegisteredWishlist', seed)
+
+    def testGetAgenda(self):
+        def seed(n):
+            conf = self.makeConference()
+            self.profile(wishlist=self.sessions(
+                n, conf, date=datetime.date(2030, 6, 4)),
+                registrations=[conf])
+            return message_types.VoidMessage()
+        self.assertBudget('getAgenda', seed)
+
+    # - - - change feed - - - - - - - - - - - - - - - - - - - -
+
+    def testGetChanges(self):
+        def seed(n):
+            for i in xrange(n):
+                changefeed.publish(changefeed.SEATS, 'conference%d' % i, i)
+            return base.request(CHANGES_GET_REQUEST, since=0)
+        self.assertBudget('getChanges', seed)
+
@@ -0,0 +1,52 @@
+"""Stale-while-revalidate cache: stale values kept per instance."""
+
+import collections
+
+from google.appengine.api import memcache
+
+import swrcache
+from tests import base
+
+PREFIX = 'TEST'
+
+
+class StaleValuesTest(base.TestCase):
+
+    def setUp(self):
+        super(StaleValuesTest, self).setUp()
+        self.patch(swrcache, '_stale', collections.OrderedDict())
+        self.patch(swrcache, '_registry', {})
+        self.computed = []
+        swrcache.register(PREFIX, self._compute, 60)
+
+    def _compute(self, arg):
+        self.computed.append(arg)
+        return 'value %s' % arg
+
+    def testStaleValueServedOnMiss(self):
+        swrcache.put(PREFIX, 'a', 'old')
+        memcache.flush_all()
+        self.assertEqual('old', swrcache.get(PREFIX, 'a'))
+        self.assertEqual([], self.computed)
+        self.assertEqual(1, len(self.tasks(swrcache.REFRESH_TASK_URL)))
+
+    def testStaleValuesAreCapped(self):
+        self.patch(swrcache, 'MAX_STALE', 3)
+        for arg in 'abcd':
+            swrcache.put(PREFIX, arg, 'old')
+        # reading a value keeps it
+        self.assertEqual('old', swrcache.get(PREFIX, 'b'))
+        swrcache.put(PREFIX, 'e', 'old')
+        self.assertEqual([swrcache.key(PREFIX, arg) for arg in 'dbe'],
+                         list(swrcache._stale))
+
+        # a forgotten value is recomputed once memcache lost it too
+        memcache.flush_all()
+        self.assertEqual('value a', swrcache.get(PREFIX, 'a'))
+        self.assertEqual(['a'], self.computed)
+        self.assertEqual(3, len(swrcache._stale))
+
+    def testDeleteForgetsStaleValue(self):
+        swrcache.put(PREFIX, 'a', 'old')
+        swrcache.delete(PREFIX, 'a')
+        self.assertEqual({}, dict(swrcache._stale))
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+
+"""warmup.py
+
+Udacity conference server-side Python App Engine instance warmup; times
+module imports and primes caches before an instance takes live traffic.
+
+"""
+
+import importlib
+import logging
+import time
+
+# modules imported (and timed) when an instance starts, in import order.
+# conference builds the whole Endpoints service at import time so it is
+# by far the most expensive of these.
+WARMUP_MODULES = (
+    'endpoints',
+    'protorpc.remote',
+    'google.appengine.ext.ndb',
+    'google.appengine.api.memcache',
+    'google.appengine.api.taskqueue',
+    'models',
+    'utils',
+    'conference',
+)
+
+# number of conferences on the first page of the conference listing.
+HOT_CONFERENCE_LIMIT = 20
+
+# (module name, seconds) for every module imported by import_modules().
+IMPORT_TIMES = []
+
+
+def import_modules(names=WARMUP_MODULES):
+    """Import the given modules, recording how long each one took."""
+    for name in names:
+        start = time.time()
+        importlib.import_module(name)
+        IMPORT_TIMES.append((name, time.time() - start))
+
+
+def import_report():
+    """Return the import-time profile as a list of lines, slowest first."""
+    lines = ['%-40s %8.1f ms' % (name, secs * 1000)
+             for name, secs in sorted(IMPORT_TIMES, key=lambda t: -t[1])]
+    lines.append('%-40s %8.1f ms' % (
+        'total', sum(secs for _, secs in IMPORT_TIMES) * 1000))
+    return lines
+
+
+def warm():
+    """Prime memcache and open datastore, memcache and task queue RPC
+    channels. Returns a list of (step, seconds) tuples."""
+    from google.appengine.api import taskqueue
+    from conference import MEMCACHE_ANNOUNCEMENTS_KEY
+    from conference import MEMCACHE_FEATURED_SPEAKER_KEY
+    from models import Conference
+    import swrcache
+
+    timings = []
+
+    # announcement; only rebuilt if the cron job has not filled it yet.
+    start = time.time()
+    swrcache.get(MEMCACHE_ANNOUNCEMENTS_KEY)
+    timings.append(('announcement', time.time() - start))
+
+    # first page of the conference listing, as queried by the browse page.
+    start = time.time()
+    confs = Conference.query().order(Conference.name).fetch(
+        HOT_CONFERENCE_LIMIT)
+    timings.append(('conferences', time.time() - start))
+
+    # featured speakers of the listed conferences in a single batch.
+    start = time.time()
+    swrcache.get_multi(MEMCACHE_FEATURED_SPEAKER_KEY,
+                       [conf.key.urlsafe() for conf in confs])
+    timings.append(('featured speakers', time.time() - start))
+
+    # task queue channel, used by conference and session creation.
+    start = time.time()
+    taskqueue.Queue().fetch_statistics()
+    timings.append(('taskqueue', time.time() - start))
+
+    for step, secs in timings:
+        logging.info('warmup %s: %.1f ms', step, secs * 1000)
+    return timings